@@ -0,0 +1,277 @@
+MEDIOS_VALIDOS = [
+    "efectivo", "debito", "credito", "transferencia",
+    "pluxee", "edenred", "amipass", "pedidos ya","uber eats"
+]
+DENOMINACIONES = [10, 50, 100, 500, 1000, 2000, 5000, 10000, 20000]
+
+# Diferencia tolerada al comparar con un recálculo (sumas y restas de float)
+TOLERANCIA = 0.01
+
+
+def _num(fila, i, tipo=float):
+    return tipo(fila[i] or 0) if len(fila) > i else tipo(0)
+
+
+def clave_repartidor(nombre):
+    """Nombre de repartidor normalizado: sin mayúsculas ni espacios de más ("Juan " y "juan" son el mismo)."""
+    return " ".join(str(nombre or "").split()).lower()
+
+
+class AgregadosCaja:
+    """Totales del turno que usa el Resumen Caja, mantenidos fila a fila.
+
+    Cada alta suma y cada baja resta, así el resumen se arma sin recorrer
+    las planillas. Se guarda junto con el checkpoint del turno y se puede
+    comparar con un recálculo completo (diferencias).
+    """
+
+    HOJAS = [
+        "planilla transacciones",
+        "planilla egresos",
+        "planilla cortesias",
+        "planilla mermas",
+        "planilla desgloses",
+        "planilla repartos",
+    ]
+
+    def __init__(self):
+        self.pagos_total = {m: 0 for m in MEDIOS_VALIDOS}      # totales (con propina)
+        self.propinas_total = {m: 0 for m in MEDIOS_VALIDOS}
+        self.tarjetas_sin_propina = 0                          # débito + crédito + prepago (sin propina)
+        self.egresos = 0
+        self.cortesias = 0
+        self.mermas = 0
+        self.desg_caja = {d: 0 for d in DENOMINACIONES}
+        self.desg_dep = {d: 0 for d in DENOMINACIONES}
+        self.repartidores = {}  # clave_repartidor -> {"nombre", "total", "filas", "piso"}
+
+    # -------------- ACTUALIZACIÓN --------------
+    def sumar(self, hoja, fila):
+        """Incluye una fila agregada al final de la hoja."""
+        self._aplicar(hoja, fila, 1)
+        if hoja == "planilla repartos":
+            datos = self.repartidores.get(clave_repartidor(self._repartidor(fila)))
+            piso = _num(fila, 4)
+            # se mantiene el primer piso que se haya ingresado
+            if datos is not None and datos["piso"] == 0 and piso > 0:
+                datos["piso"] = piso
+
+    def restar(self, hoja, fila, filas_hoja=()):
+        """Descuenta una fila eliminada; filas_hoja son las filas que quedan (para el piso de repartos)."""
+        self._aplicar(hoja, fila, -1)
+        if hoja == "planilla repartos":
+            self._recalcular_piso(clave_repartidor(self._repartidor(fila)), filas_hoja)
+
+    def reemplazar(self, hoja, anterior, nueva, filas_hoja=()):
+        """Refleja la edición de una fila (filas_hoja ya con el cambio aplicado)."""
+        self._aplicar(hoja, anterior, -1)
+        self._aplicar(hoja, nueva, 1)
+        if hoja == "planilla repartos":
+            for clave in {clave_repartidor(self._repartidor(anterior)), clave_repartidor(self._repartidor(nueva))}:
+                self._recalcular_piso(clave, filas_hoja)
+
+    @staticmethod
+    def _repartidor(fila):
+        return str(fila[1] or "").strip() if len(fila) > 1 else ""
+
+    def _aplicar(self, hoja, fila, signo):
+        if not fila:
+            return
+        if hoja == "planilla transacciones":
+            if len(fila) < 7:
+                return
+            medio = str(fila[3]).lower().strip() if fila[3] else ""
+            if medio in self.pagos_total:
+                self.pagos_total[medio] += signo * _num(fila, 6)
+                self.propinas_total[medio] += signo * _num(fila, 5)
+            if medio in ("debito", "credito", "prepago"):
+                self.tarjetas_sin_propina += signo * _num(fila, 4)
+        elif hoja == "planilla egresos":
+            self.egresos += signo * _num(fila, 2)
+        elif hoja == "planilla cortesias":
+            self.cortesias += signo * _num(fila, 1)
+        elif hoja == "planilla mermas":
+            self.mermas += signo * _num(fila, 2)
+        elif hoja == "planilla desgloses":
+            denom = _num(fila, 1, int)
+            cant = _num(fila, 2, int)
+            tipo = fila[4] if len(fila) > 4 and fila[4] else "Caja"
+            if denom in DENOMINACIONES and cant > 0:
+                destino = self.desg_caja if str(tipo).lower() == "caja" else self.desg_dep
+                destino[denom] += signo * cant
+        elif hoja == "planilla repartos":
+            nombre = self._repartidor(fila)
+            if not nombre:
+                return
+            clave = clave_repartidor(nombre)
+            # se muestra con el nombre de su primer reparto
+            datos = self.repartidores.setdefault(clave, {"nombre": nombre, "total": 0.0, "filas": 0, "piso": 0.0})
+            datos["total"] += signo * _num(fila, 3)
+            datos["filas"] += signo
+            if datos["filas"] <= 0:
+                del self.repartidores[clave]
+
+    def _recalcular_piso(self, clave, filas_hoja):
+        datos = self.repartidores.get(clave)
+        if datos is None:
+            return
+        mismas = [f for f in filas_hoja if f and clave_repartidor(self._repartidor(f)) == clave]
+        datos["nombre"] = self._repartidor(mismas[0]) if mismas else datos["nombre"]
+        datos["piso"] = next((p for p in (_num(f, 4) for f in mismas) if p > 0), 0.0)
+
+    # -------------- CONSTRUCCIÓN --------------
+    @classmethod
+    def desde_filas(cls, filas_por_hoja):
+        """Recálculo completo a partir de {hoja: filas sin encabezado}."""
+        agregados = cls()
+        for hoja in cls.HOJAS:
+            for fila in filas_por_hoja.get(hoja) or []:
+                agregados.sumar(hoja, fila)
+        return agregados
+
+    def a_dict(self):
+        return {
+            "pagos_total": self.pagos_total,
+            "propinas_total": self.propinas_total,
+            "tarjetas_sin_propina": self.tarjetas_sin_propina,
+            "egresos": self.egresos,
+            "cortesias": self.cortesias,
+            "mermas": self.mermas,
+            "desg_caja": self.desg_caja,
+            "desg_dep": self.desg_dep,
+            "repartidores": self.repartidores,
+        }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        agregados = cls()
+        agregados.pagos_total.update(datos["pagos_total"])
+        agregados.propinas_total.update(datos["propinas_total"])
+        agregados.tarjetas_sin_propina = datos["tarjetas_sin_propina"]
+        agregados.egresos = datos["egresos"]
+        agregados.cortesias = datos["cortesias"]
+        agregados.mermas = datos["mermas"]
+        # JSON guarda las denominaciones como texto
+        agregados.desg_caja.update({int(d): c for d, c in datos["desg_caja"].items()})
+        agregados.desg_dep.update({int(d): c for d, c in datos["desg_dep"].items()})
+        for nombre, d in datos["repartidores"].items():
+            if "nombre" in d:
+                agregados.repartidores[nombre] = dict(d)
+                continue
+            # Totales guardados antes de normalizar los nombres: se juntan por clave
+            previo = agregados.repartidores.get(clave_repartidor(nombre))
+            if previo is None:
+                agregados.repartidores[clave_repartidor(nombre)] = dict(d, nombre=nombre)
+            else:
+                previo["total"] += d["total"]
+                previo["filas"] += d["filas"]
+                previo["piso"] = previo["piso"] or d["piso"]
+        return agregados
+
+    def copia(self):
+        return AgregadosCaja.desde_dict(self.a_dict())
+
+    def incluir(self, otro):
+        """Suma los totales de otro turno (resumen consolidado de varias cajas).
+
+        Un repartidor que trabajó en dos cajas suma sus repartos y el piso de cada una.
+        """
+        for m in MEDIOS_VALIDOS:
+            self.pagos_total[m] += otro.pagos_total[m]
+            self.propinas_total[m] += otro.propinas_total[m]
+        self.tarjetas_sin_propina += otro.tarjetas_sin_propina
+        self.egresos += otro.egresos
+        self.cortesias += otro.cortesias
+        self.mermas += otro.mermas
+        for d in DENOMINACIONES:
+            self.desg_caja[d] += otro.desg_caja[d]
+            self.desg_dep[d] += otro.desg_dep[d]
+        for clave, datos in otro.repartidores.items():
+            propio = self.repartidores.setdefault(clave, {"nombre": datos["nombre"], "total": 0.0, "filas": 0, "piso": 0.0})
+            propio["total"] += datos["total"]
+            propio["filas"] += datos["filas"]
+            propio["piso"] += datos["piso"]
+        return self
+
+    # -------------- CONSISTENCIA --------------
+    def diferencias(self, otro):
+        """Lista de (campo, este valor, valor de otro) que no coinciden."""
+        propios, ajenos = self._planos(), otro._planos()
+        salida = []
+        for campo in sorted(set(propios) | set(ajenos)):
+            a, b = propios.get(campo, 0), ajenos.get(campo, 0)
+            if abs(a - b) > TOLERANCIA:
+                salida.append((campo, a, b))
+        return salida
+
+    def _planos(self):
+        valores = {
+            "tarjetas_sin_propina": self.tarjetas_sin_propina,
+            "egresos": self.egresos,
+            "cortesias": self.cortesias,
+            "mermas": self.mermas,
+        }
+        for m in MEDIOS_VALIDOS:
+            valores[f"pagos_total.{m}"] = self.pagos_total[m]
+            valores[f"propinas_total.{m}"] = self.propinas_total[m]
+        for d in DENOMINACIONES:
+            valores[f"desg_caja.{d}"] = self.desg_caja[d]
+            valores[f"desg_dep.{d}"] = self.desg_dep[d]
+        for clave, datos in self.repartidores.items():
+            valores[f"repartidores.{clave}.total"] = datos["total"]
+            valores[f"repartidores.{clave}.piso"] = datos["piso"]
+        return valores
+
+
+def liquidacion_repartidor(datos):
+    """Lo que se le paga a un repartidor: sus repartos más el piso (datos de AgregadosCaja.repartidores)."""
+    return {"repartidor": datos["nombre"], "total": datos["total"], "piso": datos["piso"],
+            "total_final": datos["total"] + datos["piso"]}
+
+
+def calcular_resumen(agregados, caja_inicial):
+    """Cifras del Resumen Caja (las mismas del XLSX) a partir de los totales del turno."""
+    pagos_total = agregados.pagos_total
+    total_ventas = sum(pagos_total.values())
+    venta_efectivo = pagos_total.get("efectivo", 0)
+    perdidas = agregados.cortesias + agregados.mermas
+    propinas = {m: v for m, v in agregados.propinas_total.items() if v > 0}
+    return {
+        "ventas": dict(pagos_total),
+        "total_ventas": total_ventas,
+        "tarjetas": {
+            "debito": pagos_total.get("debito", 0),
+            "credito": pagos_total.get("credito", 0),
+            "prepago": pagos_total.get("prepago", 0),
+            "sin_propinas": agregados.tarjetas_sin_propina,
+            "con_propinas": pagos_total.get("debito", 0) + pagos_total.get("credito", 0) + pagos_total.get("prepago", 0),
+        },
+        "efectivo": {
+            "caja_inicial": caja_inicial,
+            "venta_efectivo": venta_efectivo,
+            "egresos": agregados.egresos,
+            "total": (caja_inicial + venta_efectivo) - agregados.egresos,
+        },
+        "propinas": propinas,
+        "total_propinas": sum(propinas.values()),
+        "repartos": [
+            liquidacion_repartidor(datos) for datos in agregados.repartidores.values()
+        ],
+        "egresos": agregados.egresos,
+        "cortesias": agregados.cortesias,
+        "mermas": agregados.mermas,
+        "total_caja_final": caja_inicial + total_ventas - agregados.egresos - perdidas,
+        "porcentaje_perdidas": (perdidas / total_ventas) * 100 if total_ventas > 0 else 0,
+    }
+
+
+def totales_boleta(pagos):
+    """(total con propina, detalle "Medio $monto + ...") de los pagos de una boleta."""
+    total = 0
+    detalle = []
+    for row in pagos:
+        medio = str(row[3] or "").capitalize() if len(row) > 3 else ""
+        monto = (float(row[4] or 0) if len(row) > 4 else 0) + (float(row[5] or 0) if len(row) > 5 else 0)
+        total += monto
+        detalle.append(f"{medio} ${monto:,.0f}")
+    return total, " + ".join(detalle)
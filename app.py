@@ -1,37 +1,45 @@
-from flask import Flask, render_template, request, send_file, redirect, url_for, flash, session
-import os, signal
+from flask import Flask, render_template, request, send_file, redirect, url_for, flash, session, jsonify, abort, g, has_request_context
+from werkzeug.local import LocalProxy
+import os, signal, time
 
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Font, PatternFill, Border, Side
 from datetime import datetime
-from io import BytesIO
-from openpyxl.styles import Alignment
+import tempfile
+import uuid
 
-app = Flask(__name__)
-app.secret_key = "gustitos-secret"
+from agregados import MEDIOS_VALIDOS, DENOMINACIONES, liquidacion_repartidor, totales_boleta
+from cajas import CAJA_PRINCIPAL, PARAMETROS_TURNO, RegistroCajas
+from indice_cierres import AGRUPACIONES
+from esquema import encabezado
+from metricas import METRICAS, contar, fase, instrumentar
+from ingesta import validar_venta, venta_desde_formulario, ventas_desde_csv, VentaInvalida
 
 # ---------------- CONFIG ----------------
-EXCEL_FILE = "plantilla_base.xlsx"
-HOJAS_NECESARIAS = [
-    "planilla transacciones",
-    "planilla repartos",
-    "planilla egresos",
-    "planilla mermas",
-    "planilla desgloses",
-    "parametros",
-    "planilla cortesias",
-]
-CIERRES_DIR = "cierres"
-os.makedirs(CIERRES_DIR, exist_ok=True)
-
-MEDIOS_VALIDOS = [
-    "efectivo", "debito", "credito", "transferencia",
-    "pluxee", "edenred", "amipass", "pedidos ya","uber eats"
-]
-DENOMINACIONES = [10, 50, 100, 500, 1000, 2000, 5000, 10000, 20000]
+# "xlsx" (libro en memoria + diario) o "sqlite"
+ALMACENAMIENTO = os.environ.get("GUSTITOS_ALMACENAMIENTO", "xlsx")
+# "rapida": Descargar Actual sin estilo por celda en las planillas (también con ?rapida=1)
+EXPORTACION = os.environ.get("GUSTITOS_EXPORTACION", "completa")
+# Cajas que atiende el servidor (ids separados por coma; la primera es la de
+# por defecto) y cuántas se mantienen cargadas en memoria a la vez
+CAJAS = [c.strip() for c in os.environ.get("GUSTITOS_CAJAS", CAJA_PRINCIPAL).split(",") if c.strip()]
+CAJAS_EN_MEMORIA = int(os.environ.get("GUSTITOS_CAJAS_EN_MEMORIA", 4))
+# Tope de la cache de XLSX de cierres ya armados (los más viejos en uso se borran)
+CACHE_CIERRES_MB = float(os.environ.get("GUSTITOS_CACHE_CIERRES_MB", 200))
+# Latencia de cada request (/metrics). Con GUSTITOS_PERFIL_MS=500 se guarda en
+# perfiles/ un cProfile de cada request que tarde 500 ms o más.
+PERFIL_MS = os.environ.get("GUSTITOS_PERFIL_MS")
+
+# -------------- RUTAS --------------
+# Las vistas se declaran con @ruta y create_app() las registra en cada app que
+# arma (el filtro money, url_con y exigir_turno_activo también se registran ahí).
+RUTAS = []
+
+def ruta(regla, **opciones):
+    def registrar(vista):
+        RUTAS.append((regla, vista, opciones))
+        return vista
+    return registrar
 
 # --------- Filtro de dinero para Jinja ---------
-@app.template_filter("money")
 def money(value):
     """Formatea como CLP: $12.345"""
     try:
@@ -42,156 +50,62 @@ def money(value):
     except Exception:
         return "$0"
 
-# -------------- ESTILOS --------------
-def _estilos_basicos():
-    thin_border = Border(left=Side(style="thin"), right=Side(style="thin"),
-                         top=Side(style="thin"), bottom=Side(style="thin"))
-    header_fill = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
-    return thin_border, header_fill
-
-def _estilizar_encabezado(cells, header_fill, thin_border):
-    for c in cells:
-        c.font = Font(bold=True)
-        c.fill = header_fill
-        c.border = thin_border
-
-def _autoajustar_columnas(ws):
-    for col in ws.columns:
-        col_letter = col[0].column_letter
-        max_len = 0
-        for cell in col:
-            if cell.value is not None:
-                max_len = max(max_len, len(str(cell.value)))
-        ws.column_dimensions[col_letter].width = max_len + 3
-
-def _estilizar_hoja_detalle(ws, header_fill, thin_border):
-    if ws.max_row >= 1:
-        _estilizar_encabezado(ws[1], header_fill, thin_border)
-    if ws.max_row >= 2:
-        for row in ws.iter_rows(min_row=2):
-            for cell in row:
-                cell.border = thin_border
-                if isinstance(cell.value, (int, float)):
-                    cell.number_format = '"$"#,##0'
-    _autoajustar_columnas(ws)
-
-    # ⬇️ Aquí colocas tu nueva función
-def resumen_boletas_en_transacciones(wb):
-    if "planilla transacciones" not in wb.sheetnames:
-        return
-    ws = wb["planilla transacciones"]
-
-    thin_border, header_fill = _estilos_basicos()
-
-    # Agrupar por Nº Interno
-    boletas = {}
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        if not row or not row[2]:
-            continue
-        nro = str(row[2]).strip()
-        medio = row[3].capitalize()
-        monto = float(row[4] or 0) + float(row[5] or 0)
-        if nro not in boletas:
-            boletas[nro] = {"total": 0, "detalle": []}
-        boletas[nro]["total"] += monto
-        boletas[nro]["detalle"].append(f"{medio} ${monto:,.0f}")
-
-    # Insertar bloque resumen al final
-    ws.append([])
-    ws.append(["Resumen por Boleta"])
-    titulo = ws[ws.max_row][0]
-    titulo.font = Font(bold=True, size=14)
-    titulo.fill = header_fill
-    titulo.border = thin_border
-
-    # Encabezados
-    ws.append(["Nº Interno", "Total Boleta", "Detalle"])
-    for c in ws[ws.max_row]:
-        c.font = Font(bold=True)
-        c.fill = header_fill
-        c.border = thin_border
-
-    # Filas de boletas
-    for nro, datos in boletas.items():
-        ws.append([
-            nro,
-            datos["total"],
-            " + ".join(datos["detalle"])
-        ])
-        for c in ws[ws.max_row]:
-            c.border = thin_border
-            if isinstance(c.value, (int, float)):
-                c.number_format = '"$"#,##0'
-
-    _autoajustar_columnas(ws)
-
-
-# -------------- INICIALIZAR XLSX --------------
-def inicializar_excel():
-    if not os.path.exists(EXCEL_FILE):
-        wb = Workbook()
-        wb.remove(wb.active)
-
-        ws = wb.create_sheet("planilla transacciones")
-        ws.append(["Fecha", "Código Autorización Tarjetas", "Nº Interno Software",
-                   "Medio de Pago", "Monto sin Propina", "Propina", "Total con Propina"])
-
-        ws = wb.create_sheet("planilla repartos")
-        ws.append(["Fecha", "Repartidor", "Dirección", "Monto", "Piso Empresa"])
-
-        ws = wb.create_sheet("planilla egresos")
-        ws.append(["Fecha", "Motivo", "Valor", "Nº Boleta/Factura"])
-
-        ws = wb.create_sheet("planilla mermas")
-        ws.append(["Fecha", "Motivo", "Valor"])
-
-        ws = wb.create_sheet("planilla desgloses")
-        ws.append(["Fecha", "Denominación", "Cantidad", "Total", "Tipo"])
-
-        ws = wb.create_sheet("parametros")
-        ws.append(["Parametro", "Valor"])
-
-        wb.save(EXCEL_FILE)
-    else:
-        wb = load_workbook(EXCEL_FILE)
-        for hoja in HOJAS_NECESARIAS:
-            if hoja not in wb.sheetnames:
-                ws = wb.create_sheet(hoja)
-                if hoja == "planilla transacciones":
-                    ws.append(["Fecha", "Código Autorización Tarjetas", "Nº Interno Software",
-                               "Medio de Pago", "Monto sin Propina", "Propina", "Total con Propina"])
-                elif hoja == "planilla repartos":
-                    ws.append(["Fecha", "Repartidor", "Dirección", "Monto", "Piso Empresa"])
-                elif hoja == "planilla egresos":
-                    ws.append(["Fecha", "Motivo", "Valor", "Nº Boleta/Factura"])
-                elif hoja == "planilla mermas":
-                    ws.append(["Fecha", "Motivo", "Valor"])
-                elif hoja == "planilla desgloses":
-                    ws.append(["Fecha", "Denominación", "Cantidad", "Total", "Tipo"])
-                elif hoja == "planilla cortesias":
-                    ws.append(["Fecha", "Monto", "Motivo"])
-                elif hoja == "parametros":
-                    ws.append(["Parametro", "Valor"])
-            
-        wb.save(EXCEL_FILE)
+# --------- URL de la página actual con otros filtros/página ---------
+def url_con(**cambios):
+    args = request.args.to_dict()
+    args.update(cambios)
+    return url_for(request.endpoint, **args)
+
+# -------------- CAJAS --------------
+# Cada caja tiene su libro del turno, su archivo e índice de cierres, sus
+# cierres en segundo plano y los índices de sus planillas (ver cajas.Caja).
+# Se cargan al pedirlas y a lo más CAJAS_EN_MEMORIA quedan en memoria (LRU).
+cajas = RegistroCajas(CAJAS, almacenamiento=ALMACENAMIENTO,
+                      cache_cierres_bytes=int(CACHE_CIERRES_MB * 1024 * 1024), maximo=CAJAS_EN_MEMORIA)
+
+def id_caja_actual():
+    """Caja del request: ?caja=, la elegida en la sesión o la primera configurada."""
+    if not has_request_context():
+        return CAJAS[0]
+    id_caja = request.args.get("caja")
+    if id_caja:
+        if id_caja not in CAJAS:
+            abort(404)
+        return id_caja
+    id_caja = session.get("caja")
+    return id_caja if id_caja in CAJAS else CAJAS[0]
+
+def caja_actual():
+    if not has_request_context():
+        return cajas.obtener(id_caja_actual())
+    if "caja" not in g:
+        g.caja = cajas.obtener(id_caja_actual())
+    return g.caja
+
+# Las rutas usan el libro, los cierres y sus índices de la caja del request
+# (fuera de un request, los de la primera caja)
+libro = LocalProxy(lambda: caja_actual().libro)
+archivo_cierres = LocalProxy(lambda: caja_actual().archivo_cierres)
+indice_cierres = LocalProxy(lambda: caja_actual().indice_cierres)
+trabajos_cierre = LocalProxy(lambda: caja_actual().trabajos_cierre)
+
+# -------------- ARRANQUE --------------
+# Importar el módulo y armar la app no lee ni escribe archivos ni levanta
+# hilos. Lo que no hace falta para mostrar la primera pantalla (validar el
+# esquema del XLSX, cargar el libro, retomar cierres, indexar el archivo de
+# cierres) corre en segundo plano la primera vez que cada proceso
+# usa una caja: con gunicorn --preload cada worker lo hace después del fork.
+# Un request que necesita el libro espera a que termine de cargarse.
+def arrancar():
+    caja_actual()
 
 # -------------- CAJA INICIAL --------------
 def obtener_caja_inicial():
-    if not os.path.exists(EXCEL_FILE):
-        return None
-    wb = load_workbook(EXCEL_FILE)
-    if "parametros" not in wb.sheetnames:
-        return None
-    ws = wb["parametros"]
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        if row[0] == "caja_inicial":
-            return row[1]
-    return None
+    return libro.parametro("caja_inicial")
 
 # --------- Iniciar Turno (Caja Inicial) ---------
-@app.route("/iniciar_turno", methods=["POST"])
+@ruta("/iniciar_turno", methods=["POST"])
 def iniciar_turno():
-    inicializar_excel()
     cajero = request.form.get("cajero")
     turno = request.form.get("turno")
     valor = float(request.form.get("caja_inicial", 0))
@@ -200,31 +114,23 @@ def iniciar_turno():
         flash("⚠️ Debes ingresar Cajero, Turno y Caja Inicial.")
         return redirect(url_for("index"))
 
-    wb = load_workbook(EXCEL_FILE)
-    ws = wb["parametros"]
-
-    # Guardar parámetros
-    def set_param(nombre, val):
-        for row in ws.iter_rows(min_row=2):
-            if row[0].value == nombre:
-                row[1].value = val
-                return
-        ws.append([nombre, val])
-
-    set_param("cajero", cajero)
-    set_param("turno", turno)
-    set_param("caja_inicial", valor)
-
-    wb.save(EXCEL_FILE)
+    # Guardar parámetros (id_turno identifica el turno para que el cierre no se repita)
+    id_turno = uuid.uuid4().hex
+    libro.fijar_parametros({
+        "cajero": cajero,
+        "turno": turno,
+        "caja_inicial": valor,
+        "id_turno": id_turno,
+    })
 
     # Guardar en sesión también
+    session["id_turno"] = id_turno
     session["cajero"] = cajero
     session["turno"] = turno
     session["caja_inicial"] = valor
 
     return redirect(url_for("index"))
 
-@app.before_request
 def exigir_turno_activo():
     rutas_protegidas = {
         "agregar_venta", "agregar_reparto", "agregar_egreso",
@@ -236,526 +142,313 @@ def exigir_turno_activo():
             flash("⚠️ Debes iniciar turno para realizar esta acción.", "danger")
             return redirect(url_for("index"))
 
-# -------------- RESUMEN CAJA --------------
-from openpyxl.styles import Alignment
-
-def construir_resumen_caja(wb):
-    thin_border, header_fill = _estilos_basicos()
-
-    if "Resumen Caja" not in wb.sheetnames:
-        ws_r = wb.create_sheet("Resumen Caja")
-    else:
-        ws_r = wb["Resumen Caja"]
-        ws_r.delete_rows(1, ws_r.max_row)
-
-    # Obtener cajero, turno y caja inicial
-    cajero, turno, caja_inicial = "No registrado", "No registrado", 0
-    if "parametros" in wb.sheetnames:
-        ws_p = wb["parametros"]
-        for row in ws_p.iter_rows(min_row=2, values_only=True):
-            if row[0] == "cajero":
-                cajero = row[1]
-            elif row[0] == "turno":
-                turno = row[1]
-            elif row[0] == "caja_inicial":
-                caja_inicial = row[1]
-
-    # Estilo encabezado principal
-    encabezados = [
-        f"Cajero: {cajero}",
-        f"Turno: {turno}",
-        ws_r.append([f"Caja Inicial: ${caja_inicial if caja_inicial else 0:,.0f}"])
-    ]
-
-    fila = 1
-    for texto in encabezados:
-        celda = ws_r[f"A{fila}"]
-        celda.value = texto
-        celda.font = Font(bold=True, size=14)
-        celda.fill = header_fill              # fondo gris
-        celda.alignment = Alignment(horizontal="left", vertical="center")
-        celda.border = thin_border
-        fila += 1
-
-    ws_r["A5"] = f"Resumen Caja - Exportado el {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-    ws_r["A5"].font = Font(bold=True, size=12)
-
-
-
-    # -------- Leer transacciones para totales --------
-    pagos_total = {m: 0 for m in MEDIOS_VALIDOS}        # totales (con propina)
-    tarjetas_sin_propina = 0                            # débito + crédito + prepago (sin propina)
-    propinas_total = {m: 0 for m in MEDIOS_VALIDOS}  # nuevo diccionario
-
-
-    if "planilla transacciones" in wb.sheetnames:
-        ws_t = wb["planilla transacciones"]
-        for row in ws_t.iter_rows(min_row=2, values_only=True):
-            if not row or len(row) < 7:
-                continue
-            medio = str(row[3]).lower().strip() if row[3] else ""
-            monto_sin = float(row[4] or 0)
-            propina = float(row[5] or 0)
-            total = float(row[6] or 0)
-
-            if medio in pagos_total:
-                pagos_total[medio] += total
-                propinas_total[medio] += propina
-
-            if medio in ("debito", "credito", "prepago"):
-                tarjetas_sin_propina += monto_sin
-
-    # -------- DESGLOSE DE VENTAS --------
-    ws_r.append([])
-    ws_r.append(["Desglose de Ventas"])
-    _estilizar_encabezado(ws_r[ws_r.max_row], header_fill, thin_border)
-    for medio in MEDIOS_VALIDOS:
-        ws_r.append([medio.capitalize(), pagos_total.get(medio, 0)])
-        ws_r[f"B{ws_r.max_row}"].number_format = '"$"#,##0'
-        for c in ws_r[ws_r.max_row]:
-            c.border = thin_border
-
-    # -------- RESUMEN TARJETAS --------
-    ws_r.append([])
-    ws_r.append(["Resumen Tarjetas"])
-    _estilizar_encabezado(ws_r[ws_r.max_row], header_fill, thin_border)
-    total_tarjetas_con_prop = pagos_total.get("debito",0) + pagos_total.get("credito",0) + pagos_total.get("prepago",0)
-    ws_r.append(["Débito", pagos_total.get("debito",0)])
-    ws_r.append(["Crédito", pagos_total.get("credito",0)])
-    ws_r.append(["Prepago", pagos_total.get("prepago",0)])
-    ws_r.append(["Total sin Propinas", tarjetas_sin_propina])
-    ws_r.append(["Total con Propinas", total_tarjetas_con_prop])
-    for row in ws_r.iter_rows(min_row=ws_r.max_row-4, max_row=ws_r.max_row, min_col=2, max_col=2):
-        for cell in row:
-            cell.number_format = '"$"#,##0'
-            cell.border = thin_border
-
-    # -------- RESUMEN EFECTIVO --------
-    ws_r.append([])
-    ws_r.append(["Resumen Efectivo"])
-    _estilizar_encabezado(ws_r[ws_r.max_row], header_fill, thin_border)
-    caja_inicial = obtener_caja_inicial()
-    if caja_inicial is None:
-            caja_inicial = 0
-    venta_efectivo = pagos_total.get("efectivo", 0)
-    egresos_ef = 0
-    if "planilla egresos" in wb.sheetnames:
-        ws_e = wb["planilla egresos"]
-        for r in ws_e.iter_rows(min_row=2, values_only=True):
-            if r and len(r) >= 3:
-                egresos_ef += float(r[2] or 0)
-    total_efectivo = (caja_inicial + venta_efectivo) - egresos_ef
-    ws_r.append(["Caja Inicial", caja_inicial])
-    ws_r.append(["Venta Efectivo", venta_efectivo])
-    ws_r.append(["Total Egresos Efectivo", egresos_ef])
-    ws_r.append(["Total Resumen Efectivo", total_efectivo])
-    for row in ws_r.iter_rows(min_row=ws_r.max_row-3, max_row=ws_r.max_row, min_col=2, max_col=2):
-        for cell in row:
-            cell.number_format = '"$"#,##0'
-            cell.border = thin_border
-
-    # -------- PROPINAS --------
-# -------- PROPINAS DETALLADAS --------
-    ws_r.append([])
-    ws_r.append(["Propinas por Medio de Pago"])
-    _estilizar_encabezado(ws_r[ws_r.max_row], header_fill, thin_border)
-
-    total_propinas = 0
-    for medio, valor in propinas_total.items():
-     if valor > 0:
-        ws_r.append([f"Propinas {medio.capitalize()}", valor])
-        ws_r[f"B{ws_r.max_row}"].number_format = '"$"#,##0'
-        for c in ws_r[ws_r.max_row]:
-            c.border = thin_border
-        total_propinas += valor
-
-    ws_r.append(["Total Propinas", total_propinas])
-    ws_r[f"B{ws_r.max_row}"].number_format = '"$"#,##0'
-    for c in ws_r[ws_r.max_row]:
-        c.font = Font(bold=True)
-        c.border = thin_border
-
-
-    # -------- DESGLOSES (Caja / Depositar) --------
-    desg_caja = {d: 0 for d in DENOMINACIONES}
-    desg_dep = {d: 0 for d in DENOMINACIONES}
-    if "planilla desgloses" in wb.sheetnames:
-        ws_d = wb["planilla desgloses"]
-        for r in ws_d.iter_rows(min_row=2, values_only=True):
-            if not r:
-                continue
-            denom = int(r[1] or 0)
-            cant = int(r[2] or 0)
-            tipo = r[4] or "Caja"
-            if denom in DENOMINACIONES and cant > 0:
-                if str(tipo).lower() == "caja":
-                    desg_caja[denom] += cant
-                else:
-                    desg_dep[denom] += cant
-
-    # - Caja
-    ws_r.append([])
-    ws_r.append(["Desglose Caja"])
-    _estilizar_encabezado(ws_r[ws_r.max_row], header_fill, thin_border)
-    ws_r.append(["Denominación", "Cantidad", "Total"])
-    _estilizar_encabezado(ws_r[ws_r.max_row], header_fill, thin_border)
-    total_caja = 0
-    for d in DENOMINACIONES:
-        if desg_caja[d] > 0:
-            total = d * desg_caja[d]
-            total_caja += total
-            ws_r.append([f"${d:,}", desg_caja[d], total])
-            ws_r[f"C{ws_r.max_row}"].number_format = '"$"#,##0'
-            for c in ws_r[ws_r.max_row]:
-                c.border = thin_border
-    ws_r.append(["Total Caja", "", total_caja])
-    ws_r[f"C{ws_r.max_row}"].number_format = '"$"#,##0'
-
-    # - Depositar
-    ws_r.append([])
-    ws_r.append(["Desglose Efectivo a Depositar"])
-    _estilizar_encabezado(ws_r[ws_r.max_row], header_fill, thin_border)
-    ws_r.append(["Denominación", "Cantidad", "Total"])
-    _estilizar_encabezado(ws_r[ws_r.max_row], header_fill, thin_border)
-    total_dep = 0
-    for d in DENOMINACIONES:
-        if desg_dep[d] > 0:
-            total = d * desg_dep[d]
-            total_dep += total
-            ws_r.append([f"${d:,}", desg_dep[d], total])
-            ws_r[f"C{ws_r.max_row}"].number_format = '"$"#,##0'
-            for c in ws_r[ws_r.max_row]:
-                c.border = thin_border
-    ws_r.append(["Total a Depositar", "", total_dep])
-    ws_r[f"C{ws_r.max_row}"].number_format = '"$"#,##0'
-
- # -------- REPARTOS (por repartidor + piso) --------
-    ws_r.append([])
-    ws_r.append(["Repartos"])
-    _estilizar_encabezado(ws_r[ws_r.max_row], header_fill, thin_border)
-
-    repartidores = {}  # nombre -> {total_montos, piso}
-    if "planilla repartos" in wb.sheetnames:
-        ws_rep = wb["planilla repartos"]
-        for r in ws_rep.iter_rows(min_row=2, values_only=True):
-            if not r:
-                continue
-            nombre = (r[1] or "").strip()
-            monto = float(r[3] or 0)
-            piso = float(r[4] or 0)
-            if not nombre:
-                continue
-            if nombre not in repartidores:
-                repartidores[nombre] = {"total": 0.0, "piso": piso}
-            repartidores[nombre]["total"] += monto
-            # mantener el primer piso que se haya ingresado
-            if repartidores[nombre]["piso"] == 0 and piso > 0:
-                repartidores[nombre]["piso"] = piso
-
-    if repartidores:
-        ws_r.append(["Repartidor", "Total Repartos", "Piso Empresa", "Total Final"])
-        _estilizar_encabezado(ws_r[ws_r.max_row], header_fill, thin_border)
-        for nombre, datos in repartidores.items():
-            total_final = datos["total"] + datos["piso"]
-            ws_r.append([nombre, datos["total"], datos["piso"], total_final])
-            for c in ws_r[ws_r.max_row]:
-                if isinstance(c.value, (int, float)):
-                    c.number_format = '"$"#,##0'
-                c.border = thin_border
-
-    # -------- TOTAL CAJA (ORDENADO Y DETALLADO) --------
-    ws_r.append([])
-    ws_r.append(["RESUMEN DE CAJA"])
-    ws_r["A" + str(ws_r.max_row)].font = Font(bold=True, size=16)
-    ws_r["A" + str(ws_r.max_row)].fill = header_fill
-    ws_r["A" + str(ws_r.max_row)].alignment = Alignment(horizontal="center")
-
-    # Calcular totales
-    caja_inicial = obtener_caja_inicial() or 0
-    total_ventas = sum(pagos_total.values())
-
-    total_egresos = 0
-    total_cortesias = 0
-    total_mermas = 0
-
-    if "planilla egresos" in wb.sheetnames:
-        ws_e = wb["planilla egresos"]
-        total_egresos = sum(float(r[2] or 0) for r in ws_e.iter_rows(min_row=2, values_only=True))
-
-    if "planilla cortesias" in wb.sheetnames:
-        ws_c = wb["planilla cortesias"]
-        total_cortesias = sum(float(r[1] or 0) for r in ws_c.iter_rows(min_row=2, values_only=True))
-
-    if "planilla mermas" in wb.sheetnames:
-        ws_m = wb["planilla mermas"]
-        total_mermas = sum(float(r[2] or 0) for r in ws_m.iter_rows(min_row=2, values_only=True))
-
-    total_caja = caja_inicial + total_ventas - total_egresos - total_cortesias - total_mermas
-
-    # Calcular porcentaje de pérdidas (cortesías + mermas)
-    porcentaje_perdidas = 0
-    if total_ventas > 0:
-        porcentaje_perdidas = ((total_cortesias + total_mermas) / total_ventas) * 100
-
-    # Mostrar totales organizados en dos columnas
-    resumen_datos = [
-        ("Caja Inicial", caja_inicial),
-        ("Ventas Totales", total_ventas),
-        ("Egresos", -total_egresos),
-        ("Cortesías", -total_cortesias),
-        ("Mermas", -total_mermas),
-        ("TOTAL CAJA FINAL", total_caja),
-        ("", ""),  # Espacio visual
-        ("% Pérdidas sobre Ventas", f"{porcentaje_perdidas:.2f}%"),
-    ]
-
-    ws_r.append([])
-    for label, valor in resumen_datos:
-        ws_r.append([label, valor])
-
-    # Aplicar formato visual
-    for fila in range(ws_r.max_row - len(resumen_datos) + 1, ws_r.max_row + 1):
-        c1 = ws_r[f"A{fila}"]
-        c2 = ws_r[f"B{fila}"]
-
-        c1.font = Font(bold=True if "TOTAL" in str(c1.value) else False, size=13)
-        c2.font = Font(bold=True if "TOTAL" in str(c1.value) else False, size=13)
-
-        if isinstance(c2.value, (int, float)):
-            c2.number_format = '"$"#,##0'
-        c1.alignment = Alignment(horizontal="left")
-        c2.alignment = Alignment(horizontal="right")
-        c1.border = Border(bottom=Side(style="thin"))
-        c2.border = Border(bottom=Side(style="thin"))
-
-    _autoajustar_columnas(ws_r)
-
-
-def estilizar_hojas_detalle(wb):
-    thin_border, header_fill = _estilos_basicos()
-    for nombre in wb.sheetnames:
-        if nombre == "Resumen Caja":
-            continue
-        _estilizar_hoja_detalle(wb[nombre], header_fill, thin_border)
-
 # ---------------- RUTAS UI ----------------
-@app.route("/")
+@ruta("/")
 def index():
     return render_template("index.html")
 
-# Registrar venta (total con propina se calcula solo)
-@app.route("/agregar_venta", methods=["GET","POST"])
-def agregar_venta():
-    if request.method == "POST":
-        inicializar_excel()
-        fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        numero_interno = request.form.get("numero_interno", "")
-        codigo_autorizacion = request.form.get("codigo_autorizacion", "")
-
-        # Recibir múltiples pagos y propinas
-        medios = request.form.getlist("medio_pago[]")
-        montos = [float(m or 0) for m in request.form.getlist("monto_pago[]")]
-        propinas = [float(p or 0) for p in request.form.getlist("propina_pago[]")]
-
-        wb = load_workbook(EXCEL_FILE)
-        ws = wb["planilla transacciones"]
-
-        total_boleta = 0
-        for medio, monto, propina in zip(medios, montos, propinas):
-            total = monto + propina
-            total_boleta += total
-            ws.append([
-                fecha,
-                codigo_autorizacion if medio.lower() in ("debito", "credito") else "",
-                numero_interno,
-                medio.lower(),
-                monto,
-                propina,
-                total
-            ])
-
-        wb.save(EXCEL_FILE)
-
-        return render_template(
-            "result.html",
-            mensaje=f"✅ Venta registrada Nº {numero_interno}: ${total_boleta:,.0f}",
-            volver="agregar_venta"
-        )
+# -------------- ALTAS --------------
+# Cada alta lee sus datos (del formulario o del JSON de /api/agregar/<tipo>),
+# escribe una sola vez en el libro (un lote: un registro del diario) y
+# devuelve el mensaje para el cajero. Si no se registra, AltaRechazada.
+class AltaRechazada(Exception):
+    """Alta que no se registra: el mensaje es para el cajero y estado, el código HTTP de la API."""
 
-    return render_template("agregar_venta.html", medios=MEDIOS_VALIDOS)
+    def __init__(self, mensaje, estado=400):
+        super().__init__(mensaje)
+        self.estado = estado
 
+def numero_alta(datos, campo):
+    valor = datos.get(campo)
+    try:
+        return float(valor or 0)
+    except (TypeError, ValueError):
+        raise AltaRechazada(f"⚠️ {campo.capitalize()} no es un número válido: {valor}")
 
+# Registrar venta (total con propina se calcula solo)
+def alta_venta(datos):
+    fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    venta = venta_desde_formulario(datos) if hasattr(datos, "getlist") else datos
+    try:
+        numero_interno, filas = validar_venta(venta, fecha)
+    except VentaInvalida as e:
+        raise AltaRechazada(f"⚠️ Venta no válida: {e}")
+    total_boleta = sum(f[6] for f in filas)
+
+    # --- boleta duplicada (índice por Nº Interno; en lote para que dos altas no pasen juntas) ---
+    with libro.lote():
+        previos = libro.boleta(numero_interno)
+        if previos and not venta.get("pago_adicional"):
+            total_previo, detalle = totales_boleta(previos)
+            raise AltaRechazada(f"⚠️ La boleta Nº {numero_interno} ya está registrada (${total_previo:,.0f}: {detalle}). "
+                                "Si es otro pago de la misma boleta, marca \"Pago adicional\".", 409)
+        libro.agregar("planilla transacciones", *filas)
+
+    mensaje = f"✅ Venta registrada Nº {numero_interno}: ${total_boleta:,.0f}"
+    if previos:
+        mensaje += f" (pago adicional, la boleta suma ${totales_boleta(previos + filas)[0]:,.0f})"
+    return mensaje
 
 # Registrar reparto (con Piso Empresa, admite 0/5000/10000)
-@app.route("/agregar_reparto", methods=["GET","POST"])
-def agregar_reparto():
-    if request.method == "POST":
-        inicializar_excel()
-        fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        repartidor = request.form.get("repartidor", "").strip()
-        direccion = request.form.get("direccion", "")
-        monto = float(request.form.get("monto", 0))
-        piso = float(request.form.get("piso") or 0)
-
-
-        wb = load_workbook(EXCEL_FILE)
-        ws = wb["planilla repartos"]
-
-        # --- validar piso existente ---
-        piso_existente = 0
-        for r in ws.iter_rows(min_row=2, values_only=True):
-            if r and r[1] and r[1].strip().lower() == repartidor.lower():
-                piso_existente = piso_existente or float(r[4] or 0)
-
-        if piso_existente > 0:
+def alta_reparto(datos):
+    fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    repartidor = str(datos.get("repartidor") or "").strip()
+    direccion = str(datos.get("direccion") or "")
+    monto = numero_alta(datos, "monto")
+    piso = numero_alta(datos, "piso")
+
+    # --- validar piso existente (índice por repartidor; en lote para que dos altas no lo dupliquen) ---
+    with libro.lote():
+        previo = libro.repartidor(repartidor)
+        if previo is not None and previo["piso"] > 0:
             piso = 0   # Si ya tenía piso, este se ignora
-
-        ws.append([fecha, repartidor, direccion, monto, piso])
-        wb.save(EXCEL_FILE)
-        return render_template("result.html", mensaje="🚚 Reparto registrado con éxito", volver="agregar_reparto")
-    return render_template("agregar_reparto.html")
-
+        libro.agregar("planilla repartos", [fecha, repartidor, direccion, monto, piso])
+    return "🚚 Reparto registrado con éxito"
 
 # Registrar egreso
-@app.route("/agregar_egreso", methods=["GET","POST"])
-def agregar_egreso():
-    if request.method == "POST":
-        inicializar_excel()
-        fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        wb = load_workbook(EXCEL_FILE)
-        ws = wb["planilla egresos"]
-        ws.append([
-            fecha,
-            request.form.get("motivo", ""),
-            float(request.form.get("valor", 0)),
-            request.form.get("boleta", "")
-        ])
-        wb.save(EXCEL_FILE)
-        return render_template("result.html", mensaje="💸 Egreso registrado con éxito", volver="agregar_egreso")
-    return render_template("agregar_egreso.html")
+def alta_egreso(datos):
+    fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    libro.agregar("planilla egresos", [
+        fecha,
+        str(datos.get("motivo") or ""),
+        numero_alta(datos, "valor"),
+        str(datos.get("boleta") or ""),
+    ])
+    return "💸 Egreso registrado con éxito"
 
 # Registrar merma
-@app.route("/agregar_merma", methods=["GET","POST"])
-def agregar_merma():
-    if request.method == "POST":
-        inicializar_excel()
-        fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        wb = load_workbook(EXCEL_FILE)
-        ws = wb["planilla mermas"]
-        ws.append([
-            fecha,
-            request.form.get("motivo", ""),
-            float(request.form.get("valor", 0))
-        ])
-        wb.save(EXCEL_FILE)
-        return render_template("result.html", mensaje="⚠️ Merma registrada con éxito", volver="agregar_merma")
-    return render_template("agregar_merma.html")
+def alta_merma(datos):
+    fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    libro.agregar("planilla mermas", [fecha, str(datos.get("motivo") or ""), numero_alta(datos, "valor")])
+    return "⚠️ Merma registrada con éxito"
 
 # Registrar desglose (total calculado automáticamente)
-@app.route("/agregar_desglose", methods=["GET", "POST"])
-def agregar_desglose():
-    if request.method == "POST":
-        try:
-            inicializar_excel()
-            fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def alta_desglose(datos):
+    fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-            # --- Limpieza segura de datos del formulario ---
-            den_str = request.form.get("denominacion", "0").replace("$", "").replace(".", "").replace(",", "").strip()
-            cant_str = request.form.get("cantidad", "0").replace(",", "").strip()
+    # --- Limpieza segura de datos del formulario ($10.000 -> 10000) ---
+    def entero(campo):
+        valor = datos.get(campo, 0)
+        if isinstance(valor, (int, float)):
+            return int(valor)
+        return int(str(valor).replace("$", "").replace(".", "").replace(",", "").strip())
 
-            # Validar que sean numéricos
-            try:
-                den = int(den_str)
-                cant = int(cant_str)
-            except ValueError:
-                flash("⚠️ La denominación y cantidad deben ser números válidos.", "warning")
-                return render_template("agregar_desglose.html", denominaciones=DENOMINACIONES)
-
-            total = den * cant
-            tipo = request.form.get("tipo", "Caja")
-
-            wb = load_workbook(EXCEL_FILE)
-
-            # Crear hoja si no existe
-            if "planilla desgloses" not in wb.sheetnames:
-                ws = wb.create_sheet("planilla desgloses")
-                ws.append(["Fecha", "Denominación", "Cantidad", "Total", "Tipo"])
-            else:
-                ws = wb["planilla desgloses"]
+    try:
+        den = entero("denominacion")
+        cant = entero("cantidad")
+    except ValueError:
+        raise AltaRechazada("⚠️ La denominación y cantidad deben ser números válidos.")
+    tipo = datos.get("tipo") or "Caja"
+
+    # Crear hoja si no existe (en el mismo lote que la fila)
+    with libro.lote():
+        libro.asegurar_hoja("planilla desgloses", encabezado("planilla desgloses"))
+        libro.agregar("planilla desgloses", [fecha, den, cant, den * cant, tipo])
+    return "💵 Desglose registrado con éxito"
+
+def alta_cortesia(datos):
+    monto = datos.get("monto")
+    motivo = datos.get("motivo")
+    if not monto or not motivo:
+        raise AltaRechazada("⚠️ Debes ingresar monto y motivo.")
+    try:
+        monto = int(float(monto))
+    except (TypeError, ValueError):
+        raise AltaRechazada(f"⚠️ Monto no es un número válido: {monto}")
+
+    fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with libro.lote():
+        # Asegurar encabezado correcto (si no coincide se borra todo)
+        libro.asegurar_hoja("planilla cortesias", encabezado("planilla cortesias"), reemplazar=True)
+        libro.agregar("planilla cortesias", [fecha, monto, motivo])
+    return f"🎁 Cortesía registrada con éxito: ${monto} - {motivo}"
+
+ALTAS = {
+    "venta": alta_venta,
+    "reparto": alta_reparto,
+    "egreso": alta_egreso,
+    "merma": alta_merma,
+    "desglose": alta_desglose,
+    "cortesia": alta_cortesia,
+}
+
+def alta_formulario(tipo, plantilla, **contexto):
+    """GET muestra el formulario; POST registra el alta y muestra el resultado."""
+    if request.method == "POST":
+        try:
+            mensaje = ALTAS[tipo](request.form)
+        except AltaRechazada as e:
+            flash(str(e), "danger")
+            return redirect(url_for(request.endpoint))
+        return render_template("result.html", mensaje=mensaje, volver=request.endpoint)
+    return render_template(plantilla, tipo_alta=tipo, **contexto)
+
+@ruta("/agregar_venta", methods=["GET","POST"])
+def agregar_venta():
+    return alta_formulario("venta", "agregar_venta.html", medios=MEDIOS_VALIDOS)
 
-            ws.append([fecha, den, cant, total, tipo])
-            wb.save(EXCEL_FILE)
+@ruta("/agregar_reparto", methods=["GET","POST"])
+def agregar_reparto():
+    return alta_formulario("reparto", "agregar_reparto.html")
 
-            return render_template(
-                "result.html",
-                mensaje="💵 Desglose registrado con éxito",
-                volver="agregar_desglose"
-            )
+@ruta("/agregar_egreso", methods=["GET","POST"])
+def agregar_egreso():
+    return alta_formulario("egreso", "agregar_egreso.html")
 
-        except Exception as e:
-            print(f"❌ Error en agregar_desglose: {e}")
-            flash("Ocurrió un error inesperado al agregar el desglose.", "danger")
-            return render_template("agregar_desglose.html", denominaciones=DENOMINACIONES)
+@ruta("/agregar_merma", methods=["GET","POST"])
+def agregar_merma():
+    return alta_formulario("merma", "agregar_merma.html")
 
-    return render_template("agregar_desglose.html", denominaciones=DENOMINACIONES)
+@ruta("/agregar_desglose", methods=["GET", "POST"])
+def agregar_desglose():
+    return alta_formulario("desglose", "agregar_desglose.html", denominaciones=DENOMINACIONES)
 
-@app.route("/agregar_cortesia", methods=["GET", "POST"])
+@ruta("/agregar_cortesia", methods=["GET", "POST"])
 def agregar_cortesia():
     # Bloquear si no hay cajero logueado
     if not session.get("cajero"):
         flash("⚠️ Debes iniciar un turno para registrar cortesías.", "warning")
         return redirect(url_for("index"))
+    return alta_formulario("cortesia", "agregar_cortesia.html")
+
+# Altas sin recargar la página (formularios con fetch, static/envio_rapido.js)
+@ruta("/api/agregar/<tipo>", methods=["POST"])
+def api_agregar(tipo):
+    """Registra un alta y devuelve {"mensaje", "resumen"} (o {"error"}).
+
+    Acepta JSON (los mismos campos del formulario; la venta como en
+    /api/ventas/lote) o el formulario tal cual. "resumen" trae los totales
+    del turno para ir mostrándolos en el formulario. Con "id_envio" el alta
+    se registra una sola vez: el id queda en la misma escritura que las filas
+    y un reintento con el mismo id devuelve el resultado original.
+    """
+    alta = ALTAS.get(tipo)
+    if alta is None:
+        return jsonify({"error": f"Alta desconocida: {tipo}"}), 404
+    datos = request.get_json(silent=True) if request.is_json else request.form
+    if not isinstance(datos, dict):
+        return jsonify({"error": "se espera un objeto JSON o un formulario"}), 400
+    id_envio = datos.get("id_envio") or None
+    if id_envio is not None and (not isinstance(id_envio, str) or len(id_envio) > 64):
+        return jsonify({"error": "id_envio inválido"}), 400
+    with libro.lote():
+        registrado = libro.envio(id_envio) if id_envio else None
+        if registrado is None:
+            if not libro.parametro("cajero"):
+                return jsonify({"error": "⚠️ Debes iniciar turno para realizar esta acción."}), 409
+            try:
+                registrado = {"mensaje": alta(datos)}
+            except AltaRechazada as e:
+                return jsonify({"error": str(e)}), e.estado
+            if id_envio:
+                libro.registrar_envio(id_envio, registrado)
+        else:
+            contar("gustitos_envios_repetidos_total", tipo=tipo)
+    resumen = resumen_turno()
+    return jsonify({
+        "mensaje": registrado["mensaje"],
+        "resumen": {clave: resumen[clave] for clave in ("total_ventas", "total_propinas", "total_caja_final")},
+    })
+
+
+
+# Carga masiva de ventas (POS, apps de delivery): JSON o CSV, todo en un lote
+@ruta("/api/ventas/lote", methods=["POST"])
+def api_ventas_lote():
+    """Registra muchas ventas en una sola escritura y devuelve los errores por venta.
+
+    JSON: {"ventas": [{"numero_interno", "codigo_autorizacion", "pagos": [{"medio",
+    "monto", "propina"}], "pago_adicional"}]} (o directamente la lista).
+    CSV (text/csv o archivo "archivo"): columnas de ingesta.COLUMNAS_CSV, una por pago.
+    Con ?todo_o_nada=1 no se registra nada si alguna venta tiene error.
+    """
+    inicio = time.perf_counter()
+    fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        if request.files.get("archivo") or request.mimetype == "text/csv":
+            archivo = request.files.get("archivo")
+            texto = archivo.read().decode("utf-8-sig") if archivo else request.get_data(as_text=True)
+            ventas = ventas_desde_csv(texto)
+        else:
+            datos = request.get_json(silent=True)
+            ventas = datos.get("ventas") if isinstance(datos, dict) else datos
+            if not isinstance(ventas, list):
+                raise VentaInvalida("se espera una lista de ventas en JSON o un CSV")
+    except (VentaInvalida, UnicodeDecodeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    errores = []
+    filas = []
+    registradas = 0
+    with libro.lote():
+        if not libro.parametro("cajero"):
+            return jsonify({"error": "No hay turno iniciado"}), 409
+        en_lote = set()
+        for i, venta in enumerate(ventas, start=1):
+            posicion = venta.get("linea", i) if isinstance(venta, dict) else i
+            try:
+                nro, filas_boleta = validar_venta(venta, fecha)
+                if not venta.get("pago_adicional") and (nro in en_lote or libro.boleta(nro)):
+                    raise VentaInvalida(f"boleta Nº {nro} ya registrada")
+            except VentaInvalida as e:
+                nro = venta.get("numero_interno") if isinstance(venta, dict) else None
+                errores.append({"venta": posicion, "numero_interno": nro, "error": str(e)})
+                continue
+            en_lote.add(nro)
+            filas.extend(filas_boleta)
+            registradas += 1
+        todo_o_nada = request.args.get("todo_o_nada") == "1"
+        if filas and not (errores and todo_o_nada):
+            libro.agregar("planilla transacciones", *filas)
+        else:
+            registradas, filas = 0, []
+
+    segundos = time.perf_counter() - inicio
+    contar("gustitos_ventas_lote_total", registradas, resultado="registrada")
+    contar("gustitos_ventas_lote_total", len(errores), resultado="error")
+    return jsonify({
+        "registradas": registradas,
+        "filas": len(filas),
+        "errores": errores,
+        "segundos": round(segundos, 4),
+    }), 200 if registradas or not errores else 422
+
+
+
+# Vistas de planillas: paginadas, con filtros y orden, sobre índices en memoria
+# de cada caja (cajas.indices_planillas) que se ponen al día en cada consulta
+# (solo leen las filas nuevas).
+POR_PAGINA = 50
+
+def consultar_planilla(hoja):
+    """Página pedida en la query string (?medio=&desde=&hasta=&orden=&dir=&pagina=)."""
+    indice = caja_actual().indices[hoja]
+    indice.actualizar(libro)
+    args = request.args
+    return indice.consultar(
+        filtros={nombre: args.get(nombre, "") for nombre in indice.filtros},
+        desde=args.get("desde") or None,
+        hasta=args.get("hasta") or None,
+        orden=args.get("orden") or None,
+        descendente=args.get("dir") == "desc",
+        pagina=args.get("pagina", 1, type=int),
+        por_pagina=min(max(args.get("por_pagina", POR_PAGINA, type=int), 1), 500),
+    )
 
-    if request.method == "POST":
-        monto = request.form.get("monto")
-        motivo = request.form.get("motivo")
-
-        if not monto or not motivo:
-            flash("⚠️ Debes ingresar monto y motivo.", "danger")
-            return redirect(url_for("agregar_cortesia"))
-
-        try:
-            wb = load_workbook(EXCEL_FILE)
-            ws = wb["planilla cortesias"]
-
-            # Asegurar encabezado correcto
-            if ws.max_row == 0:
-                ws.append(["Fecha", "Monto", "Motivo"])
-            else:
-                encabezado = [cell.value for cell in ws[1]]
-                if encabezado != ["Fecha", "Monto", "Motivo"]:
-                    ws.delete_rows(1, ws.max_row)  # borrar todo
-                    ws.append(["Fecha", "Monto", "Motivo"])
-
-            # Agregar la nueva fila
-            fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            ws.append([fecha, int(monto), motivo])
-
-            wb.save(EXCEL_FILE)
-
-            # Mostrar pantalla de éxito (similar a desglose)
-            return render_template(
-                "result.html",
-                mensaje=f"🎁 Cortesía registrada con éxito: ${monto} - {motivo}",
-                volver="agregar_cortesia"
-            )
-
-        except Exception as e:
-            flash(f"❌ Error al guardar cortesía: {e}", "danger")
-            return redirect(url_for("agregar_cortesia"))
-
-    return render_template("agregar_cortesia.html")
+def volver_a(endpoint):
+    """Redirige a la página de la planilla desde la que se envió el formulario (con sus filtros)."""
+    destino = request.form.get("volver", "")
+    if destino.startswith(url_for(endpoint)):
+        return redirect(destino)
+    return redirect(url_for(endpoint))
 
-# Vistas simples de planillas
-@app.route("/planilla_caja")
+@ruta("/planilla_caja")
 def planilla_caja():
-    inicializar_excel()
-    wb = load_workbook(EXCEL_FILE, data_only=True)
-    ws = wb["planilla transacciones"]
-    ventas = [r for r in ws.iter_rows(min_row=2, values_only=True)]
-    return render_template("planilla_caja.html", ventas=ventas)
+    pagina = consultar_planilla("planilla transacciones")
+    return render_template("planilla_caja.html", pagina=pagina, ventas=pagina["filas"],
+                           medios=MEDIOS_VALIDOS)
 # ------------------- ELIMINAR VENTA CON MOTIVO -------------------
-@app.route("/eliminar_venta/<int:indice>", methods=["POST"])
+@ruta("/eliminar_venta/<int:indice>", methods=["POST"])
 def eliminar_venta(indice):
     """Elimina una venta solo si la clave es correcta, guarda el motivo y registra la venta borrada."""
     clave = request.form.get("clave_eliminar", "").strip()
@@ -764,78 +457,60 @@ def eliminar_venta(indice):
 
     if clave != CLAVE_PERMITIDA:
         flash("❌ Clave incorrecta. No se eliminó la venta.", "error")
-        return redirect(url_for("planilla_caja"))
+        return volver_a("planilla_caja")
 
     try:
-        wb = load_workbook(EXCEL_FILE)
-        ws = wb["planilla transacciones"]
-
-        # Extraer los valores de la fila antes de borrarla
-        if indice >= 2 and indice <= ws.max_row:
-            fila = [cell.value for cell in ws[indice]]
-            ws.delete_rows(indice)
-            wb.save(EXCEL_FILE)
-
-            # Registrar venta borrada
-            nombre_tabla_borradas = "Ventas Borradas"
-            if nombre_tabla_borradas not in wb.sheetnames:
-                ws_borradas = wb.create_sheet(nombre_tabla_borradas)
-                ws_borradas.append(["Fecha Eliminación", "Código Autorización", "N° Interno", "Medio Pago", "Monto", "Propina", "Total", "Motivo"])
-            else:
-                ws_borradas = wb[nombre_tabla_borradas]
-
-            fecha_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            ws_borradas.append([
-                fecha_actual,
-                fila[1] if len(fila) > 1 else "-",
-                fila[2] if len(fila) > 2 else "-",
-                fila[3] if len(fila) > 3 else "-",
-                fila[4] if len(fila) > 4 else 0,
-                fila[5] if len(fila) > 5 else 0,
-                fila[6] if len(fila) > 6 else 0,
-                motivo or "(sin motivo)"
-            ])
-
-            wb.save(EXCEL_FILE)
+        # Borrado y registro en "Ventas Borradas" van en un mismo registro del diario
+        with libro.lote():
+            # Extraer los valores de la fila al borrarla
+            fila = libro.eliminar("planilla transacciones", indice)
+            if fila is not None:
+                # Registrar venta borrada
+                libro.asegurar_hoja("Ventas Borradas", encabezado("Ventas Borradas"))
+
+                fecha_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                libro.agregar("Ventas Borradas", [
+                    fecha_actual,
+                    fila[1] if len(fila) > 1 else "-",
+                    fila[2] if len(fila) > 2 else "-",
+                    fila[3] if len(fila) > 3 else "-",
+                    fila[4] if len(fila) > 4 else 0,
+                    fila[5] if len(fila) > 5 else 0,
+                    fila[6] if len(fila) > 6 else 0,
+                    motivo or "(sin motivo)"
+                ])
+
+        if fila is not None:
             flash("🗑️ Venta eliminada y registrada en 'Ventas Borradas'.", "success")
 
         else:
-            flash("⚠️ No se pudo eliminar la venta (índice fuera de rango).", "error")
+            flash("⚠️ No se pudo eliminar la venta (ya fue eliminada).", "error")
 
     except Exception as e:
         flash(f"Error al eliminar venta: {str(e)}", "error")
 
-    return redirect(url_for("planilla_caja"))
+    return volver_a("planilla_caja")
 
 
 
-@app.route("/planilla_repartos")
+@ruta("/planilla_repartos")
 def planilla_repartos():
-    inicializar_excel()
-    wb = load_workbook(EXCEL_FILE, data_only=True)
-    ws = wb["planilla repartos"]
-    repartos = [r for r in ws.iter_rows(min_row=2, values_only=True)]
-    return render_template("planilla_repartos.html", repartos=repartos)
+    pagina = consultar_planilla("planilla repartos")
+    return render_template("planilla_repartos.html", pagina=pagina, repartos=pagina["filas"])
 
 # ------------------- PLANILLA EGRESOS -------------------
-@app.route("/planilla_egresos")
+@ruta("/planilla_egresos")
 def planilla_egresos():
-    inicializar_excel()
-    wb = load_workbook(EXCEL_FILE, data_only=True)
-    ws = wb["planilla egresos"]
-    egresos = [r for r in ws.iter_rows(min_row=2, values_only=True)]
-    return render_template("planilla_egresos.html", egresos=egresos)
+    pagina = consultar_planilla("planilla egresos")
+    return render_template("planilla_egresos.html", pagina=pagina, egresos=pagina["filas"])
 
 # ------------------- EDITAR EGRESO -------------------
-@app.route("/editar_egreso/<int:indice>", methods=["GET", "POST"])
+@ruta("/editar_egreso/<int:indice>", methods=["GET", "POST"])
 def editar_egreso(indice):
-    inicializar_excel()
-    wb = load_workbook(EXCEL_FILE)
-    ws = wb["planilla egresos"]
-
-    # Validar índice (fila en Excel, incluye encabezado en la fila 1)
-    if indice < 2 or indice > ws.max_row:
-        flash("⚠️ No se encontró el egreso a editar (índice fuera de rango).", "error")
+    # indice es el id de la fila (no cambia aunque se borren otros egresos)
+    fila = libro.fila("planilla egresos", indice)
+    if fila is None:
+        flash("⚠️ No se encontró el egreso a editar (puede que ya se haya eliminado).", "error")
         return redirect(url_for("planilla_egresos"))
 
     if request.method == "POST":
@@ -851,12 +526,10 @@ def editar_egreso(indice):
                 return redirect(url_for("editar_egreso", indice=indice))
 
             # Actualizar celdas (columna 1 = Fecha, 2 = Motivo, 3 = Valor, 4 = Nº Boleta/Factura)
-            ws.cell(row=indice, column=2).value = motivo
-            ws.cell(row=indice, column=3).value = valor
-            ws.cell(row=indice, column=4).value = boleta
-
-            wb.save(EXCEL_FILE)
-            flash("✅ Egreso actualizado correctamente.", "success")
+            if libro.actualizar("planilla egresos", indice, {2: motivo, 3: valor, 4: boleta}):
+                flash("✅ Egreso actualizado correctamente.", "success")
+            else:
+                flash("⚠️ No se actualizó: el egreso se eliminó mientras lo editabas.", "error")
             return redirect(url_for("planilla_egresos"))
 
         except Exception as e:
@@ -864,7 +537,7 @@ def editar_egreso(indice):
             return redirect(url_for("planilla_egresos"))
 
     # GET: cargar datos actuales
-    fila = [c.value for c in ws[indice]]
+    fila = fila + [None] * (4 - len(fila))
     egreso = {
         "fecha": fila[0],
         "motivo": fila[1],
@@ -876,161 +549,213 @@ def editar_egreso(indice):
 
 
 # ------------------- ELIMINAR EGRESO -------------------
-@app.route("/eliminar_egreso/<int:indice>", methods=["POST"])
+@ruta("/eliminar_egreso/<int:indice>", methods=["POST"])
 def eliminar_egreso(indice):
     try:
-        wb = load_workbook(EXCEL_FILE)
-        ws = wb["planilla egresos"]
-
-        if indice >= 2 and indice <= ws.max_row:
-            ws.delete_rows(indice)
-            wb.save(EXCEL_FILE)
+        if libro.eliminar("planilla egresos", indice) is not None:
             flash("🗑️ Egreso eliminado correctamente.", "success")
         else:
-            flash("⚠️ No se pudo eliminar el egreso (índice fuera de rango).", "error")
+            flash("⚠️ No se pudo eliminar el egreso (ya fue eliminado).", "error")
 
     except Exception as e:
         flash(f"❌ Error al eliminar egreso: {e}", "error")
 
-    return redirect(url_for("planilla_egresos"))
+    return volver_a("planilla_egresos")
 
 
 # ------------------- ELIMINAR REPARTO -------------------
-@app.route("/eliminar_reparto/<int:indice>", methods=["POST"])
+@ruta("/eliminar_reparto/<int:indice>", methods=["POST"])
 def eliminar_reparto(indice):
-    """Elimina un reparto de la planilla repartos según su índice."""
+    """Elimina un reparto de la planilla repartos según su id."""
     try:
-        wb = load_workbook(EXCEL_FILE)
-        ws = wb["planilla repartos"]
-
-        if indice >= 2 and indice <= ws.max_row:
-            ws.delete_rows(indice)
-            wb.save(EXCEL_FILE)
+        if libro.eliminar("planilla repartos", indice) is not None:
             flash("🗑️ Reparto eliminado correctamente.", "success")
         else:
-            flash("⚠️ No se pudo eliminar el reparto (índice fuera de rango).", "error")
+            flash("⚠️ No se pudo eliminar el reparto (ya fue eliminado).", "error")
 
     except Exception as e:
         flash(f"Error al eliminar reparto: {str(e)}", "error")
 
-    return redirect(url_for("planilla_repartos"))
+    return volver_a("planilla_repartos")
 
 
 # --------- Descargar Excel actual (con Resumen Caja y estilos) ---------
-@app.route("/descargar_actual")
+@ruta("/descargar_actual")
 def descargar_actual():
-    inicializar_excel()
-    wb = load_workbook(EXCEL_FILE)
-    construir_resumen_caja(wb)
-    estilizar_hojas_detalle(wb)
-    bio = BytesIO()
-    wb.save(bio)
-    bio.seek(0)
+    # El libro se escribe en modo write_only a un temporal en disco y se envía
+    # por partes; el temporal se borra al cerrarse la respuesta. openpyxl se
+    # importa con la primera exportación, no al arrancar.
+    from exportar import libro_turno
+
+    rapido = EXPORTACION == "rapida" or request.args.get("rapida") == "1"
+    archivo = tempfile.TemporaryFile()
+    with fase("exportacion", destino="descarga"):
+        libro_turno(libro, rapido=rapido).save(archivo)
+    contar("gustitos_bytes_escritos_total", archivo.tell(), destino="descarga")
+    archivo.seek(0)
     return send_file(
-        bio, as_attachment=True,
+        archivo, as_attachment=True,
         download_name=f"planilla_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.xlsx",
         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
 
+# --------- Tablero del turno (JSON + página que lo consulta) ---------
+# El resumen de cada caja se reutiliza hasta su próxima escritura (Caja.resumen)
+def resumen_turno():
+    return caja_actual().resumen()
+
+@ruta("/api/resumen")
+def api_resumen():
+    return jsonify(resumen_turno())
+
+@ruta("/api/boleta/<path:nro>")
+def api_boleta(nro):
+    """Pagos registrados para un Nº Interno (para revisar una boleta antes de borrar o cobrar)."""
+    pagos = libro.boleta(nro)
+    if not pagos:
+        return jsonify({"error": f"Boleta Nº {nro} no registrada"}), 404
+    total, detalle = totales_boleta(pagos)
+    return jsonify({
+        "numero_interno": nro.strip(),
+        "total": total,
+        "detalle": detalle,
+        "pagos": [{"fecha": f[0], "codigo_autorizacion": f[1], "medio": f[3], "monto": f[4],
+                   "propina": f[5], "total": f[6]} for f in pagos],
+    })
+
+@ruta("/api/repartidor/<path:nombre>")
+def api_repartidor(nombre):
+    """Liquidación de un repartidor a mitad de turno: total, piso y sus repartos."""
+    datos = libro.repartidor(nombre)
+    if datos is None:
+        return jsonify({"error": f"Sin repartos para {nombre}"}), 404
+    indice = caja_actual().indices["planilla repartos"]
+    indice.actualizar(libro)
+    pagina = indice.consultar(filtros={"repartidor": nombre}, por_pagina=max(1, datos["filas"]))
+    return jsonify(dict(
+        liquidacion_repartidor(datos),
+        cantidad=datos["filas"],
+        repartos=[{"indice": i, "fecha": f[0], "direccion": f[2], "monto": f[3], "piso": f[4]}
+                  for i, f in pagina["filas"]],
+    ))
+
+@ruta("/metrics")
+def metrics():
+    return METRICAS.texto(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@ruta("/tablero")
+def tablero():
+    """Tablero del turno de la caja actual (con ?consolidado=1, el de todas las cajas)."""
+    return render_template("tablero.html", medios=MEDIOS_VALIDOS,
+                           consolidado=request.args.get("consolidado") == "1")
+
+# --------- Varias cajas ---------
+@ruta("/caja/<id_caja>")
+def elegir_caja(id_caja):
+    """Deja la caja elegida en la sesión, con el turno que tenga abierto."""
+    if id_caja not in CAJAS:
+        abort(404)
+    session["caja"] = id_caja
+    g.caja = cajas.obtener(id_caja)
+    parametros = {p: libro.parametro(p) for p in PARAMETROS_TURNO + ("id_turno",)}
+    for clave, valor in parametros.items():
+        if valor:
+            session[clave] = valor
+        else:
+            session.pop(clave, None)
+    return redirect(url_for("index"))
+
+@ruta("/api/resumen/consolidado")
+def api_resumen_consolidado():
+    """Resumen Caja de todas las cajas (las que no están en memoria, desde su último checkpoint)."""
+    return jsonify(cajas.resumen_consolidado())
+
 # --------- Cierre de Caja (guarda, limpia y resetea Caja Inicial) ---------
 # --------- Cierre de Caja ---------
 # --------- Cierre de Caja (guarda, limpia y resetea Caja Inicial) ---------
-@app.route("/cierre_caja")
+@ruta("/cierre_caja")
 def cierre_caja():
     # 🔒 Verificar que haya turno activo
     if not session.get("cajero") or not session.get("turno") or not session.get("caja_inicial"):
         flash("⚠️ No puedes cerrar caja sin haber iniciado un turno.", "danger")
         return redirect(url_for("index"))
 
-    inicializar_excel()
-    wb = load_workbook(EXCEL_FILE)
-
-    # Construir resumen y aplicar estilos
-    construir_resumen_caja(wb)
-    estilizar_hojas_detalle(wb)
-
-    # Generar bloque resumen por boleta
-    resumen_boletas_en_transacciones(wb)
-
-    # Guardar archivo de cierre
-    nombre = f"Cierre caja {datetime.now().strftime('%d-%m-%Y_%H-%M-%S')} Camilo Henriquez.xlsx"
-
-    ruta = os.path.join(CIERRES_DIR, nombre)
-    wb.save(ruta)
-
-    # Limpiar planillas para el nuevo turno
-    for hoja in [
-        "planilla transacciones", "planilla repartos", "planilla egresos",
-        "planilla mermas", "planilla desgloses", "planilla cortesias"
-    ]:
-        if hoja in wb.sheetnames:
-            ws = wb[hoja]
-            if ws.max_row > 1:
-                ws.delete_rows(2, ws.max_row)
-
-            # Asegurar encabezado correcto en cortesías
-            if hoja == "planilla cortesias":
-                if ws.max_row == 0:
-                    ws.append(["Fecha", "Monto", "Motivo"])
-                else:
-                    encabezado = [cell.value for cell in ws[1]]
-                    if encabezado != ["Fecha", "Monto", "Motivo"]:
-                        ws.delete_rows(1, ws.max_row)
-                        ws.append(["Fecha", "Monto", "Motivo"])
-
-    # Limpiar hoja Resumen Caja
-    if "Resumen Caja" in wb.sheetnames:
-        ws = wb["Resumen Caja"]
-        ws.delete_rows(1, ws.max_row)
-    
-     # Limpiar hoja Ventas Borradas (pero manteniendo el encabezado)
-    if "Ventas Borradas" in wb.sheetnames:
-        ws_vb = wb["Ventas Borradas"]
-        if ws_vb.max_row > 1:
-            ws_vb.delete_rows(2, ws_vb.max_row)
-
-    # Resetear parámetros
-    if "parametros" in wb.sheetnames:
-        ws = wb["parametros"]
-        for row in ws.iter_rows(min_row=2):
-            if row[0].value == "caja_inicial":
-                row[1].value = 0
-            elif row[0].value in ("cajero", "turno"):
-                row[1].value = None
-
-    wb.save(EXCEL_FILE)
+    # Con el bloqueo de escritura tomado el turno se rota: el libro actual pasa
+    # a los cierres pendientes y se reemplaza por uno vacío (sin recorrer sus
+    # filas). El archivo de cierre se arma después, en segundo plano, y el
+    # turno nuevo queda disponible de inmediato.
+    with libro.lote():
+        id_turno = libro.parametro("id_turno")
+        if (session.get("id_turno") and session["id_turno"] != id_turno) or not libro.parametro("cajero"):
+            # Doble clic (o pestaña vieja): este turno ya se cerró
+            id_trabajo = session.pop("id_turno", None) or session.get("cierre_id", "")
+            for clave in ("cajero", "turno", "caja_inicial"):
+                session.pop(clave, None)
+            return redirect(url_for("caja_cerrada", id=id_trabajo))
+        id_trabajo = id_turno or uuid.uuid4().hex
+
+        nombre = caja_actual().nombre_cierre(libro.parametro("cajero"))
+        trabajos_cierre.registrar(id_trabajo, libro, nombre)
+    trabajos_cierre.iniciar(id_trabajo)
 
     # Guardar archivo de cierre en sesión
-    session["archivo_cierre"] = ruta
+    session["archivo_cierre"] = nombre
+    session["cierre_id"] = id_trabajo
 
     # 🔹 Limpiar cajero/turno de la sesión (pero no borrar archivo_cierre)
+    session.pop("id_turno", None)
     session.pop("cajero", None)
     session.pop("turno", None)
     session.pop("caja_inicial", None)
 
-    # Redirigir a pantalla de Caja Cerrada
-    return redirect(url_for("caja_cerrada"))
+    # Redirigir a pantalla de Caja Cerrada (sigue el avance del cierre)
+    return redirect(url_for("caja_cerrada", id=id_trabajo))
 
 
 # --------- Pantalla de Caja Cerrada ---------
-@app.route("/caja_cerrada")
+@ruta("/caja_cerrada")
 def caja_cerrada():
-    return render_template("caja_cerrada.html")
+    return render_template("caja_cerrada.html", id_trabajo=request.args.get("id", ""))
+
+@ruta("/api/cierre/<id_trabajo>")
+def api_cierre(id_trabajo):
+    estado = trabajos_cierre.estado(id_trabajo)
+    if estado is None:
+        return jsonify({"error": "Cierre no encontrado"}), 404
+    return jsonify(estado)
 
 
 
 
 # --------- Historial de cierres ---------
-@app.route("/historial_cierres")
+# Solo lee el manifest (cifras incluidas): no abre ni revisa cada archivo
+@ruta("/historial_cierres")
 def historial_cierres():
-    archivos = [f for f in os.listdir(CIERRES_DIR) if f.lower().endswith(".xlsx")]
-    archivos.sort(reverse=True)
-    return render_template("historial_cierres.html", archivos=archivos)
-
-@app.route("/descargar_cierre/<nombre>")
+    pagina = archivo_cierres.listar(
+        pagina=request.args.get("pagina", 1, type=int),
+        por_pagina=min(max(request.args.get("por_pagina", POR_PAGINA, type=int), 1), 500),
+    )
+    return render_template("historial_cierres.html", pagina=pagina, cierres=pagina["entradas"])
+
+# Totales entre turnos desde el índice: ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD&agrupar=dia|semana|mes
+@ruta("/api/cierres/resumen")
+def api_cierres_resumen():
+    agrupar = request.args.get("agrupar", "dia")
+    if agrupar not in AGRUPACIONES:
+        return jsonify({"error": f"agrupar debe ser uno de: {', '.join(AGRUPACIONES)}"}), 400
+    desde = request.args.get("desde") or None
+    hasta = request.args.get("hasta") or None
+    return jsonify({
+        "desde": desde,
+        "hasta": hasta,
+        "agrupar": agrupar,
+        "periodos": indice_cierres.resumen(desde, hasta, agrupar),
+    })
+
+@ruta("/descargar_cierre/<nombre>")
 def descargar_cierre(nombre):
-    ruta = os.path.join(CIERRES_DIR, nombre)
-    if os.path.exists(ruta):
+    ruta = archivo_cierres.xlsx(os.path.basename(nombre))
+    if ruta:
         return send_file(
             ruta, as_attachment=True, download_name=nombre,
             mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
@@ -1039,32 +764,36 @@ def descargar_cierre(nombre):
 
 
 # --------- Descargar archivo de cierre ---------
-@app.route("/descargar_cierre_final")
+@ruta("/descargar_cierre_final")
 def descargar_cierre_final():
     try:
-        archivo = session.get("archivo_cierre")
-        print("📦 Archivo en sesión:", archivo)
-
-        # Si no existe en sesión, buscar el más reciente en la carpeta
-        if not archivo or not os.path.exists(archivo):
-            print("⚠️ Buscando el cierre más reciente en carpeta...")
-            archivos = sorted(
-                [os.path.join(CIERRES_DIR, f) for f in os.listdir(CIERRES_DIR) if f.endswith(".xlsx")],
-                key=os.path.getmtime,
-                reverse=True
-            )
-            if archivos:
-                archivo = archivos[0]
-                print("✅ Usando más reciente:", archivo)
+        # La sesión guarda el nombre del cierre (las de versiones anteriores, la ruta)
+        nombre = os.path.basename(session.get("archivo_cierre") or "")
+        print("📦 Archivo en sesión:", nombre)
+        en_archivo = bool(nombre) and archivo_cierres.entrada(nombre) is not None
+
+        # El cierre de esta sesión todavía se está armando en segundo plano
+        estado = trabajos_cierre.estado(session.get("cierre_id"))
+        if estado and estado["estado"] != "listo" and not en_archivo:
+            flash("⏳ El archivo de cierre todavía se está generando.", "warning")
+            return redirect(url_for("caja_cerrada", id=session["cierre_id"]))
+
+        # Si no está en el archivo, usar el más reciente del manifest
+        if not en_archivo:
+            print("⚠️ Buscando el cierre más reciente en el archivo...")
+            recientes = archivo_cierres.entradas()
+            if recientes:
+                nombre = recientes[0]["nombre"]
+                print("✅ Usando más reciente:", nombre)
             else:
                 flash("⚠️ No se encontró ningún archivo de cierre para descargar.", "danger")
                 return redirect(url_for("index"))
 
-        if not os.path.exists(archivo):
+        archivo = archivo_cierres.xlsx(nombre)
+        if not archivo:
             flash("❌ El archivo de cierre no existe o fue movido.", "danger")
             return redirect(url_for("index"))
 
-        nombre = os.path.basename(archivo)
         print("🔽 Descargando:", nombre)
 
         return send_file(
@@ -1080,17 +809,45 @@ def descargar_cierre_final():
         return redirect(url_for("index"))
 
 
+# ---------------- APP ----------------
+def create_app():
+    """App de Flask con todas las rutas (gunicorn "app:create_app()", también con --preload)."""
+    app = Flask(__name__)
+    app.secret_key = "gustitos-secret"
+    instrumentar(app, umbral_perfil_ms=float(PERFIL_MS) if PERFIL_MS else None)
+    app.add_template_filter(money, "money")
+    app.add_template_global(url_con)
+    app.add_template_global(CAJAS, "cajas")
+    app.add_template_global(id_caja_actual)
+    app.before_request(arrancar)
+    app.before_request(exigir_turno_activo)
+    for regla, vista, opciones in RUTAS:
+        app.add_url_rule(regla, view_func=vista, **opciones)
+    return app
+
+# App del módulo (python app.py, gunicorn app:app)
+app = create_app()
+
+
 # ---------------- MAIN ----------------
 if __name__ == "__main__":
-    import threading, webbrowser
+    import threading, webbrowser, socket
     from flask import request
     import atexit
 
     def open_browser():
+        # Apenas el servidor acepta conexiones (sin esperar un tiempo fijo)
+        for _ in range(200):
+            try:
+                socket.create_connection(("127.0.0.1", 5000), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
         webbrowser.open("http://127.0.0.1:5000")
 
     # Función para cerrar Flask cuando se cierre la app
     def shutdown_server():
+        cajas.liberar_todas()
         os.kill(os.getpid(), signal.SIGTERM)
 
     @app.route('/shutdown', methods=['POST'])
@@ -1101,7 +858,8 @@ if __name__ == "__main__":
     # Registrar cierre al salir
     atexit.register(shutdown_server)
 
-    inicializar_excel()
-    threading.Timer(1, open_browser).start()
+    # El libro se carga en segundo plano mientras el servidor ya responde
+    arrancar()
+    threading.Thread(target=open_browser, daemon=True).start()
     app.run(host="127.0.0.1", port=5000, debug=False)
 
@@ -0,0 +1,301 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+from agregados import AgregadosCaja, calcular_resumen
+from archivos import BloqueoArchivo, guardar_atomico
+from esquema import ESQUEMA
+from indice_cierres import EXTENSION_SNAPSHOT as EXTENSION, HOJAS_DETALLE, SNAPSHOTS, leer_cierre
+from indices import IndiceBoletas
+from repositorio import FotoTurno
+
+FORMATO = 1
+
+# Cifras del Resumen Caja que se guardan en el manifest (las que muestra el historial)
+CIFRAS_MANIFEST = ["caja_inicial", "total_ventas", "egresos", "cortesias", "mermas",
+                   "total_propinas", "total_caja_final"]
+
+
+# -------------- FOTOS COMPRIMIDAS --------------
+def _columnas(filas):
+    """Filas -> columnas (las filas cortas se completan con None)."""
+    ancho = max((len(f) for f in filas), default=0)
+    return [[f[i] if i < len(f) else None for f in filas] for i in range(ancho)]
+
+
+def cifras_turno(foto):
+    """Cajero, turno y cifras del Resumen Caja de una foto del turno."""
+    caja_inicial = foto.parametro("caja_inicial") or 0
+    resumen = calcular_resumen(foto.agregados(), caja_inicial)
+    cifras = {c: resumen[c] for c in CIFRAS_MANIFEST if c in resumen}
+    cifras["caja_inicial"] = caja_inicial
+    cifras["cajero"] = foto.parametro("cajero")
+    cifras["turno"] = foto.parametro("turno")
+    return cifras, resumen
+
+
+def snapshot_desde_foto(foto, nombre, fecha_cierre):
+    """Dict de la foto comprimida: filas por columna, totales y el Resumen Caja ya calculado."""
+    cifras, resumen = cifras_turno(foto)
+    return {
+        "formato": FORMATO,
+        "nombre": nombre,
+        "fecha_cierre": fecha_cierre,
+        "cifras": cifras,
+        "resumen": resumen,
+        "agregados": foto.agregados().a_dict(),
+        "hojas": {
+            hoja: {"encabezado": filas[0] if filas else None, "columnas": _columnas(filas[1:])}
+            for hoja, filas in foto.hojas().items()
+        },
+    }
+
+
+def foto_desde_snapshot(datos):
+    """FotoTurno equivalente a la del cierre (para volver a armar el XLSX)."""
+    hojas = {}
+    for hoja, contenido in datos["hojas"].items():
+        filas = [] if contenido["encabezado"] is None else [list(contenido["encabezado"])]
+        filas.extend(list(f) for f in zip(*contenido["columnas"]))
+        hojas[hoja] = filas
+    boletas = IndiceBoletas.desde_filas(hojas.get(IndiceBoletas.HOJA, [])[1:]).copia()
+    return FotoTurno(hojas, AgregadosCaja.desde_dict(datos["agregados"]), boletas)
+
+
+def leer_snapshot(ruta):
+    with gzip.open(ruta, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def cierre_desde_snapshot(ruta):
+    """La foto comprimida con la forma de leer_cierre (para IndiceCierres)."""
+    datos = leer_snapshot(ruta)
+    hojas = {}
+    for hoja, contenido in datos["hojas"].items():
+        if hoja in HOJAS_DETALLE:
+            ancho = len(ESQUEMA[hoja])
+            hojas[hoja] = [(list(f) + [None] * ancho)[:ancho] for f in zip(*contenido["columnas"])]
+    return {"nombre": datos["nombre"], "fecha_cierre": datos["fecha_cierre"],
+            "resumen": datos["cifras"], "hojas": hojas}
+
+
+def _escribir_snapshot(datos, ruta):
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=EXTENSION, dir=carpeta)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6, mtime=0) as gz:
+                gz.write(json.dumps(datos, ensure_ascii=False, default=str).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+    except Exception:
+        os.remove(tmp)
+        raise
+    os.replace(tmp, ruta)
+
+
+# -------------- ARCHIVO --------------
+class ArchivoCierres:
+    """Archivo de cierres compacto: fotos comprimidas + manifest + cache LRU de XLSX.
+
+    Cada cierre queda como <carpeta>/.snapshots/<nombre>.json.gz (filas por
+    columna y cifras del Resumen Caja) y una línea en <carpeta>/manifest.jsonl.
+    El historial solo lee el manifest (una vez por cada cambio); el XLSX
+    estilizado se arma al descargarlo y queda en <carpeta>/.cache, que se
+    recorta por antigüedad de uso cuando pasa de cache_bytes. Los XLSX de
+    versiones anteriores pasan por compactar() a <carpeta>/.originales, que
+    no se recorta: se siguen entregando tal cual.
+    """
+
+    def __init__(self, carpeta, cache_bytes=200 * 1024 * 1024):
+        self.carpeta = carpeta
+        self.snapshots = os.path.join(carpeta, SNAPSHOTS)
+        self.cache = os.path.join(carpeta, ".cache")
+        self.originales = os.path.join(carpeta, ".originales")
+        self.manifest = os.path.join(carpeta, "manifest.jsonl")
+        self.cache_bytes = cache_bytes
+        os.makedirs(self.snapshots, exist_ok=True)
+        os.makedirs(self.cache, exist_ok=True)
+        self._bloqueo = BloqueoArchivo(os.path.join(carpeta, ".manifest.lock"))
+        self._bloqueo_cache = BloqueoArchivo(os.path.join(self.cache, ".lock"))
+        self._lock = threading.Lock()
+        self._firma = None
+        self._entradas = []
+        self._por_nombre = {}
+        self._por_trabajo = {}
+
+    def ruta_snapshot(self, nombre):
+        return os.path.join(self.snapshots, os.path.splitext(nombre)[0] + EXTENSION)
+
+    # -------------- ESCRITURA --------------
+    def guardar(self, foto, nombre, fecha=None, id_trabajo=None):
+        """Guarda la foto comprimida del cierre y la agrega al manifest.
+
+        fecha (AAAA-MM-DD HH:MM:SS) es la del cierre; si no se indica, ahora.
+        id_trabajo es el del cierre en segundo plano que lo armó (TrabajosCierre).
+        """
+        fecha = fecha or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        datos = snapshot_desde_foto(foto, nombre, fecha)
+        ruta = self.ruta_snapshot(nombre)
+        _escribir_snapshot(datos, ruta)
+        entrada = {"nombre": nombre, "fecha_cierre": fecha, "bytes": os.path.getsize(ruta)}
+        entrada.update(datos["cifras"])
+        if id_trabajo:
+            entrada["id_trabajo"] = id_trabajo
+        with self._bloqueo:
+            with open(self.manifest, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entrada, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return entrada
+
+    # -------------- CONSULTA --------------
+    def entradas(self):
+        """Entradas del manifest, la más reciente primero (se relee solo si el manifest cambió)."""
+        try:
+            st = os.stat(self.manifest)
+            firma = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            firma = None
+        with self._lock:
+            if firma != self._firma:
+                por_nombre = {}
+                if firma is not None:
+                    with open(self.manifest, encoding="utf-8") as f:
+                        for linea in f:
+                            if linea.strip():
+                                entrada = json.loads(linea)
+                                # Un cierre que se reintentó queda con su última línea
+                                por_nombre[entrada["nombre"]] = entrada
+                self._por_nombre = por_nombre
+                self._por_trabajo = {e["id_trabajo"]: e for e in por_nombre.values() if e.get("id_trabajo")}
+                self._entradas = sorted(por_nombre.values(), key=lambda e: e["fecha_cierre"] or "", reverse=True)
+                self._firma = firma
+            return self._entradas
+
+    def entrada(self, nombre):
+        self.entradas()
+        with self._lock:
+            return self._por_nombre.get(nombre)
+
+    def entrada_trabajo(self, id_trabajo):
+        """Entrada del cierre que armó ese trabajo en segundo plano (None si no está)."""
+        self.entradas()
+        with self._lock:
+            return self._por_trabajo.get(id_trabajo)
+
+    def listar(self, pagina=1, por_pagina=50):
+        """Página del historial: {"entradas", "total", "pagina", "paginas", "por_pagina"}."""
+        entradas = self.entradas()
+        total = len(entradas)
+        paginas = max(1, -(-total // por_pagina))
+        pagina = min(max(1, pagina), paginas)
+        inicio = (pagina - 1) * por_pagina
+        return {"entradas": entradas[inicio:inicio + por_pagina], "total": total,
+                "pagina": pagina, "paginas": paginas, "por_pagina": por_pagina}
+
+    def foto(self, nombre):
+        return foto_desde_snapshot(leer_snapshot(self.ruta_snapshot(nombre)))
+
+    # -------------- XLSX (CACHE LRU) --------------
+    def xlsx(self, nombre, avance=None):
+        """Ruta del XLSX estilizado del cierre (lo arma si no está en cache); None si no existe.
+
+        Los cierres de versiones anteriores (compactados o todavía sueltos en
+        la carpeta) se entregan tal cual.
+        """
+        original = os.path.join(self.originales, nombre)
+        if os.path.isfile(original):
+            return original
+        ruta = os.path.join(self.cache, nombre)
+        if os.path.exists(ruta):
+            os.utime(ruta)  # uso reciente para el LRU
+            return ruta
+        entrada = self.entrada(nombre)
+        if entrada is None:
+            anterior = os.path.join(self.carpeta, nombre)
+            return anterior if os.path.isfile(anterior) else None
+        with self._bloqueo_cache:
+            # Otro worker pudo armarlo mientras esperábamos
+            if not os.path.exists(ruta):
+                from exportar import libro_turno
+
+                wb = libro_turno(self.foto(nombre), boletas=True, avance=avance,
+                                 exportado=entrada["fecha_cierre"])
+                guardar_atomico(wb, ruta, "cierre")
+                print(f"🗃️ Cierre armado desde su foto: {nombre}")
+            self._recortar_cache(conservar=ruta)
+        return ruta
+
+    def _recortar_cache(self, conservar):
+        archivos = []
+        for nombre in os.listdir(self.cache):
+            if nombre.lower().endswith(".xlsx") and not nombre.startswith("."):
+                ruta = os.path.join(self.cache, nombre)
+                st = os.stat(ruta)
+                archivos.append((st.st_mtime, st.st_size, ruta))
+        total = sum(t for _, t, _ in archivos)
+        for _, tamano, ruta in sorted(archivos):
+            if total <= self.cache_bytes:
+                break
+            if ruta != conservar:
+                os.remove(ruta)
+                total -= tamano
+
+    # -------------- COMPACTACIÓN --------------
+    def sin_compactar(self):
+        """Nombres de los cierres XLSX de versiones anteriores que siguen sueltos en la carpeta."""
+        return sorted(
+            nombre for nombre in os.listdir(self.carpeta)
+            if nombre.lower().endswith(".xlsx") and not nombre.startswith(".")
+            and os.path.isfile(os.path.join(self.carpeta, nombre))
+        )
+
+    def compactar(self):
+        """Pasa los cierres XLSX que siguen en la carpeta a fotos comprimidas.
+
+        La foto sirve para el historial y el índice; el XLSX original se
+        mueve a .originales (fuera de la cache, que se recorta) y es el que
+        se descarga. Un solo proceso compacta a la vez. Devuelve los nombres
+        compactados.
+        """
+        compactados = []
+        with BloqueoArchivo(os.path.join(self.carpeta, ".compactar.lock")):
+            os.makedirs(self.originales, exist_ok=True)
+            self._rescatar_originales()
+            for nombre in self.sin_compactar():
+                ruta = os.path.join(self.carpeta, nombre)
+                try:
+                    datos = leer_cierre(ruta)
+                except Exception as e:
+                    print(f"⚠️ No se pudo compactar {nombre}: {e}")
+                    continue
+                resumen = datos["resumen"]
+                hojas = {h: [list(ESQUEMA[h])] + filas for h, filas in datos["hojas"].items()}
+                hojas["parametros"] = [list(ESQUEMA["parametros"])] + [
+                    [p, resumen.get(p)] for p in ("cajero", "turno", "caja_inicial") if resumen.get(p) is not None]
+                agregados = AgregadosCaja.desde_filas({h: f[1:] for h, f in hojas.items()})
+                boletas = IndiceBoletas.desde_filas(hojas.get(IndiceBoletas.HOJA, [])[1:]).copia()
+                self.guardar(FotoTurno(hojas, agregados, boletas), nombre, datos["fecha_cierre"])
+                os.replace(ruta, os.path.join(self.originales, nombre))
+                compactados.append(nombre)
+        if compactados:
+            print(f"🗜️ Cierres compactados: {len(compactados)}")
+        return compactados
+
+    def _rescatar_originales(self):
+        """Pasa a .originales los XLSX que versiones anteriores de compactar() dejaron en la cache.
+
+        En la cache no se distinguen de los armados desde su foto, salvo que
+        estos últimos (los de TrabajosCierre) tienen id_trabajo en el manifest:
+        ante la duda se conservan.
+        """
+        for nombre in os.listdir(self.cache):
+            if not nombre.lower().endswith(".xlsx") or nombre.startswith("."):
+                continue
+            entrada = self.entrada(nombre)
+            if entrada is not None and not entrada.get("id_trabajo"):
+                os.replace(os.path.join(self.cache, nombre), os.path.join(self.originales, nombre))
@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from metricas import contar, fase
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class BloqueoArchivo:
+    """Bloqueo exclusivo entre procesos (workers de gunicorn) y entre hilos.
+
+    Usa flock sobre un archivo .lock (msvcrt.locking en Windows). Es
+    reentrante dentro del mismo hilo, así una ruta puede tomarlo en un
+    lote y volver a tomarlo en cada operación del lote.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._hilos = threading.RLock()
+        self._profundidad = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._hilos.acquire()
+        if self._profundidad == 0:
+            try:
+                self._fd = os.open(self.ruta, os.O_RDWR | os.O_CREAT, 0o644)
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX)
+                else:
+                    while True:
+                        try:
+                            msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            time.sleep(0.05)
+            except Exception:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._hilos.release()
+                raise
+        self._profundidad += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._profundidad -= 1
+        if self._profundidad == 0:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(self._fd, 0, os.SEEK_SET)
+                    msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._hilos.release()
+        return False
+
+
+def escribir_temporal(wb, ruta, destino="libro"):
+    """Guarda un Workbook en un temporal (con fsync) junto a ruta y devuelve su nombre.
+
+    destino es la etiqueta de las métricas (checkpoint, cierre, ...).
+    """
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=".xlsx", dir=carpeta)
+    try:
+        with os.fdopen(fd, "wb") as f, fase("guardar_xlsx", destino=destino):
+            wb.save(f)
+            f.flush()
+            os.fsync(f.fileno())
+            contar("gustitos_bytes_escritos_total", f.tell(), destino=destino)
+    except Exception:
+        os.remove(tmp)
+        raise
+    return tmp
+
+
+def guardar_atomico(wb, ruta, destino="libro"):
+    """Guarda un Workbook en un temporal del mismo directorio y lo renombra sobre ruta."""
+    os.replace(escribir_temporal(wb, ruta, destino), ruta)
+
+
+def guardar_json_atomico(datos, ruta):
+    """Escribe datos como JSON en un temporal (con fsync) y lo renombra sobre ruta."""
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=carpeta)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, ruta)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def guardar_bytes_atomico(datos, ruta):
+    """Escribe bytes en un temporal (con fsync) y lo renombra sobre ruta."""
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=os.path.splitext(ruta)[1], dir=carpeta)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(datos)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, ruta)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def enlazar(origen, destino):
+    """Deja en destino el contenido de origen sin copiarlo (hard link); copia si el sistema no lo permite."""
+    try:
+        os.link(origen, destino)
+    except OSError:
+        shutil.copy2(origen, destino)
@@ -0,0 +1 @@
+"""Benchmarks de la caja. Se ejecutan desde la raíz del proyecto: python -m benchmarks.<nombre>"""
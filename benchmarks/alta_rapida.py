@@ -0,0 +1,95 @@
+"""Boletas por minuto del cajero: formulario clásico contra alta con fetch.
+
+Registra la misma cantidad de boletas de dos formas contra la app (test
+client) en un directorio temporal:
+  - formulario: POST /agregar_venta (result.html) + GET /agregar_venta para volver
+  - api: POST /api/agregar/venta con el mismo formulario (responde JSON)
+y muestra, por cada forma, la latencia p50/p95 por boleta, las boletas por
+minuto que permite el servidor, los bytes que viajan por boleta y, con el
+almacenamiento xlsx, los registros del diario por boleta (una sola
+escritura por venta).
+
+    python -m benchmarks.alta_rapida --boletas 1000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def formulario(numero):
+    return {
+        "numero_interno": str(numero),
+        "codigo_autorizacion": "123456",
+        "medio_pago[]": ["efectivo", "debito"],
+        "monto_pago[]": ["5000", "7000"],
+        "propina_pago[]": ["0", "700"],
+    }
+
+
+def registros_diario(ruta):
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def medir(cliente, boletas, desde, api, ruta_diario):
+    tiempos = []
+    transferidos = 0
+    registros = registros_diario(ruta_diario)
+    for numero in range(desde, desde + boletas):
+        t0 = time.perf_counter()
+        if api:
+            r = cliente.post("/api/agregar/venta", data=formulario(numero))
+            assert r.status_code == 200, r.status_code
+            transferidos += len(r.data)
+        else:
+            r = cliente.post("/agregar_venta", data=formulario(numero))
+            assert r.status_code == 200, r.status_code
+            volver = cliente.get("/agregar_venta")
+            transferidos += len(r.data) + len(volver.data)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    tiempos.sort()
+    return {
+        "p50_ms": statistics.median(tiempos),
+        "p95_ms": tiempos[int(len(tiempos) * 0.95) - 1],
+        "boletas_min": 60000 / statistics.mean(tiempos),
+        "kb_boleta": transferidos / boletas / 1024,
+        "escrituras_boleta": None if registros is None else (registros_diario(ruta_diario) - registros) / boletas,
+    }
+
+
+def columna(valor):
+    return f"{'-':>18}" if valor is None else f"{valor:>18.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boletas", type=int, default=1000)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_gustitos_"))
+    sys.path.insert(0, RAIZ)
+    import app as caja
+    from cajas import DIARIO_FILE
+
+    cliente = caja.app.test_client()
+    cliente.post("/iniciar_turno", data={"cajero": "Bench", "turno": "AM", "caja_inicial": "50000"})
+
+    campos = ["p50_ms", "p95_ms", "boletas_min", "kb_boleta", "escrituras_boleta"]
+    print(f"{args.boletas} boletas por forma ({caja.ALMACENAMIENTO})")
+    print(f"{'forma':>12} " + " ".join(f"{c:>18}" for c in campos))
+    for i, (forma, api) in enumerate((("formulario", False), ("api", True))):
+        resultado = medir(cliente, args.boletas, 1 + i * args.boletas, api, DIARIO_FILE)
+        print(f"{forma:>12} " + " ".join(columna(resultado[c]) for c in campos))
+
+    caja.libro.guardar()
+
+
+if __name__ == "__main__":
+    main()
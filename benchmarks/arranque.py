@@ -0,0 +1,112 @@
+"""Tiempo de arranque: importar app y primer 200 en "/", según el tamaño del turno.
+
+Por cada tamaño siembra plantilla_base.xlsx (benchmarks.turno_sintetico) en un
+directorio temporal y arranca la app varias veces, cada vez en un proceso
+nuevo. Mide:
+  - proceso: desde que se lanza el intérprete hasta el primer 200 en "/"
+  - import: import app (incluye armar la app con create_app)
+  - primera: el primer GET "/" con el test client
+  - libro: hasta que termina la carga en segundo plano (esquema, libro, cierres)
+y revisa que importar app no importe openpyxl. Con --maximo-ms termina con
+error si la mediana de "proceso" lo supera (para usarlo como control).
+
+    python -m benchmarks.arranque --boletas 0 2000 8000 --repeticiones 5
+    python -m benchmarks.arranque --boletas 8000 --maximo-ms 1500
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def un_arranque(carpeta):
+    """Proceso hijo: arranca la app en carpeta e informa por stdout."""
+    os.chdir(carpeta)
+    sys.path.insert(0, RAIZ)
+    t0 = time.perf_counter()
+    import app as caja
+    t1 = time.perf_counter()
+    openpyxl_al_importar = "openpyxl" in sys.modules
+    r = caja.app.test_client().get("/")
+    assert r.status_code == 200, r.status_code
+    t2 = time.perf_counter()
+    # Primera línea: el padre la toma como "primera pantalla lista"
+    print("listo", flush=True)
+    for hilo in threading.enumerate():
+        if hilo.name == "arranque":
+            hilo.join()
+    t3 = time.perf_counter()
+    print(json.dumps({
+        "import_ms": (t1 - t0) * 1000,
+        "primera_ms": (t2 - t1) * 1000,
+        "libro_ms": (t3 - t1) * 1000,
+        "openpyxl_al_importar": openpyxl_al_importar,
+    }), flush=True)
+
+
+def arrancar_proceso(carpeta):
+    """Lanza un hijo y devuelve sus tiempos más el del proceso completo."""
+    t0 = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.arranque", "--un-arranque", carpeta],
+        cwd=RAIZ, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    primera = proceso.stdout.readline()
+    proceso_ms = (time.perf_counter() - t0) * 1000
+    resultado = json.loads(proceso.stdout.readline())
+    proceso.wait()
+    if primera.strip() != "listo":
+        raise RuntimeError("el arranque no respondió")
+    resultado["proceso_ms"] = proceso_ms
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boletas", type=int, nargs="+", default=[0, 2000, 8000])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--maximo-ms", type=float, help="mediana máxima de proceso_ms")
+    parser.add_argument("--un-arranque", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.un_arranque:
+        un_arranque(args.un_arranque)
+        return
+
+    from benchmarks.turno_sintetico import generar_turno, sembrar_xlsx
+
+    campos = ["proceso_ms", "import_ms", "primera_ms", "libro_ms"]
+    print(f"{'boletas':>8} " + " ".join(f"{c:>12}" for c in campos) + "   (ms, mediana)")
+    fallas = []
+    for boletas in args.boletas:
+        plantilla = os.path.join(tempfile.mkdtemp(prefix="arranque_gustitos_"), "plantilla_base.xlsx")
+        sembrar_xlsx(plantilla, generar_turno(boletas))
+        corridas = []
+        for _ in range(args.repeticiones):
+            # Cada arranque en una carpeta limpia con la misma plantilla (sin diario ni cierres)
+            carpeta = tempfile.mkdtemp(prefix="arranque_gustitos_")
+            shutil.copy(plantilla, carpeta)
+            corridas.append(arrancar_proceso(carpeta))
+        medianas = {c: statistics.median(r[c] for r in corridas) for c in campos}
+        print(f"{boletas:>8} " + " ".join(f"{medianas[c]:>12.1f}" for c in campos))
+        if any(r["openpyxl_al_importar"] for r in corridas):
+            fallas.append(f"{boletas} boletas: import app cargó openpyxl")
+        if args.maximo_ms is not None and medianas["proceso_ms"] > args.maximo_ms:
+            fallas.append(f"{boletas} boletas: {medianas['proceso_ms']:.0f} ms > {args.maximo_ms:.0f} ms")
+
+    for falla in fallas:
+        print(f"❌ {falla}")
+    if fallas:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Prueba de carga: ventas en paralelo contra la app y verificación de que no se pierde ninguna.
+
+Sin --url levanta la app en un directorio temporal: con --workers 0 en un
+servidor con hilos dentro de este proceso, y con --workers N bajo gunicorn
+con N procesos. Al final descarga el Excel actual y cuenta las filas.
+
+    python -m benchmarks.carga_concurrente --ventas 500 --hilos 16 --workers 4
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar(url, segundos=20):
+    limite = time.time() + segundos
+    while time.time() < limite:
+        try:
+            urllib.request.urlopen(url + "/", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"El servidor no respondió en {url}")
+
+
+def _levantar(workers):
+    os.chdir(tempfile.mkdtemp(prefix="carga_gustitos_"))
+    puerto = _puerto_libre()
+    url = f"http://127.0.0.1:{puerto}"
+    if workers > 0:
+        env = dict(os.environ, PYTHONPATH=RAIZ)
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", "4",
+             "-b", f"127.0.0.1:{puerto}", "app:app"], env=env,
+        )
+        _esperar(url)
+        return url, proc.terminate
+
+    sys.path.insert(0, RAIZ)
+    from werkzeug.serving import make_server
+    import app as caja
+
+    servidor = make_server("127.0.0.1", puerto, caja.app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return url, servidor.shutdown
+
+
+class _NoRedirigir(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ventas", type=int, default=500)
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=0, help="procesos gunicorn (0 = servidor en este proceso)")
+    parser.add_argument("--url", help="usar un servidor ya levantado")
+    args = parser.parse_args()
+
+    detener = None
+    url = args.url
+    if not url:
+        url, detener = _levantar(args.workers)
+
+    try:
+        opener = urllib.request.build_opener(_NoRedirigir)
+        datos = urllib.parse.urlencode({"cajero": "Carga", "turno": "AM", "caja_inicial": "10000"}).encode()
+        try:
+            opener.open(url + "/iniciar_turno", datos)
+        except urllib.error.HTTPError as e:
+            cookie = e.headers["Set-Cookie"].split(";")[0]
+
+        prefijo = f"C{int(time.time())}-"
+
+        def vender(i):
+            cuerpo = urllib.parse.urlencode({
+                "numero_interno": f"{prefijo}{i}",
+                "codigo_autorizacion": "",
+                "medio_pago[]": "efectivo",
+                "monto_pago[]": "1000",
+                "propina_pago[]": "0",
+            }).encode()
+            req = urllib.request.Request(url + "/agregar_venta", cuerpo, headers={"Cookie": cookie})
+            with urllib.request.urlopen(req, timeout=60) as r:
+                assert r.status == 200, r.status
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.hilos) as pool:
+            list(pool.map(vender, range(args.ventas)))
+        duracion = time.perf_counter() - t0
+
+        from openpyxl import load_workbook
+
+        req = urllib.request.Request(url + "/descargar_actual", headers={"Cookie": cookie})
+        with urllib.request.urlopen(req, timeout=120) as r:
+            wb = load_workbook(BytesIO(r.read()), read_only=True)
+        registradas = {
+            row[2] for row in wb["planilla transacciones"].iter_rows(min_row=2, values_only=True)
+            if row and isinstance(row[2], str) and row[2].startswith(prefijo)
+        }
+        print(f"{args.ventas} ventas con {args.hilos} hilos en {duracion:.2f}s "
+              f"({args.ventas / duracion:.0f} ventas/s); registradas: {len(registradas)}")
+        faltantes = args.ventas - len(registradas)
+        assert faltantes == 0, f"Se perdieron {faltantes} ventas"
+    finally:
+        if detener:
+            detener()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Exportación del turno: modo completo (estilo por celda) contra modo rápido.
+
+Arma un turno con N ventas en un directorio temporal y mide libro_turno +
+save en ambos modos: tiempo, tamaño del XLSX y pico de memoria.
+
+    python -m benchmarks.exportacion --ventas 5000 --repeticiones 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def exportar(libro_turno, libro, rapido, cierre):
+    with tempfile.TemporaryFile() as archivo:
+        libro_turno(libro, boletas=cierre, rapido=rapido).save(archivo)
+        return archivo.tell()
+
+
+def medir(libro_turno, libro, rapido, cierre, repeticiones):
+    """Tiempos de cada repetición, tamaño del archivo y pico de memoria (aparte: tracemalloc frena)."""
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        tamano = exportar(libro_turno, libro, rapido, cierre)
+        tiempos.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    exportar(libro_turno, libro, rapido, cierre)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tiempos, tamano, pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ventas", type=int, default=5000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--cierre", action="store_true", help="incluye el bloque Resumen por Boleta")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_gustitos_"))
+    sys.path.insert(0, RAIZ)
+    import app as caja
+    from exportar import libro_turno
+
+    cliente = caja.app.test_client()
+    cliente.post("/iniciar_turno", data={"cajero": "Bench", "turno": "AM", "caja_inicial": "50000"})
+    medios = ["efectivo", "debito", "credito", "transferencia"]
+    with caja.libro.lote():
+        for i in range(args.ventas):
+            medio = medios[i % len(medios)]
+            propina = 0.0 if medio == "efectivo" else 500.0
+            caja.libro.agregar("planilla transacciones", [
+                "2026-10-18 12:00:00", "", str(i + 1), medio, 7000.0, propina, 7000.0 + propina,
+            ])
+
+    print(f"{args.ventas} ventas, {args.repeticiones} repeticiones")
+    print(f"{'modo':>10} {'p50 s':>8} {'min s':>8} {'XLSX KB':>9} {'pico MB':>8}")
+    for modo, rapido in (("completo", False), ("rapido", True)):
+        tiempos, tamano, pico = medir(libro_turno, caja.libro, rapido, args.cierre, args.repeticiones)
+        print(f"{modo:>10} {statistics.median(tiempos):>8.2f} {min(tiempos):>8.2f} "
+              f"{tamano / 1024:>9.0f} {pico / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
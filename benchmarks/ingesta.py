@@ -0,0 +1,93 @@
+"""Carga masiva de ventas: /api/ventas/lote (JSON y CSV) contra un POST de agregar_venta por boleta.
+
+Registra N boletas de dos pagos cada una en un turno nuevo por modo (en un
+directorio temporal) y muestra ventas/s y filas/s. Los POST de formulario
+se miden sobre menos boletas (--formulario) porque son mucho más lentos.
+
+    python -m benchmarks.ingesta --ventas 5000 --formulario 500
+    python -m benchmarks.ingesta --almacenamiento sqlite
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGOS = [("efectivo", 5000, 0), ("debito", 7000, 700)]
+
+
+def ventas_json(n, inicio):
+    return {"ventas": [
+        {"numero_interno": str(i), "codigo_autorizacion": f"A{i}",
+         "pagos": [{"medio": m, "monto": monto, "propina": propina} for m, monto, propina in PAGOS]}
+        for i in range(inicio, inicio + n)
+    ]}
+
+
+def ventas_csv(n, inicio):
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(["numero_interno", "codigo_autorizacion", "medio", "monto", "propina"])
+    for i in range(inicio, inicio + n):
+        for medio, monto, propina in PAGOS:
+            escritor.writerow([i, f"A{i}", medio, monto, propina])
+    return salida.getvalue()
+
+
+def por_formulario(cliente, n, inicio):
+    for i in range(inicio, inicio + n):
+        r = cliente.post("/agregar_venta", data={
+            "numero_interno": str(i),
+            "codigo_autorizacion": f"A{i}",
+            "medio_pago[]": [m for m, _, _ in PAGOS],
+            "monto_pago[]": [str(monto) for _, monto, _ in PAGOS],
+            "propina_pago[]": [str(propina) for _, _, propina in PAGOS],
+        })
+        assert r.status_code == 200, r.status_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ventas", type=int, default=5000)
+    parser.add_argument("--formulario", type=int, default=500, help="boletas para el modo formulario")
+    parser.add_argument("--almacenamiento", choices=["xlsx", "sqlite"], default="xlsx")
+    args = parser.parse_args()
+
+    os.environ["GUSTITOS_ALMACENAMIENTO"] = args.almacenamiento
+    os.chdir(tempfile.mkdtemp(prefix="bench_gustitos_"))
+    sys.path.insert(0, RAIZ)
+    import app as caja
+
+    cliente = caja.app.test_client()
+    cliente.post("/iniciar_turno", data={"cajero": "Bench", "turno": "AM", "caja_inicial": "50000"})
+
+    def json_(n, inicio):
+        r = cliente.post("/api/ventas/lote", json=ventas_json(n, inicio))
+        assert r.status_code == 200 and not r.get_json()["errores"], r.get_json()
+
+    def csv_(n, inicio):
+        r = cliente.post("/api/ventas/lote", data=ventas_csv(n, inicio), content_type="text/csv")
+        assert r.status_code == 200 and not r.get_json()["errores"], r.get_json()
+
+    print(f"almacenamiento: {args.almacenamiento}")
+    print(f"{'modo':>11} {'boletas':>8} {'segundos':>9} {'ventas/s':>10} {'filas/s':>10}")
+    inicio = 1
+    for nombre, funcion, n in [("formulario", lambda n, i: por_formulario(cliente, n, i), args.formulario),
+                               ("json", json_, args.ventas),
+                               ("csv", csv_, args.ventas)]:
+        t0 = time.perf_counter()
+        funcion(n, inicio)
+        segundos = time.perf_counter() - t0
+        filas = n * len(PAGOS)
+        print(f"{nombre:>11} {n:>8} {segundos:>9.2f} {n / segundos:>10.0f} {filas / segundos:>10.0f}")
+        inicio += n
+
+    caja.libro.guardar()
+
+
+if __name__ == "__main__":
+    main()
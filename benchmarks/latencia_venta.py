@@ -0,0 +1,53 @@
+"""Latencia de agregar_venta a medida que crece el turno.
+
+Registra ventas contra la app (test client) en un directorio temporal y
+muestra la latencia por bloque; con el diario la curva debe quedar plana.
+
+    python -m benchmarks.latencia_venta --ventas 2000 --bloque 250
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ventas", type=int, default=2000)
+    parser.add_argument("--bloque", type=int, default=250)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_gustitos_"))
+    sys.path.insert(0, RAIZ)
+    import app as caja
+
+    cliente = caja.app.test_client()
+    cliente.post("/iniciar_turno", data={"cajero": "Bench", "turno": "AM", "caja_inicial": "50000"})
+
+    tiempos = []
+    print(f"{'filas':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for i in range(1, args.ventas + 1):
+        t0 = time.perf_counter()
+        r = cliente.post("/agregar_venta", data={
+            "numero_interno": str(i),
+            "codigo_autorizacion": "",
+            "medio_pago[]": ["efectivo", "debito"],
+            "monto_pago[]": ["5000", "7000"],
+            "propina_pago[]": ["0", "700"],
+        })
+        tiempos.append((time.perf_counter() - t0) * 1000)
+        assert r.status_code == 200, r.status_code
+        if i % args.bloque == 0:
+            bloque = sorted(tiempos[-args.bloque:])
+            p95 = bloque[int(len(bloque) * 0.95) - 1]
+            print(f"{i * 2:>8} {statistics.median(bloque):>8.2f} {p95:>8.2f}")
+
+    caja.libro.guardar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Latencia de las rutas de lectura según la cantidad de filas: camino antiguo contra el actual.
+
+Para cada tamaño arma un turno en un directorio temporal, hace checkpoint y mide:
+  - antes: load_workbook completo (con estilos) + filas de la hoja, lo que hacía cada ruta
+  - read_only: lectura.leer_libro de una sola hoja, sin cache
+  - cache: la misma lectura sin cambios en el archivo
+  - las rutas de la app (planilla_caja, planilla_repartos, planilla_egresos, api/resumen)
+
+    python -m benchmarks.lectura --filas 500 2000 8000 --repeticiones 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUTAS = ["/planilla_caja", "/planilla_repartos", "/planilla_egresos", "/api/resumen"]
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, nargs="+", default=[500, 2000, 8000])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, RAIZ)
+    os.environ["GUSTITOS_ALMACENAMIENTO"] = "xlsx"
+    os.chdir(tempfile.mkdtemp(prefix="bench_gustitos_"))
+    import app as caja
+    from cajas import EXCEL_FILE
+    import lectura
+    from openpyxl import load_workbook
+
+    cliente = caja.app.test_client()
+    cliente.post("/iniciar_turno", data={"cajero": "Bench", "turno": "AM", "caja_inicial": "50000"})
+
+    columnas = ["antes", "read_only", "cache"] + [r.strip("/") for r in RUTAS]
+    print(f"{'filas':>7} " + " ".join(f"{c:>18}" for c in columnas) + "   (ms, mediana)")
+    hechas = 0
+    for total in sorted(args.filas):
+        with caja.libro.lote():
+            for i in range(hechas, total):
+                caja.libro.agregar("planilla transacciones", [
+                    "2026-10-18 12:00:00", "", str(i + 1), "efectivo", 5000.0, 0.0, 5000.0])
+                if i % 10 == 0:
+                    caja.libro.agregar("planilla repartos", ["2026-10-18 12:00:00", "Juan", "Calle 1", 3000.0, 0.0])
+                    caja.libro.agregar("planilla egresos", ["2026-10-18 12:00:00", "gas", 1500.0, "F1"])
+        hechas = total
+        caja.libro.guardar()
+        ruta = EXCEL_FILE
+
+        def antes():
+            wb = load_workbook(ruta, data_only=True)
+            [list(r) for r in wb["planilla transacciones"].iter_rows(min_row=2, values_only=True)]
+
+        def read_only():
+            lectura._cache.clear()
+            lectura.leer_libro(ruta, ["planilla transacciones"])
+
+        lectura.leer_libro(ruta, ["planilla transacciones"])
+        valores = [
+            medir(antes, args.repeticiones),
+            medir(read_only, args.repeticiones),
+            medir(lambda: lectura.leer_libro(ruta, ["planilla transacciones"]), args.repeticiones),
+        ]
+        for r in RUTAS:
+            valores.append(medir(lambda: cliente.get(r), args.repeticiones))
+        print(f"{total:>7} " + " ".join(f"{v:>18.2f}" for v in valores))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Suite de benchmarks del flujo del cajero sobre turnos sintéticos, con resultados en JSON.
+
+Por cada tamaño de turno siembra plantilla_base.xlsx (o la base sqlite) con
+benchmarks.turno_sintetico en un directorio temporal y maneja la app con el
+test client: agregar_venta, planilla_caja, descargar_actual y cierre_caja.
+Cada tamaño corre en un proceso aparte, así el pico de RSS es el de ese
+turno. El JSON queda en --salida para comparar corridas (--comparar).
+
+    python -m benchmarks.suite --boletas 500 2000 8000 --salida resultados.json
+    python -m benchmarks.suite --almacenamiento sqlite --comparar resultados.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from benchmarks.turno_sintetico import generar_turno, sembrar_repositorio, sembrar_xlsx
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Métricas que se comparan entre corridas (ms o bytes; menos es mejor)
+COMPARABLES = [
+    ("agregar_venta", "p50_ms"), ("agregar_venta", "p95_ms"),
+    ("planilla_caja", "p50_ms"), ("planilla_caja", "p95_ms"),
+    ("descargar_actual", "p50_ms"), ("descargar_actual", "bytes"),
+    ("cierre_caja", "ms"), ("cierre_caja", "bytes"), ("cierre_caja", "bytes_archivo"),
+    ("rss_pico_mb", None),
+]
+
+
+def percentiles(tiempos):
+    ordenados = sorted(tiempos)
+    return {
+        "n": len(ordenados),
+        "p50_ms": round(statistics.median(ordenados), 3),
+        "p95_ms": round(ordenados[max(0, int(len(ordenados) * 0.95) - 1)], 3),
+    }
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for i in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion(i)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return tiempos
+
+
+def esperar_cierres():
+    for hilo in threading.enumerate():
+        if hilo.name.startswith("cierre-"):
+            hilo.join()
+
+
+def correr_tamano(boletas, semilla, muestras, almacenamiento):
+    """Resultados de un tamaño de turno (se llama en un proceso nuevo)."""
+    os.environ["GUSTITOS_ALMACENAMIENTO"] = almacenamiento
+    os.chdir(tempfile.mkdtemp(prefix="suite_gustitos_"))
+    turno = generar_turno(boletas, semilla)
+    if almacenamiento == "xlsx":
+        sembrar_xlsx("plantilla_base.xlsx", turno)
+    sys.path.insert(0, RAIZ)
+    import app as caja
+    if almacenamiento != "xlsx":
+        sembrar_repositorio(caja.libro, turno)
+
+    cliente = caja.app.test_client()
+    cliente.post("/iniciar_turno", data={"cajero": "Bench", "turno": "AM", "caja_inicial": "50000"})
+    resultado = {"boletas": boletas, "filas": {h: len(f) for h, f in turno.items()}}
+
+    def venta(i):
+        r = cliente.post("/agregar_venta", data={
+            "numero_interno": f"S{i}",
+            "codigo_autorizacion": "123456",
+            "medio_pago[]": ["efectivo", "debito"],
+            "monto_pago[]": ["5000", "7000"],
+            "propina_pago[]": ["0", "700"],
+        })
+        assert r.status_code == 200, r.status_code
+
+    def planilla(i):
+        r = cliente.get("/planilla_caja", query_string={"pagina": i % 5 + 1})
+        assert r.status_code == 200, r.status_code
+
+    tamanos = []
+
+    def descarga(_):
+        r = cliente.get("/descargar_actual")
+        assert r.status_code == 200, r.status_code
+        tamanos.append(len(r.get_data()))
+
+    resultado["agregar_venta"] = percentiles(medir(venta, muestras))
+    resultado["planilla_caja"] = percentiles(medir(planilla, muestras))
+    resultado["descargar_actual"] = dict(percentiles(medir(descarga, max(3, muestras // 10))), bytes=tamanos[-1])
+
+    # Cierre: desde el request hasta que el archivo queda escrito
+    t0 = time.perf_counter()
+    r = cliente.get("/cierre_caja")
+    assert r.status_code == 302, r.status_code
+    esperar_cierres()
+    cierres = caja.archivo_cierres.entradas()
+    ruta = caja.archivo_cierres.xlsx(cierres[0]["nombre"]) if cierres else None
+    resultado["cierre_caja"] = {
+        "ms": round((time.perf_counter() - t0) * 1000, 3),
+        "bytes": os.path.getsize(ruta) if ruta else None,
+        "bytes_archivo": cierres[0]["bytes"] if cierres else None,
+    }
+    # ru_maxrss viene en KB en Linux (bytes en macOS)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    resultado["rss_pico_mb"] = round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    return resultado
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _valor(resultado, seccion, campo):
+    valor = resultado.get(seccion)
+    return valor.get(campo) if campo and isinstance(valor, dict) else valor
+
+
+def comparar(anterior, actual):
+    """Imprime la variación de cada métrica contra una corrida anterior."""
+    previos = {r["boletas"]: r for r in anterior["resultados"]}
+    print(f"\nComparación con {anterior.get('commit') or '?'} ({anterior['fecha']}):")
+    for resultado in actual["resultados"]:
+        previo = previos.get(resultado["boletas"])
+        if previo is None:
+            continue
+        for seccion, campo in COMPARABLES:
+            antes, ahora = _valor(previo, seccion, campo), _valor(resultado, seccion, campo)
+            if not antes or ahora is None:
+                continue
+            nombre = f"{seccion}.{campo}" if campo else seccion
+            print(f"  {resultado['boletas']:>6} {nombre:<24} {antes:>12} -> {ahora:>12} ({(ahora - antes) / antes:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boletas", type=int, nargs="+", default=[500, 2000, 8000])
+    parser.add_argument("--muestras", type=int, default=50, help="requests por medición")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--almacenamiento", choices=["xlsx", "sqlite"], default="xlsx")
+    parser.add_argument("--salida", default="resultados_benchmark.json")
+    parser.add_argument("--comparar", metavar="JSON", help="corrida anterior para comparar")
+    parser.add_argument("--un-tamano", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.un_tamano is not None:
+        # Proceso hijo: un tamaño, resultado por stdout (la app imprime por stderr lo suyo)
+        salida = sys.stdout
+        sys.stdout = sys.stderr
+        resultado = correr_tamano(args.un_tamano, args.semilla, args.muestras, args.almacenamiento)
+        salida.write(json.dumps(resultado))
+        return
+
+    corrida = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "almacenamiento": args.almacenamiento,
+        "semilla": args.semilla,
+        "muestras": args.muestras,
+        "resultados": [],
+    }
+    print(f"{'boletas':>8} {'venta p50':>10} {'venta p95':>10} {'planilla p50':>13} "
+          f"{'descarga p50':>13} {'cierre ms':>10} {'RSS MB':>8}")
+    for boletas in args.boletas:
+        proceso = subprocess.run(
+            [sys.executable, "-m", "benchmarks.suite", "--un-tamano", str(boletas),
+             "--semilla", str(args.semilla), "--muestras", str(args.muestras),
+             "--almacenamiento", args.almacenamiento],
+            cwd=RAIZ, stdout=subprocess.PIPE, text=True, check=True,
+        )
+        r = json.loads(proceso.stdout)
+        corrida["resultados"].append(r)
+        print(f"{boletas:>8} {r['agregar_venta']['p50_ms']:>10.2f} {r['agregar_venta']['p95_ms']:>10.2f} "
+              f"{r['planilla_caja']['p50_ms']:>13.2f} {r['descargar_actual']['p50_ms']:>13.2f} "
+              f"{r['cierre_caja']['ms']:>10.0f} {r['rss_pico_mb']:>8.1f}")
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(corrida, f, indent=2, ensure_ascii=False)
+    print(f"💾 Resultados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(json.load(f), corrida)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Turnos sintéticos reproducibles para los benchmarks.
+
+generar_turno arma, a partir de una semilla, las filas de un turno con N
+boletas: pagos divididos entre los MEDIOS_VALIDOS, propinas, repartos con
+piso, egresos, mermas, cortesías y el desglose de caja del final. Con
+sembrar_xlsx queda como plantilla_base.xlsx; con sembrar_repositorio se
+carga en cualquier repositorio (sqlite).
+
+    python -m benchmarks.turno_sintetico --boletas 2000 --semilla 7 plantilla_base.xlsx
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+from agregados import DENOMINACIONES
+from esquema import ESQUEMA, HOJAS_NECESARIAS
+
+# Peso de cada medio de pago (aprox. lo que se ve en un turno normal)
+PESOS_MEDIOS = {
+    "efectivo": 35, "debito": 30, "credito": 15, "transferencia": 8,
+    "pluxee": 2, "edenred": 2, "amipass": 2, "pedidos ya": 3, "uber eats": 3,
+}
+REPARTIDORES = ["Juan", "Pedro", "Marcela", "Rodrigo"]
+MOTIVOS_EGRESO = ["gas", "verduras", "bebidas", "aseo", "queso"]
+MOTIVOS_MERMA = ["pizza quemada", "pedido mal tomado", "ingrediente vencido"]
+MOTIVOS_CORTESIA = ["cliente frecuente", "demora en pedido", "cumpleaños"]
+
+
+def _monto(azar, minimo, maximo):
+    return float(round(azar.uniform(minimo, maximo), -2))
+
+
+def generar_turno(boletas, semilla=0, inicio=None):
+    """{hoja: filas sin encabezado} de un turno con esa cantidad de boletas."""
+    azar = random.Random(semilla)
+    inicio = inicio or datetime(2026, 10, 18, 11, 0, 0)
+    paso = timedelta(hours=12) / max(boletas, 1)
+    medios, pesos = zip(*PESOS_MEDIOS.items())
+
+    def fecha(i):
+        return (inicio + paso * i).strftime("%Y-%m-%d %H:%M:%S")
+
+    turno = {hoja: [] for hoja in HOJAS_NECESARIAS if hoja != "parametros"}
+    con_reparto = set()
+    for i in range(boletas):
+        nro = str(100000 + i)
+        n_pagos = azar.choices([1, 2, 3], weights=[70, 25, 5])[0]
+        codigo = str(azar.randint(100000, 999999))
+        for medio in azar.choices(medios, weights=pesos, k=n_pagos):
+            monto = _monto(azar, 3000, 40000)
+            propina = float(round(monto * 0.1, -1)) if medio in ("debito", "credito") and azar.random() < 0.4 else 0.0
+            turno["planilla transacciones"].append([
+                fecha(i), codigo if medio in ("debito", "credito") else "", nro, medio,
+                monto, propina, monto + propina,
+            ])
+
+        if azar.random() < 0.12:
+            repartidor = azar.choice(REPARTIDORES)
+            # El piso solo va en el primer reparto de cada uno (como en agregar_reparto)
+            piso = float(azar.choice([0, 5000, 10000])) if repartidor not in con_reparto else 0.0
+            con_reparto.add(repartidor)
+            turno["planilla repartos"].append([
+                fecha(i), repartidor, f"Calle {azar.randint(1, 999)}", _monto(azar, 1500, 4000), piso])
+        if azar.random() < 0.02:
+            turno["planilla egresos"].append([
+                fecha(i), azar.choice(MOTIVOS_EGRESO), _monto(azar, 2000, 30000), f"F{azar.randint(1000, 9999)}"])
+        if azar.random() < 0.012:
+            turno["planilla mermas"].append([fecha(i), azar.choice(MOTIVOS_MERMA), _monto(azar, 2000, 15000)])
+        if azar.random() < 0.015:
+            turno["planilla cortesias"].append([fecha(i), _monto(azar, 1000, 8000), azar.choice(MOTIVOS_CORTESIA)])
+
+    cierre = fecha(boletas)
+    for tipo in ("Caja", "Deposito"):
+        for denominacion in DENOMINACIONES:
+            cantidad = azar.randint(0, 40)
+            if cantidad:
+                turno["planilla desgloses"].append([cierre, denominacion, cantidad, denominacion * cantidad, tipo])
+    return turno
+
+
+def sembrar_xlsx(ruta, turno, parametros=None):
+    """Escribe el turno como plantilla_base.xlsx (hojas y encabezados de ESQUEMA)."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    for hoja in HOJAS_NECESARIAS:
+        ws = wb.create_sheet(hoja)
+        ws.append(ESQUEMA[hoja])
+        if hoja == "parametros":
+            for nombre, valor in (parametros or {}).items():
+                ws.append([nombre, valor])
+        for fila in turno.get(hoja, []):
+            ws.append(fila)
+    wb.save(ruta)
+
+
+def sembrar_repositorio(libro, turno, parametros=None):
+    """Carga el turno en un repositorio, todo en un lote."""
+    with libro.lote():
+        for hoja, filas in turno.items():
+            libro.asegurar_hoja(hoja, ESQUEMA[hoja])
+            if filas:
+                libro.agregar(hoja, *filas)
+        if parametros:
+            libro.fijar_parametros(parametros)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("ruta", nargs="?", default="plantilla_base.xlsx")
+    parser.add_argument("--boletas", type=int, default=2000)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    if os.path.exists(args.ruta):
+        sys.exit(f"{args.ruta} ya existe; no se sobrescribe")
+    turno = generar_turno(args.boletas, args.semilla)
+    sembrar_xlsx(args.ruta, turno)
+    print(f"🧪 {args.ruta}: " + ", ".join(f"{h} {len(f)}" for h, f in turno.items()))
+
+
+if __name__ == "__main__":
+    main()
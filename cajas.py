@@ -0,0 +1,253 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from agregados import AgregadosCaja, calcular_resumen
+from archivo_cierres import ArchivoCierres
+from cierres import TrabajosCierre
+from esquema import EsquemaArchivo
+from indice_cierres import IndiceCierres
+from indices import IndicePlanilla
+from metricas import contar, fase
+from repositorio import crear_repositorio
+
+# Archivos de cada caja, relativos a su carpeta
+EXCEL_FILE = "plantilla_base.xlsx"
+DIARIO_FILE = "plantilla_base.diario.jsonl"
+SQLITE_FILE = "plantilla_base.sqlite"
+CIERRES_DIR = "cierres"
+INDICE_CIERRES_FILE = os.path.join(CIERRES_DIR, ".indice_cierres.sqlite")
+
+# La caja principal usa la carpeta de la app (donde estaban los archivos
+# antes de haber varias cajas); las demás, cajas/<id>/
+CAJA_PRINCIPAL = "principal"
+CARPETA_CAJAS = "cajas"
+
+# Id de caja (local-caja, p. ej. "centro-1"): también es el nombre de su carpeta
+ID_CAJA = re.compile(r"[A-Za-z0-9_-]{1,40}")
+
+# Parámetros del turno que se leen para el resumen de cada caja
+PARAMETROS_TURNO = ("cajero", "turno", "caja_inicial")
+
+
+def carpeta_caja(id_caja):
+    return "." if id_caja == CAJA_PRINCIPAL else os.path.join(CARPETA_CAJAS, id_caja)
+
+
+def indices_planillas():
+    """Índices en memoria de las planillas que se ven paginadas (uno por hoja)."""
+    return {
+        "planilla transacciones": IndicePlanilla(
+            "planilla transacciones",
+            filtros={"medio": 3, "interno": 2},
+            ordenes={"fecha": 0, "interno": 2, "medio": 3, "monto": 4, "propina": 5, "total": 6},
+        ),
+        "planilla repartos": IndicePlanilla(
+            "planilla repartos",
+            filtros={"repartidor": 1},
+            ordenes={"fecha": 0, "repartidor": 1, "monto": 3, "piso": 4},
+        ),
+        "planilla egresos": IndicePlanilla(
+            "planilla egresos",
+            filtros={"boleta": 3},
+            ordenes={"fecha": 0, "motivo": 1, "valor": 2, "boleta": 3},
+        ),
+    }
+
+
+# -------------- UNA CAJA --------------
+class Caja:
+    """Una caja registradora: libro del turno, cierres e índices de sus planillas.
+
+    Todo vive en su carpeta. Crearla no lee el libro: preparar() lo carga
+    (y retoma, compacta e indexa los cierres) y liberar() hace el checkpoint
+    antes de sacarla de memoria.
+    """
+
+    def __init__(self, id_caja, carpeta, almacenamiento="xlsx", cache_cierres_bytes=200 * 1024 * 1024):
+        self.id = id_caja
+        self.carpeta = carpeta
+        self.almacenamiento = almacenamiento
+        self.ruta_excel = os.path.join(carpeta, EXCEL_FILE)
+        self.ruta_diario = os.path.join(carpeta, DIARIO_FILE)
+        self.ruta_sqlite = os.path.join(carpeta, SQLITE_FILE)
+        cierres = os.path.join(carpeta, CIERRES_DIR)
+
+        # El esquema se valida al cargar el libro (y al recargarlo si otro
+        # proceso reescribió el archivo); solo se reescribe si hace falta migrar.
+        self.esquema = EsquemaArchivo(self.ruta_excel)
+        self.libro = crear_repositorio(almacenamiento, self.ruta_excel, ruta_diario=self.ruta_diario,
+                                       ruta_sqlite=self.ruta_sqlite, inicializar=self.esquema.asegurar)
+        self.archivo_cierres = ArchivoCierres(cierres, cache_bytes=cache_cierres_bytes)
+        self.indice_cierres = IndiceCierres(os.path.join(carpeta, INDICE_CIERRES_FILE), cierres)
+        # Al terminar cada cierre se hace el checkpoint de lo que haya entrado
+        # al turno nuevo y se indexa el archivo nuevo
+        self.trabajos_cierre = TrabajosCierre(cierres, al_terminar=self.despues_del_cierre,
+                                              archivo=self.archivo_cierres)
+        self.indices = indices_planillas()
+        self._cache_resumen = {"marca": None, "datos": None}
+        self._lock_resumen = threading.Lock()
+
+    def preparar(self):
+        with fase("arranque"):
+            try:
+                self.libro.precargar()
+            except Exception as e:
+                print(f"❌ Error al cargar el libro de la caja {self.id}: {e}")
+            self.trabajos_cierre.retomar()
+            # Los XLSX de versiones anteriores se compactan a pedido (reimportar_cierres.py --compactar)
+            sueltos = self.archivo_cierres.sin_compactar()
+            if sueltos:
+                print(f"⚠️ Caja {self.id}: {len(sueltos)} cierres sin compactar "
+                      f"(python reimportar_cierres.py --compactar --carpeta {self.archivo_cierres.carpeta})")
+            self.indice_cierres.actualizar()
+
+    def despues_del_cierre(self):
+        self.libro.guardar()
+        self.indice_cierres.actualizar()
+
+    def liberar(self):
+        """Checkpoint del libro (lo pendiente queda en el XLSX antes de soltar la caja)."""
+        try:
+            self.libro.guardar()
+        except Exception as e:
+            print(f"❌ Error al guardar la caja {self.id}: {e}")
+
+    def nombre_cierre(self, cajero, fecha=None):
+        """Nombre del archivo de cierre: fecha, caja (salvo la principal) y cajero."""
+        fecha = (fecha or datetime.now()).strftime("%d-%m-%Y_%H-%M-%S")
+        cajero = re.sub(r'[\\/:*?"<>|]+', " ", str(cajero or "")).strip() or "Sin cajero"
+        caja = "" if self.id == CAJA_PRINCIPAL else f" {self.id}"
+        return f"Cierre caja {fecha}{caja} {cajero}.xlsx"
+
+    # -------------- RESUMEN DEL TURNO --------------
+    def resumen(self):
+        """Resumen Caja del turno; se reutiliza mientras libro.marca() no cambie."""
+        marca = self.libro.marca()
+        with self._lock_resumen:
+            if self._cache_resumen["marca"] == marca:
+                return self._cache_resumen["datos"]
+        caja_inicial = self.libro.parametro("caja_inicial") or 0
+        with fase("resumen_caja"):
+            datos = calcular_resumen(self.libro.agregados(), caja_inicial)
+        datos["cajero"] = self.libro.parametro("cajero") or "No registrado"
+        datos["turno"] = self.libro.parametro("turno") or "No registrado"
+        datos["actualizado"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock_resumen:
+            self._cache_resumen["marca"] = marca
+            self._cache_resumen["datos"] = datos
+        return datos
+
+    def totales(self):
+        """(AgregadosCaja, parámetros del turno) del libro cargado."""
+        return self.libro.agregados(), {p: self.libro.parametro(p) for p in PARAMETROS_TURNO}
+
+
+# -------------- REGISTRO (LRU) --------------
+class RegistroCajas:
+    """Cajas del servidor, cargadas al pedirlas y a lo más `maximo` en memoria.
+
+    Al pasarse del tope, la caja usada hace más tiempo sale del registro y
+    se libera en segundo plano (checkpoint); si se vuelve a pedir, se carga
+    de nuevo desde su XLSX y su diario. Cada proceso tiene su registro (con
+    gunicorn --preload, el de cada worker empieza vacío después del fork).
+    """
+
+    def __init__(self, ids, almacenamiento="xlsx", cache_cierres_bytes=200 * 1024 * 1024, maximo=4):
+        invalidos = [i for i in ids if not ID_CAJA.fullmatch(i)]
+        if invalidos:
+            raise ValueError(f"Id de caja inválido: {', '.join(invalidos)}")
+        self.ids = list(ids)
+        self.almacenamiento = almacenamiento
+        self.cache_cierres_bytes = cache_cierres_bytes
+        self.maximo = max(1, maximo)
+        self._cajas = OrderedDict()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def obtener(self, id_caja):
+        """Caja con ese id (KeyError si no está configurada); la carga en segundo plano si no estaba."""
+        if id_caja not in self.ids:
+            raise KeyError(id_caja)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._cajas, self._pid = OrderedDict(), os.getpid()
+            caja = self._cajas.get(id_caja)
+            if caja is not None:
+                self._cajas.move_to_end(id_caja)
+                return caja
+            caja = Caja(id_caja, carpeta_caja(id_caja), self.almacenamiento, self.cache_cierres_bytes)
+            self._cajas[id_caja] = caja
+            desalojadas = []
+            while len(self._cajas) > self.maximo:
+                desalojadas.append(self._cajas.popitem(last=False)[1])
+        contar("gustitos_cajas_cargadas_total", caja=id_caja)
+        # Lo que no hace falta para responder (cargar el libro, cierres) corre en segundo plano
+        threading.Thread(target=caja.preparar, name="arranque", daemon=True).start()
+        for vieja in desalojadas:
+            print(f"💤 Caja {vieja.id} fuera de memoria")
+            contar("gustitos_cajas_desalojadas_total", caja=vieja.id)
+            threading.Thread(target=vieja.liberar, name=f"liberar-{vieja.id}", daemon=True).start()
+        return caja
+
+    def en_memoria(self, id_caja):
+        with self._lock:
+            return self._cajas.get(id_caja) if self._pid == os.getpid() else None
+
+    def liberar_todas(self):
+        with self._lock:
+            cajas = list(self._cajas.values()) if self._pid == os.getpid() else []
+        for caja in cajas:
+            caja.liberar()
+
+    # -------------- RESUMEN CONSOLIDADO --------------
+    def totales(self, id_caja):
+        """(AgregadosCaja, parámetros del turno) de una caja, sin cargarla si no está en memoria.
+
+        De una caja fuera de memoria se leen los totales guardados con su
+        último checkpoint; solo si su diario tiene cambios posteriores se
+        carga el libro aparte (sin entrar al registro).
+        """
+        caja = self.en_memoria(id_caja)
+        if caja is not None:
+            return caja.totales()
+        carpeta = carpeta_caja(id_caja)
+        if not os.path.exists(os.path.join(carpeta, EXCEL_FILE if self.almacenamiento == "xlsx" else SQLITE_FILE)):
+            # Caja que todavía no tuvo turnos
+            return AgregadosCaja(), {p: None for p in PARAMETROS_TURNO}
+        if self.almacenamiento == "xlsx":
+            from libro_caja import totales_guardados
+
+            guardados = totales_guardados(os.path.join(carpeta, EXCEL_FILE), os.path.join(carpeta, DIARIO_FILE))
+            if guardados is not None:
+                return guardados[0], {p: guardados[1].get(p) for p in PARAMETROS_TURNO}
+        libro = crear_repositorio(self.almacenamiento, os.path.join(carpeta, EXCEL_FILE),
+                                  ruta_diario=os.path.join(carpeta, DIARIO_FILE),
+                                  ruta_sqlite=os.path.join(carpeta, SQLITE_FILE))
+        return libro.agregados(), {p: libro.parametro(p) for p in PARAMETROS_TURNO}
+
+    def resumen_consolidado(self):
+        """Resumen Caja de todas las cajas, sumando sus totales (no se recorren las planillas)."""
+        total = AgregadosCaja()
+        caja_inicial = 0
+        por_caja = []
+        for id_caja in self.ids:
+            agregados, parametros = self.totales(id_caja)
+            inicial = parametros.get("caja_inicial") or 0
+            total.incluir(agregados)
+            caja_inicial += inicial
+            resumen = calcular_resumen(agregados, inicial)
+            por_caja.append({
+                "caja": id_caja,
+                "cajero": parametros.get("cajero"),
+                "turno": parametros.get("turno"),
+                "caja_inicial": inicial,
+                "total_ventas": resumen["total_ventas"],
+                "total_caja_final": resumen["total_caja_final"],
+            })
+        datos = calcular_resumen(total, caja_inicial)
+        datos["cajas"] = por_caja
+        datos["actualizado"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return datos
@@ -0,0 +1,159 @@
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+from archivos import BloqueoArchivo, guardar_atomico, guardar_json_atomico
+from indice_cierres import fecha_cierre
+from repositorio import FotoTurno, foto_turno_cerrado
+
+_ID_VALIDO = re.compile(r"[0-9a-f]{32}")
+
+
+class TrabajosCierre:
+    """Cierres de caja que se arman en segundo plano.
+
+    Al cerrar, el repositorio pasa el turno a <carpeta>/.pendientes/<id>.turno.*
+    (rotar_turno: con LibroCaja es el mismo libro, sin recorrer sus filas) y
+    queda anotado en <id>.foto.json; un hilo arma el archivo de cierre desde
+    ese turno y lo borra al terminar. El avance queda en <id>.estado.json,
+    así cualquier worker puede responder por él, y los cierres que quedaron
+    a medias (corte, reinicio) se retoman con retomar().
+    Con un ArchivoCierres el cierre se guarda como foto comprimida y el XLSX
+    se deja armado en su cache para la descarga del final del turno; el
+    estado de un cierre listo se borra y desde ahí se responde con su entrada
+    del manifest.
+    """
+
+    def __init__(self, carpeta, al_terminar=None, archivo=None):
+        self.carpeta = carpeta
+        self.archivo = archivo
+        self.pendientes = os.path.join(carpeta, ".pendientes")
+        os.makedirs(self.pendientes, exist_ok=True)
+        self.al_terminar = al_terminar
+        self._hilos = {}
+        self._lock = threading.Lock()
+
+    def _ruta(self, id_trabajo, sufijo):
+        return os.path.join(self.pendientes, f"{id_trabajo}.{sufijo}")
+
+    # -------------- ESTADO --------------
+    def estado(self, id_trabajo):
+        """{"estado", "progreso", "etapa", "archivo", "error"} o None si el trabajo no existe."""
+        if not id_trabajo or not _ID_VALIDO.fullmatch(id_trabajo):
+            return None
+        try:
+            with open(self._ruta(id_trabajo, "estado.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+        entrada = self.archivo.entrada_trabajo(id_trabajo) if self.archivo is not None else None
+        if entrada is None:
+            return None
+        return {"id": id_trabajo, "estado": "listo", "progreso": 100, "etapa": "Listo",
+                "archivo": entrada["nombre"], "error": None}
+
+    def _fijar_estado(self, id_trabajo, **cambios):
+        estado = self.estado(id_trabajo) or {"id": id_trabajo}
+        estado.update(cambios)
+        estado["actualizado"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        guardar_json_atomico(estado, self._ruta(id_trabajo, "estado.json"))
+
+    # -------------- TRABAJOS --------------
+    def registrar(self, id_trabajo, repositorio, nombre):
+        """Pasa el turno del repositorio a .pendientes y deja el cierre en cola; el turno nuevo queda vacío.
+
+        Se llama con el lote del repositorio tomado.
+        """
+        turno = repositorio.rotar_turno(self._ruta(id_trabajo, "turno"))
+        guardar_json_atomico({"archivo": nombre, "turno": os.path.basename(turno)}, self._ruta(id_trabajo, "foto.json"))
+        self._fijar_estado(id_trabajo, estado="pendiente", progreso=0, etapa="En cola",
+                           archivo=nombre, error=None)
+
+    def iniciar(self, id_trabajo):
+        with self._lock:
+            hilo = self._hilos.get(id_trabajo)
+            if hilo is not None and hilo.is_alive():
+                return
+            hilo = threading.Thread(target=self._ejecutar, args=(id_trabajo,), name=f"cierre-{id_trabajo[:8]}")
+            self._hilos[id_trabajo] = hilo
+        hilo.start()
+
+    def retomar(self):
+        """Lanza los cierres cuya foto sigue en disco (el proceso se cortó antes de terminarlos)."""
+        archivos = os.listdir(self.pendientes)
+        for archivo in archivos:
+            if archivo.endswith(".foto.json"):
+                self.iniciar(archivo[:-len(".foto.json")])
+        # Estado y bloqueo de cierres que terminaron sin alcanzar a borrarlos
+        for archivo in archivos:
+            if archivo.endswith(".estado.json") and self.archivo is not None:
+                id_trabajo = archivo[:-len(".estado.json")]
+                if self.archivo.entrada_trabajo(id_trabajo) is not None:
+                    self._borrar(id_trabajo, "estado.json")
+            elif archivo.endswith(".lock"):
+                id_trabajo = archivo[:-len(".lock")]
+                if f"{id_trabajo}.foto.json" not in archivos:
+                    self._borrar(id_trabajo, "lock")
+
+    def _borrar(self, id_trabajo, sufijo):
+        try:
+            os.remove(self._ruta(id_trabajo, sufijo))
+        except OSError:
+            pass  # Ya no estaba (otro worker) o en Windows sigue abierto
+
+    def _ejecutar(self, id_trabajo):
+        # Un solo worker arma cada cierre: los demás esperan el bloqueo y ya no
+        # encuentran la foto
+        with BloqueoArchivo(self._ruta(id_trabajo, "lock")):
+            ruta_foto = self._ruta(id_trabajo, "foto.json")
+            if not os.path.exists(ruta_foto):
+                return
+            try:
+                with open(ruta_foto, encoding="utf-8") as f:
+                    datos = json.load(f)
+                self._fijar_estado(id_trabajo, estado="en curso", progreso=2, etapa="Leyendo el turno")
+                if "turno" in datos:
+                    foto = foto_turno_cerrado(os.path.join(self.pendientes, datos["turno"]))
+                else:
+                    # Foto guardada antes de la rotación de turnos
+                    foto = FotoTurno.desde_dict(datos["foto"])
+
+                self._fijar_estado(id_trabajo, estado="en curso", progreso=5, etapa="Armando planillas")
+
+                def avance(hechas, total):
+                    self._fijar_estado(id_trabajo, progreso=5 + 80 * hechas // total,
+                                       etapa=f"Armando planillas ({hechas}/{total})")
+
+                if self.archivo is not None:
+                    self.archivo.guardar(foto, datos["archivo"], fecha_cierre(datos["archivo"], ruta_foto),
+                                         id_trabajo=id_trabajo)
+                    # El XLSX se arma ya (queda en la cache) porque es lo primero que se descarga
+                    self.archivo.xlsx(datos["archivo"], avance=avance)
+                else:
+                    from exportar import libro_turno
+
+                    # Planillas estilizadas + Resumen Caja + bloque resumen por boleta
+                    wb = libro_turno(foto, boletas=True, avance=avance)
+                    self._fijar_estado(id_trabajo, progreso=90, etapa="Guardando archivo")
+                    guardar_atomico(wb, os.path.join(self.carpeta, datos["archivo"]), "cierre")
+                os.remove(ruta_foto)
+                prefijo = f"{id_trabajo}.turno."
+                for archivo in os.listdir(self.pendientes):
+                    if archivo.startswith(prefijo):
+                        os.remove(os.path.join(self.pendientes, archivo))
+                self._fijar_estado(id_trabajo, estado="listo", progreso=100, etapa="Listo")
+                print(f"✅ Cierre guardado: {datos['archivo']}")
+            except Exception as e:
+                # La foto queda en disco y se vuelve a intentar con retomar()
+                print(f"❌ Error al armar el cierre {id_trabajo}: {e}")
+                self._fijar_estado(id_trabajo, estado="error", etapa="Error", error=str(e))
+                return
+        # Terminado: sin foto, nadie vuelve a tomar su bloqueo; con el cierre
+        # en el manifest, estado() responde desde ahí
+        self._borrar(id_trabajo, "lock")
+        if self.archivo is not None:
+            self._borrar(id_trabajo, "estado.json")
+        if self.al_terminar is not None:
+            self.al_terminar()
@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+
+
+class Diario:
+    """Diario de escritura anticipada (una línea JSON por registro).
+
+    Cada registro se escribe y se sincroniza con fsync antes de responder
+    al cliente, así una venta confirmada sobrevive a un corte de luz aunque
+    el XLSX todavía no se haya reescrito. Tras un checkpoint el diario se
+    reescribe empezando con {"checkpoint": seq}, lo que permite a otros
+    procesos saber que el XLSX avanzó.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def estado(self):
+        """(inode, tamaño) del archivo, o None si no existe."""
+        try:
+            st = os.stat(self.ruta)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size
+
+    def registrar(self, registro):
+        # Se abre en cada escritura: otro proceso puede haber reemplazado el
+        # archivo en un checkpoint (y en Windows no se puede reemplazar un
+        # archivo abierto).
+        with open(self.ruta, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def leer(self, desde=0):
+        """Registros a partir del byte desde y la posición tras la última línea completa.
+
+        Una última línea incompleta (corte o escritura en curso) no se consume.
+        """
+        if not os.path.exists(self.ruta):
+            return [], 0
+        with open(self.ruta, "rb") as f:
+            f.seek(desde)
+            datos = f.read()
+        registros = []
+        pos = desde
+        for linea in datos.splitlines(keepends=True):
+            if not linea.endswith(b"\n"):
+                break
+            texto = linea.strip()
+            if texto:
+                try:
+                    registros.append(json.loads(texto))
+                except ValueError:
+                    break
+            pos += len(linea)
+        return registros, pos
+
+    def truncar(self, hasta_seq):
+        """Descarta los registros ya incluidos en el checkpoint (seq <= hasta_seq)."""
+        registros, _ = self.leer()
+        pendientes = [r for r in registros if r.get("seq", 0) > hasta_seq]
+        carpeta = os.path.dirname(os.path.abspath(self.ruta))
+        fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=".jsonl", dir=carpeta)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for r in [{"checkpoint": hasta_seq}] + pendientes:
+                f.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.ruta)
+
+    def reiniciar(self, seq):
+        """Deja el diario vacío, empezando con {"checkpoint": seq} (turno nuevo)."""
+        carpeta = os.path.dirname(os.path.abspath(self.ruta))
+        fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=".jsonl", dir=carpeta)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"checkpoint": seq}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.ruta)
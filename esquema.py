@@ -0,0 +1,105 @@
+import os
+
+from archivos import escribir_temporal
+from lectura import leer_libro
+
+# hoja -> encabezado, en el orden de plantilla_base.xlsx. Es la única
+# definición de los encabezados: la usan la inicialización del XLSX, las
+# rutas que crean hojas (asegurar_hoja) y las tablas de LibroSqlite.
+ESQUEMA = {
+    "planilla transacciones": ["Fecha", "Código Autorización Tarjetas", "Nº Interno Software",
+                               "Medio de Pago", "Monto sin Propina", "Propina", "Total con Propina"],
+    "planilla repartos": ["Fecha", "Repartidor", "Dirección", "Monto", "Piso Empresa"],
+    "planilla egresos": ["Fecha", "Motivo", "Valor", "Nº Boleta/Factura"],
+    "planilla mermas": ["Fecha", "Motivo", "Valor"],
+    "planilla desgloses": ["Fecha", "Denominación", "Cantidad", "Total", "Tipo"],
+    "parametros": ["Parametro", "Valor"],
+    "planilla cortesias": ["Fecha", "Monto", "Motivo"],
+    # Se crea con el primer borrado de una venta
+    "Ventas Borradas": ["Fecha Eliminación", "Código Autorización", "N° Interno", "Medio Pago",
+                        "Monto", "Propina", "Total", "Motivo"],
+}
+
+# Hojas que el archivo debe tener siempre
+HOJAS_NECESARIAS = [h for h in ESQUEMA if h != "Ventas Borradas"]
+
+# Hojas con filas del turno (se vacían al cerrar caja)
+HOJAS_PLANILLA = [h for h in HOJAS_NECESARIAS if h != "parametros"]
+
+
+def encabezado(hoja):
+    """Copia del encabezado de la hoja según ESQUEMA."""
+    return list(ESQUEMA[hoja])
+
+
+def _firma(ruta):
+    st = os.stat(ruta)
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class EsquemaArchivo:
+    """Valida que el XLSX tenga las hojas y encabezados de ESQUEMA.
+
+    Solo revisa el archivo si cambió (inodo, mtime o tamaño) desde la
+    última validación, y solo lo reescribe si hace falta migrar: crear el
+    archivo, agregar hojas que faltan o completar un encabezado al que le
+    faltan columnas al final (archivos de versiones anteriores).
+    """
+
+    def __init__(self, ruta, hojas=None):
+        self.ruta = ruta
+        self.hojas = hojas or HOJAS_NECESARIAS
+        self._firma = None
+
+    def pendientes(self):
+        """Lista de (hoja, encabezado actual o None) que hay que migrar."""
+        hojas, _ = leer_libro(self.ruta, self.hojas)
+        pendientes = []
+        for hoja in self.hojas:
+            if hoja not in hojas:
+                pendientes.append((hoja, None))
+                continue
+            actual = list(hojas[hoja][0]) if hojas[hoja] else []
+            while actual and actual[-1] is None:
+                actual.pop()
+            esperado = ESQUEMA[hoja]
+            if actual != esperado:
+                if actual == esperado[:len(actual)]:
+                    pendientes.append((hoja, actual))
+                else:
+                    print(f"⚠️ Encabezado distinto al esquema en '{hoja}': {actual}")
+        return pendientes
+
+    def asegurar(self):
+        """Crea o migra el archivo si hace falta; True si lo reescribió."""
+        from openpyxl import Workbook, load_workbook
+
+        if not os.path.exists(self.ruta):
+            wb = Workbook()
+            wb.remove(wb.active)
+            for hoja in self.hojas:
+                wb.create_sheet(hoja).append(encabezado(hoja))
+            self._reemplazar(wb)
+            print(f"🆕 {self.ruta} creado con {len(self.hojas)} hojas")
+            return True
+
+        if self._firma == _firma(self.ruta):
+            return False
+        pendientes = self.pendientes()
+        if pendientes:
+            wb = load_workbook(self.ruta)
+            for hoja, actual in pendientes:
+                if actual is None:
+                    wb.create_sheet(hoja).append(encabezado(hoja))
+                else:
+                    for col, valor in enumerate(ESQUEMA[hoja][len(actual):], start=len(actual) + 1):
+                        wb[hoja].cell(row=1, column=col, value=valor)
+            self._reemplazar(wb)
+            print(f"🔧 {self.ruta} migrado: {', '.join(h for h, _ in pendientes)}")
+            return True
+        self._firma = _firma(self.ruta)
+        return False
+
+    def _reemplazar(self, wb):
+        os.replace(escribir_temporal(wb, self.ruta, "esquema"), self.ruta)
+        self._firma = _firma(self.ruta)
@@ -0,0 +1,346 @@
+from itertools import chain, zip_longest
+
+from openpyxl import Workbook
+from openpyxl.cell import Cell, WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Border, Side, Alignment, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+from datetime import datetime
+
+from agregados import MEDIOS_VALIDOS, DENOMINACIONES, calcular_resumen, totales_boleta
+from metricas import fase
+
+# -------------- ESTILOS --------------
+# Estilos con nombre: cada celda referencia uno de estos en vez de llevar su
+# propio Font/Border, y el XLSX guarda un único registro por estilo.
+DINERO = '"$"#,##0'
+_BORDE = Border(left=Side(style="thin"), right=Side(style="thin"),
+                top=Side(style="thin"), bottom=Side(style="thin"))
+_RELLENO = PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")
+
+
+def _estilos():
+    estilos = [
+        NamedStyle(name="Gustitos Encabezado", font=Font(bold=True), fill=_RELLENO, border=_BORDE),
+        NamedStyle(name="Gustitos Celda", font=DEFAULT_FONT, border=_BORDE),
+        NamedStyle(name="Gustitos Dinero", font=DEFAULT_FONT, border=_BORDE, number_format=DINERO),
+        NamedStyle(name="Gustitos Dinero sin Borde", font=DEFAULT_FONT, number_format=DINERO),
+        NamedStyle(name="Gustitos Total", font=Font(bold=True), border=_BORDE),
+        NamedStyle(name="Gustitos Total Dinero", font=Font(bold=True), border=_BORDE, number_format=DINERO),
+        NamedStyle(name="Gustitos Turno", font=Font(bold=True, size=14), fill=_RELLENO, border=_BORDE,
+                   alignment=Alignment(horizontal="left", vertical="center")),
+        NamedStyle(name="Gustitos Exportado", font=Font(bold=True, size=12)),
+        NamedStyle(name="Gustitos Titulo Boletas", font=Font(bold=True, size=14), fill=_RELLENO, border=_BORDE),
+        NamedStyle(name="Gustitos Titulo Resumen", font=Font(bold=True, size=16), fill=_RELLENO,
+                   alignment=Alignment(horizontal="center")),
+    ]
+    # Filas finales del RESUMEN DE CAJA: etiqueta / valor, normal o TOTAL
+    for total in (False, True):
+        sufijo = " Total" if total else ""
+        fuente = Font(bold=total, size=13)
+        linea = Border(bottom=Side(style="thin"))
+        estilos.append(NamedStyle(name=f"Gustitos Resumen Etiqueta{sufijo}", font=fuente, border=linea,
+                                  alignment=Alignment(horizontal="left")))
+        estilos.append(NamedStyle(name=f"Gustitos Resumen Valor{sufijo}", font=fuente, border=linea,
+                                  alignment=Alignment(horizontal="right")))
+        estilos.append(NamedStyle(name=f"Gustitos Resumen Dinero{sufijo}", font=fuente, border=linea,
+                                  alignment=Alignment(horizontal="right"), number_format=DINERO))
+    return estilos
+
+
+def _es_numero(valor):
+    return isinstance(valor, (int, float))
+
+
+class _Hoja:
+    """Filas de una hoja como listas de (valor, estilo), antes de escribirlas.
+
+    Lleva la cuenta de columnas usadas igual que ws.max_column, para que los
+    encabezados de sección ocupen el mismo ancho que en el layout original.
+    """
+
+    def __init__(self):
+        self.filas = []
+        self.max_col = 0
+
+    def fila(self, *celdas):
+        self.filas.append(list(celdas))
+        self.max_col = max(self.max_col, len(celdas))
+
+    def rellenar(self, celdas, estilo):
+        """Completa la fila hasta max_col con celdas vacías del estilo dado."""
+        celdas = list(celdas)
+        ancho = max(self.max_col, len(celdas))
+        return celdas + [(None, estilo)] * (ancho - len(celdas))
+
+    def encabezado(self, *textos):
+        self.fila(*self.rellenar([(t, "Gustitos Encabezado") for t in textos], "Gustitos Encabezado"))
+
+    def bordeada(self, *valores, dinero=()):
+        """Fila con borde en todas sus celdas y formato $ en las columnas indicadas (0 = A)."""
+        celdas = [(v, "Gustitos Dinero" if i in dinero else "Gustitos Celda") for i, v in enumerate(valores)]
+        self.fila(*self.rellenar(celdas, "Gustitos Celda"))
+
+
+# -------------- RESUMEN CAJA --------------
+def filas_resumen_caja(agregados, cajero, turno, caja_inicial, exportado=None):
+    """Hoja Resumen Caja a partir de los totales del turno (sin recorrer las planillas).
+
+    exportado es la fecha del encabezado (AAAA-MM-DD HH:MM:SS); por defecto, ahora.
+    """
+    with fase("resumen_caja"):
+        cifras = calcular_resumen(agregados, caja_inicial)
+    pagos_total = cifras["ventas"]
+    h = _Hoja()
+
+    # Encabezado principal (la tercera fila queda vacía, como en el layout original)
+    h.fila((f"Cajero: {cajero}", "Gustitos Turno"))
+    h.fila((f"Turno: {turno}", "Gustitos Turno"))
+    h.fila((None, "Gustitos Turno"))
+    h.fila()
+    exportado = exportado or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    h.fila((f"Resumen Caja - Exportado el {exportado}", "Gustitos Exportado"))
+
+    # -------- DESGLOSE DE VENTAS --------
+    h.fila()
+    h.encabezado("Desglose de Ventas")
+    for medio in MEDIOS_VALIDOS:
+        h.bordeada(medio.capitalize(), pagos_total.get(medio, 0), dinero=(1,))
+
+    # -------- RESUMEN TARJETAS --------
+    h.fila()
+    h.encabezado("Resumen Tarjetas")
+    tarjetas = cifras["tarjetas"]
+    for etiqueta, valor in [("Débito", tarjetas["debito"]), ("Crédito", tarjetas["credito"]),
+                            ("Prepago", tarjetas["prepago"]), ("Total sin Propinas", tarjetas["sin_propinas"]),
+                            ("Total con Propinas", tarjetas["con_propinas"])]:
+        h.fila((etiqueta, None), (valor, "Gustitos Dinero"))
+
+    # -------- RESUMEN EFECTIVO --------
+    h.fila()
+    h.encabezado("Resumen Efectivo")
+    efectivo = cifras["efectivo"]
+    for etiqueta, valor in [("Caja Inicial", caja_inicial), ("Venta Efectivo", efectivo["venta_efectivo"]),
+                            ("Total Egresos Efectivo", efectivo["egresos"]),
+                            ("Total Resumen Efectivo", efectivo["total"])]:
+        h.fila((etiqueta, None), (valor, "Gustitos Dinero"))
+
+    # -------- PROPINAS DETALLADAS --------
+    h.fila()
+    h.encabezado("Propinas por Medio de Pago")
+    for medio, valor in cifras["propinas"].items():
+        h.bordeada(f"Propinas {medio.capitalize()}", valor, dinero=(1,))
+    h.fila(("Total Propinas", "Gustitos Total"), (cifras["total_propinas"], "Gustitos Total Dinero"))
+
+    # -------- DESGLOSES (Caja / Depositar) --------
+    for titulo, desglose, etiqueta_total in [("Desglose Caja", agregados.desg_caja, "Total Caja"),
+                                             ("Desglose Efectivo a Depositar", agregados.desg_dep, "Total a Depositar")]:
+        h.fila()
+        h.encabezado(titulo)
+        h.encabezado("Denominación", "Cantidad", "Total")
+        total_desglose = 0
+        for d in DENOMINACIONES:
+            if desglose[d] > 0:
+                total = d * desglose[d]
+                total_desglose += total
+                h.bordeada(f"${d:,}", desglose[d], total, dinero=(2,))
+        h.fila((etiqueta_total, None), ("", None), (total_desglose, "Gustitos Dinero sin Borde"))
+
+    # -------- REPARTOS (por repartidor + piso) --------
+    h.fila()
+    h.encabezado("Repartos")
+    if cifras["repartos"]:
+        h.encabezado("Repartidor", "Total Repartos", "Piso Empresa", "Total Final")
+        for r in cifras["repartos"]:
+            h.bordeada(r["repartidor"], r["total"], r["piso"], r["total_final"], dinero=(1, 2, 3))
+
+    # -------- TOTAL CAJA (ORDENADO Y DETALLADO) --------
+    h.fila()
+    h.fila(("RESUMEN DE CAJA", "Gustitos Titulo Resumen"))
+    resumen_datos = [
+        ("Caja Inicial", caja_inicial),
+        ("Ventas Totales", cifras["total_ventas"]),
+        ("Egresos", -cifras["egresos"]),
+        ("Cortesías", -cifras["cortesias"]),
+        ("Mermas", -cifras["mermas"]),
+        ("TOTAL CAJA FINAL", cifras["total_caja_final"]),
+        ("", ""),  # Espacio visual
+        ("% Pérdidas sobre Ventas", f"{cifras['porcentaje_perdidas']:.2f}%"),
+    ]
+    h.fila()
+    for label, valor in resumen_datos:
+        sufijo = " Total" if "TOTAL" in label else ""
+        tipo_valor = "Dinero" if _es_numero(valor) else "Valor"
+        h.fila((label, f"Gustitos Resumen Etiqueta{sufijo}"), (valor, f"Gustitos Resumen {tipo_valor}{sufijo}"))
+    return h
+
+
+# -------------- HOJAS DE DETALLE --------------
+def filas_resumen_boletas(boletas, ancho):
+    """Bloque "Resumen por Boleta" para el final de planilla transacciones.
+
+    boletas es {Nº Interno: filas de pago} (repositorio.boletas()).
+    """
+    h = _Hoja()
+    h.max_col = ancho
+    h.fila()
+    h.fila(("Resumen por Boleta", "Gustitos Titulo Boletas"))
+    h.encabezado("Nº Interno", "Total Boleta", "Detalle")
+    for nro, pagos in boletas.items():
+        total, detalle = totales_boleta(pagos)
+        h.bordeada(nro, total, detalle, dinero=(1,))
+    return h
+
+
+def _celdas_detalle(filas, ancho):
+    """Encabezado y filas de una planilla, con borde y formato $ en los números."""
+    encabezado = list(filas[0]) if filas else []
+    yield [(v, "Gustitos Encabezado") for v in encabezado + [None] * (ancho - len(encabezado))]
+    for f in filas[1:]:
+        f = list(f) + [None] * (ancho - len(f))
+        yield [(v, "Gustitos Dinero" if _es_numero(v) else "Gustitos Celda") for v in f]
+
+
+# -------------- ESCRITURA --------------
+class _Estilos:
+    """Estilos con nombre de un workbook, registrados una sola vez.
+
+    Asignar c.style = nombre busca el estilo y arma su StyleArray en cada
+    celda; acá se arma una vez por estilo y las celdas nuevas la copian.
+    """
+
+    def __init__(self, wb):
+        for estilo in _estilos():
+            wb.add_named_style(estilo)
+        self._prototipos = {}
+
+    def celda(self, ws, valor, estilo):
+        prototipo = self._prototipos.get(estilo)
+        if prototipo is None:
+            c = WriteOnlyCell(ws)
+            c.style = estilo
+            prototipo = self._prototipos[estilo] = c._style
+        return Cell(ws, row=1, column=1, value=valor, style_array=prototipo)
+
+
+def _medir(filas):
+    """Una pasada por las filas: ancho máximo, anchos de columna y columnas numéricas."""
+    largos, numericas = [], set()
+    for fila in filas:
+        if len(fila) > len(largos):
+            largos.extend([0] * (len(fila) - len(largos)))
+        for i, v in enumerate(fila):
+            if v is None:
+                continue
+            if _es_numero(v):
+                numericas.add(i)
+            n = len(str(v))
+            if n > largos[i]:
+                largos[i] = n
+    return len(largos), largos, numericas
+
+
+def _anchos(largos, columnas):
+    """Ancho de cada columna: el texto más largo + 3 (como _autoajustar_columnas)."""
+    largos = list(largos) + [0] * (columnas - len(largos))
+    return [n + 3 for n in largos]
+
+
+def _crear_hoja(wb, nombre, anchos):
+    ws = wb.create_sheet(nombre)
+    # En write_only los anchos tienen que fijarse antes de la primera fila
+    for i, ancho in enumerate(anchos, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = ancho
+    return ws
+
+
+def _escribir(ws, estilos, filas_celdas):
+    for celdas in filas_celdas:
+        ws.append([valor if estilo is None else estilos.celda(ws, valor, estilo)
+                   for valor, estilo in celdas])
+
+
+def _escribir_rapido(ws, estilos, filas, ancho):
+    """Encabezado estilizado y filas con valores planos (sin estilo por celda)."""
+    encabezado = list(filas[0]) if filas else []
+    ws.append([estilos.celda(ws, v, "Gustitos Encabezado")
+               for v in encabezado + [None] * (ancho - len(encabezado))])
+    for f in filas[1:]:
+        ws.append(f)
+
+
+def _hoja_resumen(wb, estilos, repositorio, agregados, exportado):
+    resumen = filas_resumen_caja(
+        agregados,
+        repositorio.parametro("cajero") or "No registrado",
+        repositorio.parametro("turno") or "No registrado",
+        repositorio.parametro("caja_inicial") or 0,
+        exportado,
+    )
+    _, largos, _ = _medir([v for v, _ in f] for f in resumen.filas)
+    ws = _crear_hoja(wb, "Resumen Caja", _anchos(largos, resumen.max_col))
+    _escribir(ws, estilos, resumen.filas)
+
+
+def _hoja_detalle(wb, estilos, nombre, filas, boletas, rapido):
+    with fase("hojas_detalle", rapido=rapido):
+        _volcar_detalle(wb, estilos, nombre, filas, boletas, rapido)
+
+
+def _volcar_detalle(wb, estilos, nombre, filas, boletas, rapido):
+    ancho, largos, numericas = _medir(filas)
+    ancho = ancho if filas else 1
+    extra = None
+    if boletas is not None:
+        with fase("resumen_boletas"):
+            extra = filas_resumen_boletas(boletas, ancho)
+    if extra:
+        _, largos_extra, _ = _medir([v for v, _ in f] for f in extra.filas)
+        largos = [max(a, b) for a, b in zip_longest(largos, largos_extra, fillvalue=0)]
+    ws = _crear_hoja(wb, nombre, _anchos(largos, max(ancho, extra.max_col if extra else 0)))
+
+    if rapido:
+        for i in numericas:
+            ws.column_dimensions[get_column_letter(i + 1)].number_format = DINERO
+        _escribir_rapido(ws, estilos, filas, ancho)
+        if extra:
+            _escribir(ws, estilos, extra.filas)
+    else:
+        _escribir(ws, estilos, chain(_celdas_detalle(filas, ancho), extra.filas if extra else []))
+
+
+def libro_turno(repositorio, agregados=None, boletas=False, rapido=False, avance=None, exportado=None):
+    """Workbook write_only con las planillas del turno, estilizadas, más el Resumen Caja.
+
+    Las filas se vuelcan a disco a medida que se escriben (no se crean objetos
+    Cell por cada celda); el archivo se arma al llamar wb.save. Con boletas se
+    agrega el bloque Resumen por Boleta al final de planilla transacciones,
+    como en el archivo de cierre.
+
+    Con rapido las planillas de detalle no llevan borde ni estilo por celda:
+    sólo el encabezado va estilizado y el formato $ queda a nivel de columna
+    (Excel lo aplica a lo que se escriba después en esa columna; los montos
+    exportados se ven como número simple). El Resumen Caja sale igual.
+
+    avance(hechas, total) se llama al terminar cada hoja. exportado fija la
+    fecha del encabezado del Resumen Caja (un cierre que se vuelve a armar
+    mantiene la de su cierre).
+    """
+    if agregados is None:
+        agregados = repositorio.agregados()
+    hojas = repositorio.hojas()
+    hojas.setdefault("Resumen Caja", None)
+
+    wb = Workbook(write_only=True)
+    estilos = _Estilos(wb)
+
+    for hechas, (nombre, filas) in enumerate(hojas.items(), start=1):
+        if nombre == "Resumen Caja":
+            _hoja_resumen(wb, estilos, repositorio, agregados, exportado)
+        else:
+            _hoja_detalle(wb, estilos, nombre, filas,
+                          repositorio.boletas() if boletas and nombre == "planilla transacciones" else None,
+                          rapido)
+        if avance is not None:
+            avance(hechas, len(hojas))
+    return wb
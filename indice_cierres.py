@@ -0,0 +1,345 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from libro_sqlite import TABLAS
+
+# Hojas de detalle que se indexan (todas menos parametros)
+HOJAS_DETALLE = [h for h in TABLAS if h != "parametros"]
+
+# Cifras del RESUMEN DE CAJA: etiqueta en la hoja -> columna en archivos
+CIFRAS = {
+    "Caja Inicial": "caja_inicial",
+    "Ventas Totales": "total_ventas",
+    "Egresos": "egresos",
+    "Cortesías": "cortesias",
+    "Mermas": "mermas",
+    "Total Propinas": "total_propinas",
+    "TOTAL CAJA FINAL": "total_caja_final",
+}
+
+# Fotos comprimidas de los cierres (ver archivo_cierres)
+SNAPSHOTS = ".snapshots"
+EXTENSION_SNAPSHOT = ".json.gz"
+
+_NOMBRE_CIERRE = re.compile(r"(\d{2})-(\d{2})-(\d{4})_(\d{2})-(\d{2})-(\d{2})")
+
+AGRUPACIONES = {
+    "dia": "substr(a.fecha_cierre, 1, 10)",
+    "semana": "strftime('%Y-S%W', a.fecha_cierre)",
+    "mes": "substr(a.fecha_cierre, 1, 7)",
+}
+
+
+# -------------- LECTURA DE UN CIERRE --------------
+def fecha_cierre(nombre, ruta=None):
+    """Fecha del cierre (AAAA-MM-DD HH:MM:SS) según el nombre del archivo, o su mtime."""
+    m = _NOMBRE_CIERRE.search(nombre)
+    if m:
+        d, mes, a, h, mi, s = m.groups()
+        return f"{a}-{mes}-{d} {h}:{mi}:{s}"
+    return datetime.fromtimestamp(os.path.getmtime(ruta)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _numero(valor):
+    return valor if isinstance(valor, (int, float)) else None
+
+
+def _filas_detalle(ws, columnas):
+    """Filas de datos hasta la primera fila vacía (en transacciones sigue el Resumen por Boleta)."""
+    filas = ws.iter_rows(min_row=2, values_only=True)
+    for fila in filas:
+        if fila is None or all(v is None or v == "" for v in fila):
+            break
+        fila = list(fila[:columnas]) + [None] * (columnas - len(fila))
+        yield [v.strftime("%Y-%m-%d %H:%M:%S") if isinstance(v, datetime) else v for v in fila]
+
+
+def _cifras_resumen(ws):
+    """Cajero, turno y cifras del bloque RESUMEN DE CAJA (gana la última aparición de cada etiqueta)."""
+    datos = {}
+    for fila in ws.iter_rows(values_only=True):
+        if not fila or fila[0] is None:
+            continue
+        etiqueta = str(fila[0]).strip()
+        if etiqueta.startswith("Cajero:"):
+            datos["cajero"] = etiqueta.split(":", 1)[1].strip()
+        elif etiqueta.startswith("Turno:"):
+            datos["turno"] = etiqueta.split(":", 1)[1].strip()
+        elif etiqueta in CIFRAS and len(fila) > 1 and _numero(fila[1]) is not None:
+            datos[CIFRAS[etiqueta]] = fila[1]
+    # En el resumen final egresos, cortesías y mermas van en negativo
+    for campo in ("egresos", "cortesias", "mermas"):
+        if campo in datos:
+            datos[campo] = abs(datos[campo])
+    return datos
+
+
+def leer_cierre(ruta):
+    """Lee un archivo de cierre en modo read_only y devuelve sus filas normalizadas.
+
+    {"nombre", "fecha_cierre", "resumen": {cajero, turno, cifras...},
+     "hojas": {hoja: [filas en el orden de TABLAS]}}
+    """
+    from openpyxl import load_workbook
+
+    nombre = os.path.basename(ruta)
+    wb = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        hojas = {}
+        for hoja in HOJAS_DETALLE:
+            if hoja in wb.sheetnames:
+                hojas[hoja] = list(_filas_detalle(wb[hoja], len(TABLAS[hoja][1])))
+        resumen = _cifras_resumen(wb["Resumen Caja"]) if "Resumen Caja" in wb.sheetnames else {}
+    finally:
+        wb.close()
+    return {"nombre": nombre, "fecha_cierre": fecha_cierre(nombre, ruta), "resumen": resumen, "hojas": hojas}
+
+
+def _hash(ruta):
+    h = hashlib.sha1()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def procesar_cierre(ruta, hash_previo=None):
+    """Hash y lectura de un cierre (XLSX o foto comprimida); si el hash coincide con hash_previo no se abre.
+
+    Es una función de módulo para poder ejecutarla en los procesos del pool.
+    """
+    st = os.stat(ruta)
+    digest = _hash(ruta)
+    if digest == hash_previo:
+        return {"sin_cambios": True, "mtime": st.st_mtime, "tamano": st.st_size}
+    if ruta.endswith(EXTENSION_SNAPSHOT):
+        from archivo_cierres import cierre_desde_snapshot
+        datos = cierre_desde_snapshot(ruta)
+    else:
+        datos = leer_cierre(ruta)
+    datos.update(mtime=st.st_mtime, tamano=st.st_size, hash=digest)
+    return datos
+
+
+def _procesar_todos(tareas, procesos):
+    """(ruta, datos o la excepción) de cada tarea, en el orden en que terminan."""
+    if procesos <= 1 or len(tareas) <= 1:
+        for ruta, hash_previo in tareas:
+            try:
+                yield ruta, procesar_cierre(ruta, hash_previo)
+            except Exception as e:
+                yield ruta, e
+        return
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        futuros = {pool.submit(procesar_cierre, ruta, hash_previo): ruta for ruta, hash_previo in tareas}
+        for futuro in as_completed(futuros):
+            try:
+                yield futuros[futuro], futuro.result()
+            except Exception as e:
+                yield futuros[futuro], e
+
+
+# -------------- ÍNDICE --------------
+class IndiceCierres:
+    """Índice SQLite de los archivos de cierre para consultas entre turnos.
+
+    Cada cierre se lee una sola vez: se guardan sus cifras del Resumen Caja,
+    las filas de detalle y los totales por medio de pago. actualizar() solo
+    vuelve a abrir un archivo si cambió su mtime/tamaño y además su hash.
+    """
+
+    def __init__(self, ruta, carpeta):
+        self.ruta = ruta
+        self.carpeta = carpeta
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._tablas_listas = False
+
+    def _conexion(self):
+        # La base se abre con la primera consulta (no al crear el índice), así
+        # un proceso que después hace fork (gunicorn --preload) no comparte conexión
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.ruta, timeout=30)
+            con.execute("PRAGMA journal_mode=WAL")
+            self._local.con = con
+            if not self._tablas_listas:
+                self._crear_tablas(con)
+        return con
+
+    def _crear_tablas(self, con):
+        with con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS archivos ("
+                "id INTEGER PRIMARY KEY, nombre TEXT UNIQUE NOT NULL, mtime REAL, tamano INTEGER, hash TEXT, "
+                "fecha_cierre TEXT, cajero TEXT, turno TEXT, "
+                + ", ".join(f"{c} REAL" for c in CIFRAS.values()) + ")"
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS ix_archivos_fecha ON archivos (fecha_cierre)")
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS medios ("
+                "archivo INTEGER, medio TEXT, ventas REAL, propinas REAL, filas INTEGER)"
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS ix_medios_archivo ON medios (archivo)")
+            for hoja in HOJAS_DETALLE:
+                tabla, columnas = TABLAS[hoja]
+                cols = ", ".join(c for c, _ in columnas)
+                con.execute(f"CREATE TABLE IF NOT EXISTS {tabla} (archivo INTEGER, {cols})")
+                con.execute(f"CREATE INDEX IF NOT EXISTS ix_{tabla}_archivo ON {tabla} (archivo)")
+        self._tablas_listas = True
+
+    # -------------- ACTUALIZACIÓN --------------
+    def actualizar(self, procesos=1, forzar=False):
+        """Indexa los cierres nuevos o modificados y olvida los borrados.
+
+        Con procesos > 1 el hash y la lectura de los XLSX se reparten en un
+        ProcessPoolExecutor; la escritura en el índice queda en este proceso.
+        forzar vuelve a leer todos los archivos. Devuelve [(nombre, filas)]
+        de los cierres indexados.
+        """
+        with self._lock:
+            con = self._conexion()
+            conocidos = {n: (i, m, t, h) for i, n, m, t, h in
+                         con.execute("SELECT id, nombre, mtime, tamano, hash FROM archivos")}
+            presentes = set()
+            tareas = []
+            cierres = self._cierres()
+            for nombre, ruta in sorted(cierres.items()):
+                presentes.add(nombre)
+                previo = conocidos.get(nombre)
+                if previo and not forzar:
+                    st = os.stat(ruta)
+                    if (previo[1], previo[2]) == (st.st_mtime, st.st_size):
+                        continue
+                tareas.append((ruta, None if forzar or not previo else previo[3]))
+
+            with con:
+                for nombre in set(conocidos) - presentes:
+                    self._borrar(con, conocidos[nombre][0])
+
+            indexados = []
+            nombres = {ruta: nombre for nombre, ruta in cierres.items()}
+            for ruta, datos in _procesar_todos(tareas, procesos):
+                nombre = nombres.get(ruta, os.path.basename(ruta))
+                if isinstance(datos, Exception):
+                    print(f"⚠️ No se pudo indexar {nombre}: {datos}")
+                elif datos.get("sin_cambios"):
+                    # Solo cambió el mtime (copia, touch): se actualiza sin releer
+                    with con:
+                        con.execute("UPDATE archivos SET mtime = ?, tamano = ? WHERE nombre = ?",
+                                    (datos["mtime"], datos["tamano"], nombre))
+                else:
+                    self.guardar(datos, datos["mtime"], datos["tamano"], datos["hash"])
+                    indexados.append((nombre, sum(len(f) for f in datos["hojas"].values())))
+            if indexados:
+                print(f"📇 Cierres indexados: {len(indexados)}")
+            return indexados
+
+    def _cierres(self):
+        """{nombre del cierre: ruta} de los XLSX de la carpeta y las fotos comprimidas (estas ganan)."""
+        cierres = {}
+        for nombre in os.listdir(self.carpeta):
+            if nombre.lower().endswith(".xlsx") and not nombre.startswith("."):
+                cierres[nombre] = os.path.join(self.carpeta, nombre)
+        carpeta_snapshots = os.path.join(self.carpeta, SNAPSHOTS)
+        if os.path.isdir(carpeta_snapshots):
+            for nombre in os.listdir(carpeta_snapshots):
+                if nombre.endswith(EXTENSION_SNAPSHOT) and not nombre.startswith("."):
+                    cierres[nombre[:-len(EXTENSION_SNAPSHOT)] + ".xlsx"] = os.path.join(carpeta_snapshots, nombre)
+        return cierres
+
+    def guardar(self, datos, mtime, tamano, digest):
+        """Reemplaza en el índice el cierre leído con leer_cierre."""
+        con = self._conexion()
+        with con:
+            previo = con.execute("SELECT id FROM archivos WHERE nombre = ?", (datos["nombre"],)).fetchone()
+            if previo:
+                self._borrar(con, previo[0])
+            resumen = datos["resumen"]
+            campos = ["nombre", "mtime", "tamano", "hash", "fecha_cierre", "cajero", "turno"] + list(CIFRAS.values())
+            valores = [datos["nombre"], mtime, tamano, digest, datos["fecha_cierre"],
+                       resumen.get("cajero"), resumen.get("turno")] + [resumen.get(c) for c in CIFRAS.values()]
+            id_archivo = con.execute(
+                f"INSERT INTO archivos ({', '.join(campos)}) VALUES ({', '.join('?' * len(campos))})", valores
+            ).lastrowid
+
+            for hoja, filas in datos["hojas"].items():
+                tabla, columnas = TABLAS[hoja]
+                cols = ", ".join(c for c, _ in columnas)
+                con.executemany(
+                    f"INSERT INTO {tabla} (archivo, {cols}) VALUES (?, {', '.join('?' * len(columnas))})",
+                    ([id_archivo] + f for f in filas),
+                )
+
+            medios = {}
+            for f in datos["hojas"].get("planilla transacciones", []):
+                medio = str(f[3] or "").lower().strip()
+                m = medios.setdefault(medio, [0.0, 0.0, 0])
+                m[0] += _numero(f[6]) or 0
+                m[1] += _numero(f[5]) or 0
+                m[2] += 1
+            con.executemany("INSERT INTO medios (archivo, medio, ventas, propinas, filas) VALUES (?, ?, ?, ?, ?)",
+                            [(id_archivo, medio, v, p, n) for medio, (v, p, n) in medios.items()])
+
+    @staticmethod
+    def _borrar(con, id_archivo):
+        for hoja in HOJAS_DETALLE:
+            con.execute(f"DELETE FROM {TABLAS[hoja][0]} WHERE archivo = ?", (id_archivo,))
+        con.execute("DELETE FROM medios WHERE archivo = ?", (id_archivo,))
+        con.execute("DELETE FROM archivos WHERE id = ?", (id_archivo,))
+
+    # -------------- CONSULTAS --------------
+    def por_archivo(self):
+        """{nombre: {fecha_cierre, cajero, turno, cifras...}} de todos los cierres indexados."""
+        con = self._conexion()
+        cursor = con.execute(f"SELECT nombre, fecha_cierre, cajero, turno, {', '.join(CIFRAS.values())} FROM archivos")
+        columnas = [d[0] for d in cursor.description]
+        return {fila[0]: dict(zip(columnas[1:], fila[1:])) for fila in cursor}
+
+    def filas_detalle(self, hoja):
+        """(archivo, fecha_cierre, columnas de la hoja...) de todos los cierres, en orden cronológico."""
+        tabla, columnas = TABLAS[hoja]
+        cols = ", ".join(f"t.{c}" for c, _ in columnas)
+        return self._conexion().execute(
+            f"SELECT a.nombre, a.fecha_cierre, {cols} FROM {tabla} t JOIN archivos a ON a.id = t.archivo "
+            f"ORDER BY a.fecha_cierre, t.rowid"
+        )
+
+    def resumen(self, desde=None, hasta=None, agrupar="dia"):
+        """Totales por período (dia, semana o mes) de los cierres entre desde y hasta (AAAA-MM-DD, inclusivas)."""
+        periodo = AGRUPACIONES[agrupar]
+        filtro, params = [], []
+        if desde:
+            filtro.append("a.fecha_cierre >= ?")
+            params.append(desde)
+        if hasta:
+            filtro.append("a.fecha_cierre < ?")
+            params.append(hasta + "\uffff")
+        where = f"WHERE {' AND '.join(filtro)}" if filtro else ""
+        con = self._conexion()
+
+        periodos = {}
+        for fila in con.execute(
+            f"SELECT {periodo} AS periodo, COUNT(*), SUM(total_ventas), SUM(egresos), SUM(cortesias), "
+            f"SUM(mermas), SUM(total_propinas), SUM(total_caja_final) "
+            f"FROM archivos a {where} GROUP BY periodo ORDER BY periodo", params
+        ):
+            periodos[fila[0]] = {
+                "periodo": fila[0], "cierres": fila[1], "total_ventas": fila[2] or 0,
+                "egresos": fila[3] or 0, "cortesias": fila[4] or 0, "mermas": fila[5] or 0,
+                "total_propinas": fila[6] or 0, "total_caja_final": fila[7] or 0,
+                "ventas": {}, "propinas": {},
+            }
+        for p, medio, ventas, propinas in con.execute(
+            f"SELECT {periodo} AS periodo, m.medio, SUM(m.ventas), SUM(m.propinas) "
+            f"FROM medios m JOIN archivos a ON a.id = m.archivo {where} GROUP BY periodo, m.medio", params
+        ):
+            periodos[p]["ventas"][medio] = ventas
+            if propinas:
+                periodos[p]["propinas"][medio] = propinas
+        return list(periodos.values())
@@ -0,0 +1,197 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+
+def _clave(valor):
+    return " ".join(str(valor).split()).lower() if valor is not None else ""
+
+
+def _orden(valor):
+    # Números antes que textos, vacíos al final; así se puede ordenar una columna mixta
+    if valor is None or valor == "":
+        return (2, "")
+    if isinstance(valor, (int, float)):
+        return (0, valor)
+    return (1, str(valor).lower())
+
+
+class IndicePlanilla:
+    """Índices en memoria de una planilla para filtrar, ordenar y paginar.
+
+    Guarda una copia de las filas y, por cada columna de filtro, las
+    posiciones de las filas con cada valor; la fecha va en una lista
+    ordenada para los rangos. Las altas solo agregan las filas nuevas al
+    índice; un borrado o edición (cambia la versión de la hoja) lo rearma.
+    Junto a cada fila se guarda su id en el repositorio, que es lo que usan
+    las rutas (no cambia aunque se borren otras filas).
+    """
+
+    def __init__(self, hoja, filtros, ordenes, columna_fecha=0):
+        self.hoja = hoja
+        self.filtros = filtros          # nombre del filtro -> columna
+        self.ordenes = ordenes          # nombre del orden -> columna
+        self.columna_fecha = columna_fecha
+        self._lock = threading.Lock()
+        self._limpiar(None)
+
+    def _limpiar(self, version):
+        self.version = version
+        self.filas = []
+        self.ids = []
+        self.valores = {nombre: {} for nombre in self.filtros}
+        self.fechas = []                # (fecha, posición), ordenada
+        self._ordenados = {}            # nombre del orden -> posiciones ordenadas (cache)
+
+    def _agregar(self, filas):
+        for id_fila, fila in filas:
+            pos = len(self.filas)
+            self.ids.append(id_fila)
+            self.filas.append(fila)
+            for nombre, col in self.filtros.items():
+                valor = fila[col] if len(fila) > col else None
+                self.valores[nombre].setdefault(_clave(valor), []).append(pos)
+            fecha = fila[self.columna_fecha] if len(fila) > self.columna_fecha else None
+            insort(self.fechas, (str(fecha or ""), pos))
+        if filas:
+            self._ordenados = {}
+
+    # -------------- ACTUALIZACIÓN --------------
+    def actualizar(self, repositorio):
+        """Pone el índice al día con el repositorio (solo lee las filas nuevas si no hubo borrados ni ediciones)."""
+        with self._lock:
+            while True:
+                version = repositorio.version(self.hoja)
+                if version != self.version:
+                    self._limpiar(version)
+                nuevas = repositorio.filas_ids(self.hoja, despues_de=self.ids[-1] if self.ids else 0)
+                if repositorio.version(self.hoja) == version:
+                    break
+                # Un borrado o edición entró mientras se leía: se rearma
+                self.version = None
+            self._agregar(nuevas)
+
+    # -------------- CONSULTA --------------
+    def consultar(self, filtros=None, desde=None, hasta=None, orden=None, descendente=False,
+                  pagina=1, por_pagina=50):
+        """Página de filas que cumplen los filtros.
+
+        filtros es {nombre: valor} (comparación sin mayúsculas ni espacios);
+        desde/hasta son fechas "AAAA-MM-DD" inclusivas. Devuelve un dict con
+        "filas" como lista de (id, fila), "total", "pagina", "paginas" y la
+        "version" de la hoja con la que se armó.
+        """
+        with self._lock:
+            candidatas = None
+            for nombre, valor in (filtros or {}).items():
+                if nombre not in self.filtros or valor in (None, ""):
+                    continue
+                posiciones = set(self.valores[nombre].get(_clave(valor), ()))
+                candidatas = posiciones if candidatas is None else candidatas & posiciones
+
+            if desde or hasta:
+                inicio = bisect_left(self.fechas, (desde or "",))
+                fin = bisect_right(self.fechas, ((hasta or "9999-12-31") + "\uffff",))
+                posiciones = {pos for _, pos in self.fechas[inicio:fin]}
+                candidatas = posiciones if candidatas is None else candidatas & posiciones
+
+            if orden in self.ordenes:
+                secuencia = self._ordenadas(orden)
+                if descendente:
+                    secuencia = reversed(secuencia)
+            else:
+                secuencia = range(len(self.filas) - 1, -1, -1) if descendente else range(len(self.filas))
+            if candidatas is not None:
+                secuencia = (pos for pos in secuencia if pos in candidatas)
+            posiciones = list(secuencia)
+
+            total = len(posiciones)
+            paginas = max(1, -(-total // por_pagina))
+            pagina = min(max(1, pagina), paginas)
+            inicio = (pagina - 1) * por_pagina
+            return {
+                "filas": [(self.ids[pos], list(self.filas[pos])) for pos in posiciones[inicio:inicio + por_pagina]],
+                "total": total,
+                "registradas": len(self.filas),
+                "pagina": pagina,
+                "paginas": paginas,
+                "por_pagina": por_pagina,
+                "version": self.version,
+            }
+
+    def _ordenadas(self, orden):
+        if orden not in self._ordenados:
+            col = self.ordenes[orden]
+            self._ordenados[orden] = sorted(
+                range(len(self.filas)),
+                key=lambda pos: _orden(self.filas[pos][col] if len(self.filas[pos]) > col else None),
+            )
+        return self._ordenados[orden]
+
+
+def clave_boleta(valor):
+    """Nº Interno como clave del índice de boletas ("" si la fila no tiene)."""
+    return str(valor).strip() if valor not in (None, "") else ""
+
+
+class IndiceBoletas:
+    """Pagos de cada boleta (Nº Interno -> filas de planilla transacciones).
+
+    Se mantiene igual que AgregadosCaja: cada alta, baja o edición de la
+    planilla llega por sumar/restar/reemplazar, así saber si una boleta ya
+    existe o armar el Resumen por Boleta no recorre la planilla. Las boletas
+    quedan en el orden en que se registró su primer pago.
+    """
+
+    HOJA = "planilla transacciones"
+
+    def __init__(self):
+        self.boletas = {}
+
+    # -------------- ACTUALIZACIÓN --------------
+    def sumar(self, hoja, fila):
+        nro = clave_boleta(fila[2]) if hoja == self.HOJA and len(fila) > 2 else ""
+        if nro:
+            self.boletas.setdefault(nro, []).append(list(fila))
+
+    def restar(self, hoja, fila):
+        nro = clave_boleta(fila[2]) if hoja == self.HOJA and len(fila) > 2 else ""
+        pagos = self.boletas.get(nro)
+        if not pagos:
+            return
+        for i, pago in enumerate(pagos):
+            if pago == list(fila):
+                del pagos[i]
+                break
+        if not pagos:
+            del self.boletas[nro]
+
+    def reemplazar(self, hoja, anterior, nueva):
+        if hoja != self.HOJA:
+            return
+        pagos = self.boletas.get(clave_boleta(anterior[2]) if len(anterior) > 2 else "")
+        if len(nueva) > 2 and clave_boleta(nueva[2]) == clave_boleta(anterior[2]) and pagos:
+            # Misma boleta: el pago queda en su lugar
+            for i, pago in enumerate(pagos):
+                if pago == list(anterior):
+                    pagos[i] = list(nueva)
+                    return
+        self.restar(hoja, anterior)
+        self.sumar(hoja, nueva)
+
+    # -------------- CONSULTA --------------
+    def boleta(self, nro):
+        """Copia de los pagos de la boleta ([] si no está registrada)."""
+        return [list(f) for f in self.boletas.get(clave_boleta(nro), [])]
+
+    def copia(self):
+        """{Nº Interno: pagos} con listas nuevas."""
+        return {nro: [list(f) for f in pagos] for nro, pagos in self.boletas.items()}
+
+    @classmethod
+    def desde_filas(cls, filas):
+        """Índice armado desde las filas de planilla transacciones (sin encabezado)."""
+        indice = cls()
+        for fila in filas:
+            if fila:
+                indice.sumar(cls.HOJA, fila)
+        return indice
@@ -0,0 +1,107 @@
+import csv
+import io
+import math
+
+from agregados import MEDIOS_VALIDOS
+from indices import clave_boleta
+
+# Columnas del CSV de ventas (una fila por pago; las filas con el mismo Nº Interno son una boleta)
+COLUMNAS_CSV = ["numero_interno", "codigo_autorizacion", "medio", "monto", "propina", "fecha"]
+
+
+class VentaInvalida(ValueError):
+    """Venta del lote que no se puede registrar (el mensaje va en el reporte de errores)."""
+
+
+def filas_venta(fecha, numero_interno, codigo_autorizacion, pagos):
+    """Filas de planilla transacciones de una boleta; pagos es [(medio, monto, propina)]."""
+    filas = []
+    for medio, monto, propina in pagos:
+        filas.append([
+            fecha,
+            codigo_autorizacion if medio.lower() in ("debito", "credito") else "",
+            numero_interno,
+            medio.lower(),
+            monto,
+            propina,
+            monto + propina,
+        ])
+    return filas
+
+
+def _numero(valor, campo):
+    try:
+        numero = float(valor or 0)
+    except (TypeError, ValueError):
+        raise VentaInvalida(f"{campo} no es un número: {valor!r}")
+    if not math.isfinite(numero) or numero < 0:
+        raise VentaInvalida(f"{campo} no válido: {valor!r}")
+    return numero
+
+
+def validar_venta(venta, fecha):
+    """(Nº Interno, filas) de una venta del lote; VentaInvalida si algún dato no sirve.
+
+    venta es {"numero_interno", "codigo_autorizacion", "pagos": [{"medio",
+    "monto", "propina"}], "fecha" (opcional), "pago_adicional" (opcional)}.
+    """
+    if not isinstance(venta, dict):
+        raise VentaInvalida("la venta debe ser un objeto")
+    nro = clave_boleta(venta.get("numero_interno"))
+    if not nro:
+        raise VentaInvalida("falta numero_interno")
+    pagos = venta.get("pagos")
+    if not pagos or not isinstance(pagos, list):
+        raise VentaInvalida("la venta no trae pagos")
+    normalizados = []
+    for pago in pagos:
+        if not isinstance(pago, dict):
+            raise VentaInvalida(f"cada pago debe ser un objeto: {pago!r}")
+        medio = str(pago.get("medio") or "").strip().lower()
+        if medio not in MEDIOS_VALIDOS:
+            raise VentaInvalida(f"medio de pago no válido: {medio or '(vacío)'}")
+        normalizados.append((medio, _numero(pago.get("monto"), "monto"), _numero(pago.get("propina"), "propina")))
+    codigo = str(venta.get("codigo_autorizacion") or "").strip()
+    return nro, filas_venta(str(venta.get("fecha") or fecha), nro, codigo, normalizados)
+
+
+def venta_desde_formulario(form):
+    """Venta (mismo formato que el JSON) desde los campos del formulario de agregar_venta."""
+    pagos = [
+        {"medio": medio, "monto": monto, "propina": propina}
+        for medio, monto, propina in zip(form.getlist("medio_pago[]"), form.getlist("monto_pago[]"),
+                                         form.getlist("propina_pago[]"))
+    ]
+    return {
+        "numero_interno": form.get("numero_interno", ""),
+        "codigo_autorizacion": form.get("codigo_autorizacion", ""),
+        "pagos": pagos,
+        "pago_adicional": bool(form.get("pago_adicional")),
+    }
+
+
+def ventas_desde_csv(texto):
+    """Lista de ventas (mismo formato que el JSON) a partir de un CSV con COLUMNAS_CSV.
+
+    Las filas consecutivas con el mismo Nº Interno se juntan en una venta;
+    cada venta recuerda la línea del CSV donde empieza (para los errores).
+    """
+    lector = csv.DictReader(io.StringIO(texto))
+    faltan = [c for c in ("numero_interno", "medio", "monto") if c not in (lector.fieldnames or [])]
+    if faltan:
+        raise VentaInvalida(f"faltan columnas en el CSV: {', '.join(faltan)}")
+    ventas = []
+    for fila in lector:
+        nro = clave_boleta(fila.get("numero_interno"))
+        pago = {"medio": fila.get("medio"), "monto": fila.get("monto"), "propina": fila.get("propina")}
+        if ventas and nro and clave_boleta(ventas[-1]["numero_interno"]) == nro:
+            ventas[-1]["pagos"].append(pago)
+            continue
+        ventas.append({
+            "numero_interno": nro,
+            "codigo_autorizacion": fila.get("codigo_autorizacion"),
+            "fecha": fila.get("fecha") or None,
+            "pagos": [pago],
+            "linea": lector.line_num,
+        })
+    return ventas
@@ -0,0 +1,86 @@
+import os
+import threading
+from collections import OrderedDict
+
+from metricas import fase
+
+# ruta -> (firma, {hoja: filas}, nombres de hojas, propiedades), los usados
+# más recientemente al final. Se guardan a lo más MAXIMO_ARCHIVOS: quien se
+# queda con las filas (LibroCaja) las lee con olvidar=True.
+MAXIMO_ARCHIVOS = 4
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _firma(ruta):
+    st = os.stat(ruta)
+    return st.st_mtime_ns, st.st_size
+
+
+def _abrir(ruta):
+    # openpyxl se importa con el primer libro que se lee, no al importar el módulo
+    from openpyxl import load_workbook
+    return load_workbook(ruta, read_only=True)
+
+
+def _filas(ws):
+    return [tuple(row) for row in ws.iter_rows(values_only=True) if any(v is not None for v in row)]
+
+
+def _entrada(ruta):
+    """Entrada de cache vigente para ruta (se descarta si cambió mtime o tamaño)."""
+    firma = _firma(ruta)
+    entrada = _cache.get(ruta)
+    if entrada is None or entrada[0] != firma:
+        entrada = (firma, {}, None, None)
+        _cache[ruta] = entrada
+    _cache.move_to_end(ruta)
+    while len(_cache) > MAXIMO_ARCHIVOS:
+        _cache.popitem(last=False)
+    return entrada
+
+
+def leer_libro(ruta, hojas=None, olvidar=False):
+    """Lee un XLSX en modo read_only (solo valores) y devuelve ({hoja: filas}, propiedades).
+
+    Solo se parsean las hojas pedidas (todas si hojas es None); las filas
+    vacías se omiten y cada fila es una lista nueva que el llamador puede
+    modificar. Lo leído queda en cache hasta que cambie el mtime o el
+    tamaño del archivo, así releer sin escrituras de por medio no cuesta.
+    Con olvidar=True el archivo sale de la cache (el llamador se queda con
+    su copia). propiedades son las custom doc properties como {nombre: valor}.
+    """
+    with _lock:
+        firma, leidas, nombres, propiedades = _entrada(ruta)
+        if nombres is None or any(h not in leidas for h in (hojas if hojas is not None else nombres)
+                                  if h in nombres):
+            with fase("carga_libro"):
+                wb = _abrir(ruta)
+                try:
+                    nombres = list(wb.sheetnames)
+                    propiedades = {p.name: p.value for p in wb.custom_doc_props}
+                    for nombre in (hojas if hojas is not None else nombres):
+                        if nombre not in leidas and nombre in wb.sheetnames:
+                            leidas[nombre] = _filas(wb[nombre])
+                finally:
+                    wb.close()
+            _cache[ruta] = (firma, leidas, nombres, propiedades)
+        if olvidar:
+            _cache.pop(ruta, None)
+        pedidas = hojas if hojas is not None else nombres
+        return ({h: [list(f) for f in leidas[h]] for h in pedidas if h in leidas}, dict(propiedades))
+
+
+def nombres_hojas(ruta):
+    """Nombres de las hojas del XLSX (sin leer sus filas)."""
+    with _lock:
+        firma, leidas, nombres, propiedades = _entrada(ruta)
+        if nombres is None:
+            wb = _abrir(ruta)
+            try:
+                nombres = list(wb.sheetnames)
+                propiedades = {p.name: p.value for p in wb.custom_doc_props}
+            finally:
+                wb.close()
+            _cache[ruta] = (firma, leidas, nombres, propiedades)
+        return list(nombres)
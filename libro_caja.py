@@ -0,0 +1,630 @@
+import io
+import json
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from agregados import AgregadosCaja, clave_repartidor
+from archivos import BloqueoArchivo, enlazar, escribir_temporal, guardar_bytes_atomico
+from diario import Diario
+from esquema import ESQUEMA, HOJAS_NECESARIAS, HOJAS_PLANILLA
+from indices import IndiceBoletas
+from lectura import leer_libro
+from metricas import contar, fase
+from repositorio import ENVIOS_RECORDADOS, RepositorioCaja
+
+# Propiedades personalizadas del XLSX: último seq del diario ya incluido,
+# versión de cada hoja, los totales del turno a la fecha del checkpoint, los
+# ids de las filas borradas (el XLSX se guarda sin ellas; al cargarlo se
+# vuelven a poner las lápidas para que los ids de las demás no cambien) y los
+# últimos envíos registrados ([[id_envio, resultado], ...], del más viejo al más nuevo)
+PROP_SEQ = "gustitos_diario_seq"
+PROP_VERSIONES = "gustitos_versiones"
+PROP_AGREGADOS = "gustitos_agregados"
+PROP_BORRADAS = "gustitos_borradas"
+PROP_ENVIOS = "gustitos_envios"
+
+# Parámetros con los que empieza cada turno (los que deja reiniciar_turno)
+PARAMETROS_TURNO_NUEVO = [["caja_inicial", 0], ["cajero", None], ["turno", None], ["id_turno", None]]
+
+
+def _propiedades(seq, versiones, agregados, borradas, envios):
+    from openpyxl.packaging.custom import IntProperty, StringProperty
+
+    return [
+        IntProperty(name=PROP_SEQ, value=seq),
+        StringProperty(name=PROP_VERSIONES, value=json.dumps(versiones)),
+        StringProperty(name=PROP_AGREGADOS, value=json.dumps(agregados)),
+        StringProperty(name=PROP_BORRADAS, value=json.dumps(borradas)),
+        StringProperty(name=PROP_ENVIOS, value=json.dumps(list(envios.items()))),
+    ]
+
+
+def _hojas_turno_nuevo():
+    """Hojas de un turno vacío: encabezados de ESQUEMA y los parámetros iniciales."""
+    hojas = {hoja: [list(ESQUEMA[hoja])] for hoja in HOJAS_NECESARIAS}
+    hojas["parametros"].extend(list(p) for p in PARAMETROS_TURNO_NUEVO)
+    return hojas
+
+
+def _con_propiedades(xlsx, propiedades):
+    """Copia de un XLSX (bytes) con otras custom doc properties (solo se reescribe docProps/custom.xml)."""
+    from openpyxl.packaging.custom import CustomPropertyList
+    from openpyxl.xml.functions import tostring
+
+    lista = CustomPropertyList()
+    for propiedad in propiedades:
+        lista.append(propiedad)
+    salida = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(xlsx)) as origen, \
+            zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as destino:
+        for item in origen.infolist():
+            datos = tostring(lista.to_tree()) if item.filename == "docProps/custom.xml" else origen.read(item)
+            destino.writestr(item, datos)
+    return salida.getvalue()
+
+
+def _vivas(filas):
+    """Filas de datos de una hoja en memoria, sin encabezado ni lápidas."""
+    return [f for f in filas[1:] if f is not None]
+
+
+def _con_lapidas(filas, borradas):
+    """Hoja compactada del checkpoint con las lápidas (None) de vuelta en sus ids."""
+    if not borradas:
+        return filas
+    borradas = set(borradas)
+    vivas = iter(filas[1:])
+    return filas[:1] + [None if id_fila in borradas else next(vivas)
+                        for id_fila in range(2, len(filas) + len(borradas) + 1)]
+
+
+def _id_en_posicion(filas, indice):
+    """Id de la fila que estaba en esa posición del Excel (registros del diario anteriores a los ids)."""
+    posicion = 1
+    for i, fila in enumerate(filas[1:], start=2):
+        if fila is not None:
+            posicion += 1
+            if posicion == indice:
+                return i
+    return None
+
+
+def _seq_en_archivo(ruta):
+    """Lee PROP_SEQ de docProps/custom.xml sin cargar el libro completo."""
+    try:
+        with zipfile.ZipFile(ruta) as z:
+            xml = z.read("docProps/custom.xml").decode("utf-8")
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return 0
+    m = re.search(rf'name="{PROP_SEQ}"[^>]*>\s*<vt:\w+>(\d+)<', xml)
+    return int(m.group(1)) if m else 0
+
+
+def totales_guardados(ruta, ruta_diario=None):
+    """(AgregadosCaja, {parámetro: valor}) del último checkpoint, sin cargar las planillas.
+
+    Solo lee la hoja parametros y las propiedades del XLSX. Devuelve None si
+    el diario tiene cambios posteriores al checkpoint (hay que cargar el libro).
+    """
+    if not os.path.exists(ruta):
+        return None
+    hojas, propiedades = leer_libro(ruta, ["parametros"])
+    if not propiedades.get(PROP_AGREGADOS):
+        return None
+    registros, _ = Diario(ruta_diario or os.path.splitext(ruta)[0] + ".diario.jsonl").leer()
+    if any(r.get("seq", 0) > int(propiedades.get(PROP_SEQ) or 0) for r in registros):
+        return None
+    parametros = {f[0]: f[1] if len(f) > 1 else None for f in hojas.get("parametros", [])[1:] if f}
+    return AgregadosCaja.desde_dict(json.loads(propiedades[PROP_AGREGADOS])), parametros
+
+
+class LibroCaja(RepositorioCaja):
+    """Libro de caja residente en memoria (almacenamiento "xlsx").
+
+    Mantiene cada hoja de plantilla_base.xlsx como una lista de filas
+    (la fila 0 es el encabezado, igual que la fila 1 del Excel). El id de una
+    fila es su posición en esa lista más uno (2 = primera fila de datos) y no
+    cambia durante el turno: borrar deja una lápida (None) en su lugar, que
+    las lecturas saltan. Las lápidas se compactan al escribir el XLSX (en
+    segundo plano) y desaparecen al cerrar caja. Cada cambio
+    se escribe primero en el diario (un registro con fsync por operación) y
+    luego se aplica en memoria; el XLSX es solo una vista materializada que se
+    reescribe en segundo plano o al cerrar caja (checkpoint), y al arrancar se
+    reaplican los registros del diario posteriores al último checkpoint.
+
+    Con varios workers cada proceso tiene su copia en memoria: las escrituras
+    se serializan con un bloqueo de archivo y, antes de leer o escribir, cada
+    proceso aplica los registros que otros agregaron al diario.
+    """
+
+    def __init__(self, ruta, ruta_diario=None, inicializar=None, retardo_guardado=30.0):
+        self.ruta = ruta
+        self.diario = Diario(ruta_diario or os.path.splitext(ruta)[0] + ".diario.jsonl")
+        self.inicializar = inicializar
+        self.retardo_guardado = retardo_guardado
+        self._hojas = {}
+        self.versiones = {}
+        self._agregados = AgregadosCaja()
+        self._boletas = IndiceBoletas()
+        self._envios = OrderedDict()
+        self.seq = 0
+        self._seq_guardado = 0
+        self._estado_diario = None
+        self._pos_diario = 0
+        self._cargado = False
+        self._lock = threading.RLock()
+        self._bloqueo = BloqueoArchivo(os.path.splitext(ruta)[0] + ".lock")
+        self._lock_guardado = threading.Lock()
+        self._timer = None
+        self._lote = None
+        self._plantilla = None
+
+    # -------------- CARGA --------------
+    def _asegurar_cargado(self):
+        if not self._cargado:
+            with self._bloqueo, self._lock:
+                if not self._cargado:
+                    self.cargar()
+        else:
+            with self._lock:
+                self._sincronizar()
+
+    def precargar(self):
+        self._asegurar_cargado()
+        self._plantilla_vacia()
+
+    def cargar(self):
+        """Carga el último checkpoint (XLSX) y reaplica el diario posterior."""
+        with self._lock:
+            if self.inicializar and not self._cargado:
+                with self._bloqueo:
+                    self.inicializar()
+            while not self._cargar_checkpoint():
+                pass
+            self._cargado = True
+
+    def _cargar_checkpoint(self):
+        """Lee XLSX + diario; False si otro proceso hizo checkpoint entre ambas lecturas."""
+        # El libro queda en memoria: la copia de la cache de lectura sobra
+        hojas, propiedades = leer_libro(self.ruta, olvidar=True)
+        borradas = json.loads(propiedades.get(PROP_BORRADAS) or "{}")
+        self._hojas = {h: _con_lapidas(filas, borradas.get(h)) for h, filas in hojas.items()}
+        self.seq = int(propiedades.get(PROP_SEQ) or 0)
+        self.versiones = json.loads(propiedades.get(PROP_VERSIONES) or "{}")
+        agregados = None
+        if propiedades.get(PROP_AGREGADOS):
+            agregados = AgregadosCaja.desde_dict(json.loads(propiedades[PROP_AGREGADOS]))
+        if agregados is None:
+            # XLSX anterior a los totales incrementales: se calculan una vez
+            agregados = AgregadosCaja.desde_filas({h: _vivas(f) for h, f in self._hojas.items()})
+        self._agregados = agregados
+        self._envios = OrderedDict(json.loads(propiedades.get(PROP_ENVIOS) or "[]"))
+        # El índice de boletas no se guarda: se arma desde el checkpoint
+        self._boletas = IndiceBoletas.desde_filas(_vivas(self._hojas.get(IndiceBoletas.HOJA, [])))
+        self._seq_guardado = self.seq
+
+        self._estado_diario = self.diario.estado()
+        registros, self._pos_diario = self.diario.leer()
+        if any(r.get("checkpoint", 0) > self.seq for r in registros):
+            return False
+        self._reaplicar(registros)
+        return True
+
+    def _reaplicar(self, registros):
+        for registro in registros:
+            if registro.get("seq", 0) <= self.seq:
+                continue
+            for op in registro["ops"]:
+                self._aplicar(op, registro["seq"])
+            self.seq = registro["seq"]
+
+    def _sincronizar(self):
+        """Aplica lo que otros procesos escribieron en el diario desde la última lectura."""
+        estado = self.diario.estado()
+        if estado == self._estado_diario:
+            return
+        mismo_archivo = (estado is not None and self._estado_diario is not None
+                         and estado[0] == self._estado_diario[0])
+        registros, pos = self.diario.leer(self._pos_diario if mismo_archivo else 0)
+        checkpoint = max((r["checkpoint"] for r in registros if "checkpoint" in r), default=0)
+        nuevos = [r for r in registros if r.get("seq", 0) > self.seq]
+        if checkpoint > self.seq or (nuevos and nuevos[0]["seq"] != self.seq + 1):
+            # Otro proceso hizo checkpoint con cambios que no vimos: recargar
+            self.cargar()
+            return
+        self._reaplicar(nuevos)
+        self._estado_diario = estado
+        self._pos_diario = pos
+
+    # -------------- LECTURA --------------
+    def filas(self, hoja, desde=0):
+        """Filas de datos de la hoja (sin encabezado ni borradas), a partir de la posición desde."""
+        self._asegurar_cargado()
+        with self._lock:
+            return [list(f) for f in _vivas(self._hojas.get(hoja, []))[desde:]]
+
+    def filas_ids(self, hoja, despues_de=0):
+        self._asegurar_cargado()
+        with self._lock:
+            filas = self._hojas.get(hoja, [])
+            inicio = max(despues_de, 1)
+            return [(i + 1, list(f)) for i, f in enumerate(filas[inicio:], start=inicio) if f is not None]
+
+    def fila(self, hoja, id_fila):
+        self._asegurar_cargado()
+        with self._lock:
+            filas = self._hojas.get(hoja, [])
+            if 2 <= id_fila <= len(filas) and filas[id_fila - 1] is not None:
+                return list(filas[id_fila - 1])
+            return None
+
+    def encabezado(self, hoja):
+        self._asegurar_cargado()
+        with self._lock:
+            filas = self._hojas.get(hoja, [])
+            return list(filas[0]) if filas else None
+
+    def parametro(self, nombre):
+        self._asegurar_cargado()
+        with self._lock:
+            for row in self._hojas.get("parametros", [])[1:]:
+                if row and row[0] == nombre:
+                    return row[1] if len(row) > 1 else None
+            return None
+
+    def version(self, hoja):
+        self._asegurar_cargado()
+        with self._lock:
+            return self.versiones.get(hoja, 0)
+
+    def marca(self):
+        self._asegurar_cargado()
+        with self._lock:
+            return self.seq
+
+    def agregados(self):
+        self._asegurar_cargado()
+        with self._lock:
+            return self._agregados.copia()
+
+    def repartidor(self, nombre):
+        self._asegurar_cargado()
+        with self._lock:
+            datos = self._agregados.repartidores.get(clave_repartidor(nombre))
+            return dict(datos) if datos is not None else None
+
+    def boleta(self, nro):
+        self._asegurar_cargado()
+        with self._lock:
+            return self._boletas.boleta(nro)
+
+    def boletas(self):
+        self._asegurar_cargado()
+        with self._lock:
+            return self._boletas.copia()
+
+    def _corregir_agregados(self, agregados):
+        self._ejecutar({"op": "agregados", "datos": agregados.a_dict()})
+
+    # -------------- ESCRITURA --------------
+    @contextmanager
+    def lote(self):
+        """Agrupa varias operaciones en un único registro del diario, con el bloqueo tomado."""
+        self._asegurar_cargado()
+        with self._bloqueo, self._lock:
+            if self._lote is not None:
+                yield
+                return
+            self._sincronizar()
+            self._lote = []
+            try:
+                yield
+            except Exception:
+                # Como el ROLLBACK de LibroSqlite: nada del lote llega al diario y
+                # lo ya aplicado en memoria se descarta volviendo a checkpoint + diario
+                ops, self._lote = self._lote, None
+                if ops:
+                    self.cargar()
+                raise
+            else:
+                ops, self._lote = self._lote, None
+                self._confirmar(ops)
+
+    def _ejecutar(self, op):
+        with self.lote():
+            # Se anota antes de aplicarla: si falla a medias, el lote sabe que hay que deshacer
+            self._lote.append(op)
+            with fase("mutacion", almacenamiento="xlsx"):
+                resultado = self._aplicar(op, self.seq + 1)
+            if op["op"] in ("agregar", "eliminar", "actualizar"):
+                contar("gustitos_filas_total", len(op.get("filas", (None,))), hoja=op["hoja"], op=op["op"])
+            return resultado
+
+    def _confirmar(self, ops):
+        if not ops:
+            return
+        self.seq += 1
+        self.diario.registrar({"seq": self.seq, "ops": ops})
+        # Nadie más escribe mientras tenemos el bloqueo: lo leído llega hasta el final
+        self._estado_diario = self.diario.estado()
+        self._pos_diario = self._estado_diario[1]
+        self._programar_guardado()
+
+    def _aplicar(self, op, seq):
+        tipo = op["op"]
+        if tipo == "agregar":
+            destino = self._hojas.setdefault(op["hoja"], [])
+            for f in op["filas"]:
+                destino.append(list(f))
+                self._agregados.sumar(op["hoja"], destino[-1])
+                self._boletas.sumar(op["hoja"], destino[-1])
+            return None
+
+        if tipo == "eliminar":
+            filas = self._hojas.get(op["hoja"], [])
+            id_fila = self._id_de(op, filas)
+            if id_fila is None:
+                return None
+            self.versiones[op["hoja"]] = seq
+            # Lápida: las filas siguientes no se mueven (sus ids siguen valiendo)
+            eliminada, filas[id_fila - 1] = filas[id_fila - 1], None
+            self._agregados.restar(op["hoja"], eliminada, self._filas_piso(op["hoja"], filas))
+            self._boletas.restar(op["hoja"], eliminada)
+            return eliminada
+
+        if tipo == "actualizar":
+            filas = self._hojas.get(op["hoja"], [])
+            id_fila = self._id_de(op, filas)
+            if id_fila is None:
+                return False
+            fila = filas[id_fila - 1]
+            anterior = list(fila)
+            for columna, valor in op["valores"]:
+                while len(fila) < columna:
+                    fila.append(None)
+                fila[columna - 1] = valor
+            self.versiones[op["hoja"]] = seq
+            self._agregados.reemplazar(op["hoja"], anterior, fila, self._filas_piso(op["hoja"], filas))
+            self._boletas.reemplazar(op["hoja"], anterior, fila)
+            return True
+
+        if tipo == "parametros":
+            ws = self._hojas.setdefault("parametros", [["Parametro", "Valor"]])
+            for nombre, val in op["valores"]:
+                for row in ws[1:]:
+                    if row and row[0] == nombre:
+                        while len(row) < 2:
+                            row.append(None)
+                        row[1] = val
+                        break
+                else:
+                    ws.append([nombre, val])
+            return None
+
+        if tipo == "asegurar_hoja":
+            encabezado = list(op["encabezado"])
+            filas = self._hojas.get(op["hoja"])
+            if not filas or (op.get("reemplazar") and filas[0] != encabezado):
+                for fila in _vivas(filas or []):
+                    self._agregados.restar(op["hoja"], fila)
+                    self._boletas.restar(op["hoja"], fila)
+                self._hojas[op["hoja"]] = [encabezado]
+                self.versiones[op["hoja"]] = seq
+            return None
+
+        if tipo == "reiniciar_turno":
+            for hoja in HOJAS_PLANILLA + ["Ventas Borradas"]:
+                if hoja in self._hojas:
+                    del self._hojas[hoja][1:]
+                    self.versiones[hoja] = seq
+            if "Resumen Caja" in self._hojas:
+                self._hojas["Resumen Caja"] = []
+            for row in self._hojas.get("parametros", [])[1:]:
+                if row and row[0] == "caja_inicial":
+                    row[1] = 0
+                elif row and row[0] in ("cajero", "turno", "id_turno"):
+                    row[1] = None
+            self._agregados = AgregadosCaja()
+            self._boletas = IndiceBoletas()
+            return None
+
+        if tipo == "agregados":
+            self._agregados = AgregadosCaja.desde_dict(op["datos"])
+            return None
+
+        if tipo == "envio":
+            self._envios[op["id"]] = op["resultado"]
+            self._envios.move_to_end(op["id"])
+            while len(self._envios) > ENVIOS_RECORDADOS:
+                self._envios.popitem(last=False)
+            return None
+
+        raise ValueError(f"Operación desconocida en el diario: {tipo}")
+
+    @staticmethod
+    def _id_de(op, filas):
+        """Id de la fila viva a la que apunta la operación (None si no existe o ya se borró)."""
+        if "id" in op:
+            id_fila = op["id"]
+        else:
+            # Registro escrito antes de los ids: "indice" era la posición en el Excel
+            id_fila = _id_en_posicion(filas, op["indice"])
+        if id_fila is None or not (2 <= id_fila <= len(filas)) or filas[id_fila - 1] is None:
+            return None
+        return id_fila
+
+    @staticmethod
+    def _filas_piso(hoja, filas):
+        # Solo repartos necesita las filas que quedan (piso del repartidor); las lápidas se saltan
+        return filas[1:] if hoja == "planilla repartos" else ()
+
+    def asegurar_hoja(self, hoja, encabezado, reemplazar=False):
+        """Crea la hoja con su encabezado; si reemplazar, la vacía cuando el encabezado no coincide."""
+        with self.lote():
+            filas = self._hojas.get(hoja)
+            if filas and (not reemplazar or filas[0] == list(encabezado)):
+                return
+            self._ejecutar({"op": "asegurar_hoja", "hoja": hoja,
+                            "encabezado": list(encabezado), "reemplazar": reemplazar})
+
+    def agregar(self, hoja, *filas):
+        self._ejecutar({"op": "agregar", "hoja": hoja, "filas": [list(f) for f in filas]})
+
+    def eliminar(self, hoja, id_fila):
+        """Borra la fila (deja una lápida) y la devuelve (None si no existe o ya se borró)."""
+        with self.lote():
+            if self.fila(hoja, id_fila) is None:
+                return None
+            return self._ejecutar({"op": "eliminar", "hoja": hoja, "id": id_fila})
+
+    def actualizar(self, hoja, id_fila, valores):
+        """Actualiza columnas (1 = primera columna) de la fila indicada."""
+        with self.lote():
+            if self.fila(hoja, id_fila) is None:
+                return False
+            return self._ejecutar({"op": "actualizar", "hoja": hoja, "id": id_fila,
+                                   "valores": [[c, v] for c, v in valores.items()]})
+
+    def fijar_parametros(self, valores):
+        self._ejecutar({"op": "parametros", "valores": [[n, v] for n, v in valores.items()]})
+
+    def reiniciar_turno(self):
+        """Vacía las planillas del turno, conservando encabezados y parámetros."""
+        self._ejecutar({"op": "reiniciar_turno"})
+
+    # -------------- ENVÍOS --------------
+    def envio(self, id_envio):
+        self._asegurar_cargado()
+        with self._lock:
+            return self._envios.get(id_envio)
+
+    def registrar_envio(self, id_envio, resultado):
+        self._ejecutar({"op": "envio", "id": id_envio, "resultado": resultado})
+
+    # -------------- PERSISTENCIA --------------
+    def _programar_guardado(self):
+        # Un único guardado por ráfaga: el primer cambio sin guardar programa el
+        # timer y los siguientes se incluyen en ese mismo checkpoint.
+        if self.retardo_guardado is None or self._timer is not None:
+            return
+        self._timer = threading.Timer(self.retardo_guardado, self.guardar)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _copiar_hojas(self):
+        """(seq, hojas compactadas, {hoja: ids borrados}) del contenido actual."""
+        with self._lock:
+            hojas, borradas = {}, {}
+            for nombre, filas in self._hojas.items():
+                hojas[nombre] = filas[:1] and [list(filas[0])] + [list(f) for f in _vivas(filas)]
+                ids = [i for i, f in enumerate(filas[1:], start=2) if f is None]
+                if ids:
+                    borradas[nombre] = ids
+            return self.seq, hojas, borradas
+
+    def hojas(self):
+        self._asegurar_cargado()
+        return self._copiar_hojas()[1]
+
+    @staticmethod
+    def _workbook_desde(hojas):
+        from openpyxl import Workbook
+
+        wb = Workbook()
+        wb.remove(wb.active)
+        for nombre, filas in hojas.items():
+            ws = wb.create_sheet(nombre)
+            for f in filas:
+                ws.append(f)
+        return wb
+
+    def guardar(self):
+        """Checkpoint: reescribe el XLSX de forma atómica y recorta el diario.
+
+        El XLSX se serializa fuera del bloqueo; solo el reemplazo del archivo y
+        el recorte del diario se hacen con el bloqueo tomado, y nunca se pisa un
+        checkpoint más nuevo escrito por otro proceso.
+        """
+        if not self._cargado:
+            return
+        with self._lock_guardado:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                self._sincronizar()
+                if self.seq == self._seq_guardado:
+                    return
+                seq, hojas, borradas = self._copiar_hojas()
+                versiones = dict(self.versiones)
+                agregados = self._agregados.a_dict()
+                envios = OrderedDict(self._envios)
+            wb = self._workbook_desde(hojas)
+            for propiedad in _propiedades(seq, versiones, agregados, borradas, envios):
+                wb.custom_doc_props.append(propiedad)
+            tmp = escribir_temporal(wb, self.ruta, "checkpoint")
+            with self._bloqueo, self._lock:
+                if _seq_en_archivo(self.ruta) < seq:
+                    os.replace(tmp, self.ruta)
+                    self.diario.truncar(seq)
+                    self._sincronizar()
+                else:
+                    os.remove(tmp)
+                self._seq_guardado = seq
+
+    # -------------- ROTACIÓN DE TURNO --------------
+    def _plantilla_vacia(self):
+        """XLSX del turno vacío (bytes); se arma una vez por proceso, al arrancar."""
+        if self._plantilla is None:
+            wb = self._workbook_desde(_hojas_turno_nuevo())
+            for propiedad in _propiedades(0, {}, AgregadosCaja().a_dict(), {}, {}):
+                wb.custom_doc_props.append(propiedad)
+            salida = io.BytesIO()
+            wb.save(salida)
+            self._plantilla = salida.getvalue()
+        return self._plantilla
+
+    def rotar_turno(self, destino):
+        """Cierra el turno en tiempo constante: el libro pasa a destino y el vivo se cambia por la plantilla vacía.
+
+        El checkpoint y el diario del turno se enlazan como destino.xlsx y
+        destino.diario.jsonl (sin copiarlos) y recién después se reemplazan
+        por la plantilla y un diario nuevo, con un seq mayor al de cualquier
+        checkpoint del turno cerrado (un guardado en curso ya no lo pisa y
+        los otros workers recargan). Devuelve la ruta del XLSX cerrado.
+        """
+        plantilla = self._plantilla_vacia()
+        with self.lote():
+            # Lo que ya esté en el lote se confirma en el diario del turno que se cierra
+            ops, self._lote = self._lote, []
+            self._confirmar(ops)
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            ruta = destino + ".xlsx"
+            enlazar(self.ruta, ruta)
+            if os.path.exists(self.diario.ruta):
+                enlazar(self.diario.ruta, destino + ".diario.jsonl")
+
+            seq = self.seq + 1
+            hojas = _hojas_turno_nuevo()
+            versiones = {hoja: seq for hoja in set(self._hojas) | set(hojas)}
+            agregados = AgregadosCaja()
+            # Los envíos siguen en el turno nuevo: un reintento tardío no se registra dos veces
+            propiedades = _propiedades(seq, versiones, agregados.a_dict(), {}, self._envios)
+            guardar_bytes_atomico(_con_propiedades(plantilla, propiedades), self.ruta)
+            self.diario.reiniciar(seq)
+
+            self._hojas = hojas
+            self.versiones = versiones
+            self._agregados = agregados
+            self._boletas = IndiceBoletas()
+            self.seq = self._seq_guardado = seq
+            self._estado_diario = self.diario.estado()
+            self._pos_diario = self._estado_diario[1]
+        return ruta
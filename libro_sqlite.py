@@ -0,0 +1,319 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from agregados import AgregadosCaja
+from esquema import ESQUEMA, HOJAS_PLANILLA
+from indices import clave_boleta
+from metricas import contar, fase
+from repositorio import ENVIOS_RECORDADOS, RepositorioCaja
+
+# hoja -> (tabla, [columnas]); los encabezados del Excel salen de esquema.ESQUEMA
+_COLUMNAS = {
+    "planilla transacciones": ("transacciones", [
+        "fecha", "codigo_autorizacion", "numero_interno", "medio_pago", "monto", "propina", "total"]),
+    "planilla repartos": ("repartos", ["fecha", "repartidor", "direccion", "monto", "piso"]),
+    "planilla egresos": ("egresos", ["fecha", "motivo", "valor", "boleta"]),
+    "planilla mermas": ("mermas", ["fecha", "motivo", "valor"]),
+    "planilla desgloses": ("desgloses", ["fecha", "denominacion", "cantidad", "total", "tipo"]),
+    "parametros": ("parametros", ["nombre", "valor"]),
+    "planilla cortesias": ("cortesias", ["fecha", "monto", "motivo"]),
+    "Ventas Borradas": ("ventas_borradas", [
+        "fecha_eliminacion", "codigo_autorizacion", "numero_interno", "medio_pago",
+        "monto", "propina", "total", "motivo"]),
+}
+
+# hoja -> (tabla, [(columna, encabezado Excel)])
+TABLAS = {hoja: (tabla, list(zip(columnas, ESQUEMA[hoja]))) for hoja, (tabla, columnas) in _COLUMNAS.items()}
+
+# Fila de la tabla versiones que cuenta todas las escrituras (marca)
+ESCRITURAS = "__escrituras__"
+# Filas de la tabla versiones con el último id entregado por tabla (un id
+# borrado no se vuelve a usar en el turno, aunque fuera el más alto)
+ULTIMO_ID = "__ultimo_id__"
+
+INDICES = [
+    ("transacciones", "fecha"),
+    ("transacciones", "numero_interno"),
+    ("repartos", "fecha"),
+    ("repartos", "repartidor COLLATE NOCASE"),
+    ("egresos", "fecha"),
+    ("mermas", "fecha"),
+    ("desgloses", "fecha"),
+    ("cortesias", "fecha"),
+]
+
+
+class LibroSqlite(RepositorioCaja):
+    """Almacenamiento "sqlite": una tabla por planilla, en modo WAL.
+
+    Cada escritura es una transacción (varias filas de una venta se insertan
+    juntas) y varios workers pueden leer mientras otro escribe. El XLSX se
+    genera solo al exportar (descargar_actual / cierre_caja).
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+        self._lock_esquema = threading.Lock()
+        self._esquema_listo = False
+
+    # -------------- CONEXIÓN --------------
+    def _conexion(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=FULL")
+            self._local.con = con
+            self._local.profundidad = 0
+            if not self._esquema_listo:
+                self._crear_esquema(con)
+        return con
+
+    def _crear_esquema(self, con):
+        with self._lock_esquema:
+            if self._esquema_listo:
+                return
+            for hoja, (tabla, columnas) in TABLAS.items():
+                cols = ", ".join(c for c, _ in columnas)
+                if tabla == "parametros":
+                    cols = "nombre TEXT UNIQUE, valor"
+                con.execute(f"CREATE TABLE IF NOT EXISTS {tabla} (id INTEGER PRIMARY KEY, {cols})")
+            con.execute("CREATE TABLE IF NOT EXISTS versiones (hoja TEXT PRIMARY KEY, valor INTEGER)")
+            con.execute("CREATE TABLE IF NOT EXISTS agregados (id INTEGER PRIMARY KEY CHECK (id = 1), datos TEXT)")
+            con.execute("CREATE TABLE IF NOT EXISTS envios (id TEXT PRIMARY KEY, resultado TEXT)")
+            for tabla, columna in INDICES:
+                nombre = f"idx_{tabla}_{columna.split()[0]}"
+                con.execute(f"CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} ({columna})")
+            self._esquema_listo = True
+
+    @contextmanager
+    def lote(self):
+        """Transacción explícita; las escrituras anidadas se confirman juntas."""
+        con = self._conexion()
+        if self._local.profundidad == 0:
+            con.execute("BEGIN IMMEDIATE")
+            self._local.cambios = con.total_changes
+        self._local.profundidad += 1
+        try:
+            yield
+        except Exception:
+            self._local.profundidad -= 1
+            if self._local.profundidad == 0:
+                con.execute("ROLLBACK")
+            raise
+        else:
+            self._local.profundidad -= 1
+            if self._local.profundidad == 0:
+                if con.total_changes != self._local.cambios:
+                    self._subir_version(ESCRITURAS)
+                con.execute("COMMIT")
+
+    @contextmanager
+    def _lectura(self):
+        """Varias lecturas sobre una misma foto de la base (sin bloquear a los escritores)."""
+        con = self._conexion()
+        if self._local.profundidad:
+            yield
+            return
+        con.execute("BEGIN")
+        try:
+            yield
+        finally:
+            con.execute("COMMIT")
+
+    def cargar(self):
+        self._conexion()
+
+    # -------------- LECTURA --------------
+    def _tabla(self, hoja):
+        if hoja not in TABLAS:
+            raise KeyError(f"Hoja sin tabla en SQLite: {hoja}")
+        return TABLAS[hoja]
+
+    def filas(self, hoja, desde=0):
+        if hoja not in TABLAS:
+            return []
+        tabla, columnas = TABLAS[hoja]
+        cols = ", ".join(c for c, _ in columnas)
+        return [list(r) for r in self._conexion().execute(
+            f"SELECT {cols} FROM {tabla} ORDER BY id LIMIT -1 OFFSET ?", (desde,))]
+
+    def boleta(self, nro):
+        # Usa el índice de transacciones(numero_interno)
+        tabla, columnas = TABLAS["planilla transacciones"]
+        cols = ", ".join(c for c, _ in columnas)
+        return [list(r) for r in self._conexion().execute(
+            f"SELECT {cols} FROM {tabla} WHERE numero_interno = ? ORDER BY id", (clave_boleta(nro),))]
+
+    def filas_ids(self, hoja, despues_de=0):
+        if hoja not in TABLAS:
+            return []
+        tabla, columnas = TABLAS[hoja]
+        cols = ", ".join(c for c, _ in columnas)
+        return [(r[0], list(r[1:])) for r in self._conexion().execute(
+            f"SELECT id, {cols} FROM {tabla} WHERE id > ? ORDER BY id", (despues_de,))]
+
+    def fila(self, hoja, id_fila):
+        tabla, columnas = self._tabla(hoja)
+        cols = ", ".join(c for c, _ in columnas)
+        row = self._conexion().execute(f"SELECT {cols} FROM {tabla} WHERE id = ?", (id_fila,)).fetchone()
+        return list(row) if row else None
+
+    def encabezado(self, hoja):
+        return [e for _, e in TABLAS[hoja][1]] if hoja in TABLAS else None
+
+    def parametro(self, nombre):
+        row = self._conexion().execute("SELECT valor FROM parametros WHERE nombre = ?", (nombre,)).fetchone()
+        return row[0] if row else None
+
+    def version(self, hoja):
+        row = self._conexion().execute("SELECT valor FROM versiones WHERE hoja = ?", (hoja,)).fetchone()
+        return row[0] if row else 0
+
+    def marca(self):
+        return self.version(ESCRITURAS)
+
+    def _subir_version(self, hoja):
+        self._conexion().execute(
+            "INSERT INTO versiones (hoja, valor) VALUES (?, 1) "
+            "ON CONFLICT(hoja) DO UPDATE SET valor = valor + 1", (hoja,)
+        )
+
+    def _leer_agregados(self):
+        row = self._conexion().execute("SELECT datos FROM agregados WHERE id = 1").fetchone()
+        return AgregadosCaja.desde_dict(json.loads(row[0])) if row else None
+
+    def agregados(self):
+        # Lectura simple (no toma el bloqueo de escritura, como las demás lecturas con WAL)
+        agregados = self._leer_agregados()
+        if agregados is not None:
+            return agregados
+        # Base anterior a los totales incrementales: se calculan una vez
+        with self.lote():
+            agregados = self._leer_agregados()
+            if agregados is None:
+                agregados = AgregadosCaja.desde_filas({h: self.filas(h) for h in AgregadosCaja.HOJAS})
+                self._guardar_agregados(agregados)
+            return agregados
+
+    def _guardar_agregados(self, agregados):
+        self._conexion().execute(
+            "INSERT INTO agregados (id, datos) VALUES (1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET datos = excluded.datos", (json.dumps(agregados.a_dict()),)
+        )
+
+    _corregir_agregados = _guardar_agregados
+
+    # -------------- ESCRITURA --------------
+    def asegurar_hoja(self, hoja, encabezado, reemplazar=False):
+        # Las tablas tienen columnas fijas; solo se valida que la hoja exista
+        self._tabla(hoja)
+
+    def _reservar_ids(self, tabla, cantidad):
+        """Primer id de un bloque nuevo: después del último entregado y del mayor que quede en la tabla."""
+        con = self._conexion()
+        row = con.execute("SELECT valor FROM versiones WHERE hoja = ?", (ULTIMO_ID + tabla,)).fetchone()
+        maximo = con.execute(f"SELECT COALESCE(MAX(id), 0) FROM {tabla}").fetchone()[0]
+        primero = max(row[0] if row else 0, maximo) + 1
+        con.execute(
+            "INSERT INTO versiones (hoja, valor) VALUES (?, ?) "
+            "ON CONFLICT(hoja) DO UPDATE SET valor = excluded.valor", (ULTIMO_ID + tabla, primero + cantidad - 1)
+        )
+        return primero
+
+    def agregar(self, hoja, *filas):
+        tabla, columnas = self._tabla(hoja)
+        cols = ", ".join(c for c, _ in columnas)
+        marcas = ", ".join("?" for _ in columnas)
+        valores = [tuple((list(f) + [None] * len(columnas))[:len(columnas)]) for f in filas]
+        contar("gustitos_filas_total", len(valores), hoja=hoja, op="agregar")
+        with self.lote(), fase("mutacion", almacenamiento="sqlite"):
+            # Los totales se leen antes de tocar la tabla (si faltan, se recalculan desde ella)
+            agregados = self.agregados() if hoja in AgregadosCaja.HOJAS else None
+            primero = self._reservar_ids(tabla, len(valores))
+            self._conexion().executemany(f"INSERT INTO {tabla} (id, {cols}) VALUES (?, {marcas})",
+                                         [(primero + i, *v) for i, v in enumerate(valores)])
+            if agregados is not None:
+                for f in valores:
+                    agregados.sumar(hoja, list(f))
+                self._guardar_agregados(agregados)
+
+    def eliminar(self, hoja, id_fila):
+        tabla, _ = self._tabla(hoja)
+        with self.lote(), fase("mutacion", almacenamiento="sqlite"):
+            fila = self.fila(hoja, id_fila)
+            if fila is None:
+                return None
+            contar("gustitos_filas_total", hoja=hoja, op="eliminar")
+            self._subir_version(hoja)
+            agregados = self.agregados() if hoja in AgregadosCaja.HOJAS else None
+            self._conexion().execute(f"DELETE FROM {tabla} WHERE id = ?", (id_fila,))
+            if agregados is not None:
+                agregados.restar(hoja, fila, self.filas(hoja) if hoja == "planilla repartos" else ())
+                self._guardar_agregados(agregados)
+            return fila
+
+    def actualizar(self, hoja, id_fila, valores):
+        tabla, columnas = self._tabla(hoja)
+        with self.lote(), fase("mutacion", almacenamiento="sqlite"):
+            anterior = self.fila(hoja, id_fila)
+            if anterior is None:
+                return False
+            contar("gustitos_filas_total", hoja=hoja, op="actualizar")
+            self._subir_version(hoja)
+            agregados = self.agregados() if hoja in AgregadosCaja.HOJAS else None
+            asignaciones = ", ".join(f"{columnas[c - 1][0]} = ?" for c in valores)
+            self._conexion().execute(f"UPDATE {tabla} SET {asignaciones} WHERE id = ?",
+                                     (*valores.values(), id_fila))
+            if agregados is not None:
+                agregados.reemplazar(hoja, anterior, self.fila(hoja, id_fila),
+                                     self.filas(hoja) if hoja == "planilla repartos" else ())
+                self._guardar_agregados(agregados)
+            return True
+
+    def fijar_parametros(self, valores):
+        with self.lote():
+            self._conexion().executemany(
+                "INSERT INTO parametros (nombre, valor) VALUES (?, ?) "
+                "ON CONFLICT(nombre) DO UPDATE SET valor = excluded.valor",
+                list(valores.items()),
+            )
+
+    def reiniciar_turno(self):
+        with self.lote():
+            con = self._conexion()
+            for hoja in HOJAS_PLANILLA + ["Ventas Borradas"]:
+                con.execute(f"DELETE FROM {TABLAS[hoja][0]}")
+                con.execute("DELETE FROM versiones WHERE hoja = ?", (ULTIMO_ID + TABLAS[hoja][0],))
+                self._subir_version(hoja)
+            con.execute("UPDATE parametros SET valor = 0 WHERE nombre = 'caja_inicial'")
+            con.execute("UPDATE parametros SET valor = NULL WHERE nombre IN ('cajero', 'turno', 'id_turno')")
+            self._guardar_agregados(AgregadosCaja())
+
+    # -------------- ENVÍOS --------------
+    def envio(self, id_envio):
+        row = self._conexion().execute("SELECT resultado FROM envios WHERE id = ?", (id_envio,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def registrar_envio(self, id_envio, resultado):
+        with self.lote():
+            con = self._conexion()
+            con.execute("INSERT OR REPLACE INTO envios (id, resultado) VALUES (?, ?)",
+                        (id_envio, json.dumps(resultado)))
+            # Solo los últimos ENVIOS_RECORDADOS (rowid crece con cada registro)
+            con.execute("DELETE FROM envios WHERE rowid <= (SELECT MAX(rowid) FROM envios) - ?",
+                        (ENVIOS_RECORDADOS,))
+
+    # -------------- EXPORTACIÓN --------------
+    def hojas(self):
+        salida = {}
+        with self._lectura():
+            for hoja, (tabla, columnas) in TABLAS.items():
+                filas = self.filas(hoja)
+                if hoja == "Ventas Borradas" and not filas:
+                    continue
+                salida[hoja] = [[e for _, e in columnas]] + filas
+        return salida
@@ -0,0 +1,178 @@
+import cProfile
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Límites (en segundos) de los histogramas de latencia
+LIMITES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+AYUDAS = {
+    "gustitos_request_segundos": "Latencia de las rutas de Flask",
+    "gustitos_fase_segundos": "Latencia de las fases internas (carga, escritura, exportación)",
+    "gustitos_bytes_escritos_total": "Bytes escritos en archivos XLSX",
+    "gustitos_filas_total": "Filas agregadas, eliminadas o actualizadas en las planillas",
+    "gustitos_perfiles_total": "Perfiles cProfile guardados de requests lentos",
+    "gustitos_ventas_lote_total": "Ventas de /api/ventas/lote registradas o rechazadas",
+    "gustitos_envios_repetidos_total": "Reintentos de /api/agregar con un id_envio ya registrado",
+}
+
+
+class _Histograma:
+    __slots__ = ("cuentas", "suma", "total")
+
+    def __init__(self):
+        self.cuentas = [0] * len(LIMITES)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(LIMITES):
+            if valor <= limite:
+                self.cuentas[i] += 1
+                break
+        self.suma += valor
+        self.total += 1
+
+
+class Metricas:
+    """Histogramas y contadores en memoria del proceso, en formato Prometheus.
+
+    Cada métrica se identifica por nombre y etiquetas; registrar un valor es
+    una búsqueda en un dict con el lock tomado, así se puede llamar en cada
+    request y en cada escritura sin que se note.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}
+        self._contadores = {}
+
+    @staticmethod
+    def _clave(nombre, etiquetas):
+        return nombre, tuple(sorted(etiquetas.items()))
+
+    def observar(self, nombre, segundos, **etiquetas):
+        clave = self._clave(nombre, etiquetas)
+        with self._lock:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                histograma = self._histogramas[clave] = _Histograma()
+            histograma.observar(segundos)
+
+    def contar(self, nombre, valor=1, **etiquetas):
+        clave = self._clave(nombre, etiquetas)
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    @contextmanager
+    def fase(self, fase, **etiquetas):
+        """Mide el bloque en gustitos_fase_segundos{fase=...}."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar("gustitos_fase_segundos", time.perf_counter() - inicio, fase=fase, **etiquetas)
+
+    def texto(self):
+        """Todas las métricas en el formato de texto de Prometheus."""
+        with self._lock:
+            histogramas = {k: (list(h.cuentas), h.suma, h.total) for k, h in self._histogramas.items()}
+            contadores = dict(self._contadores)
+
+        lineas = []
+        vistos = set()
+
+        def cabecera(nombre, tipo):
+            if nombre not in vistos:
+                vistos.add(nombre)
+                lineas.append(f"# HELP {nombre} {AYUDAS.get(nombre, nombre)}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+
+        for (nombre, etiquetas), (cuentas, suma, total) in sorted(histogramas.items()):
+            cabecera(nombre, "histogram")
+            acumulado = 0
+            for limite, cuenta in zip(LIMITES, cuentas):
+                acumulado += cuenta
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, le=limite)} {acumulado}")
+            lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, le='+Inf')} {total}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {suma:.6f}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {total}")
+        for (nombre, etiquetas), valor in sorted(contadores.items()):
+            cabecera(nombre, "counter")
+            lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+        return "\n".join(lineas) + "\n"
+
+
+def _valor(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(etiquetas, **extra):
+    pares = list(etiquetas) + list(extra.items())
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_valor(v)}"' for k, v in pares) + "}"
+
+
+# Registro del proceso (cada worker de gunicorn tiene el suyo)
+METRICAS = Metricas()
+fase = METRICAS.fase
+observar = METRICAS.observar
+contar = METRICAS.contar
+
+
+# -------------- FLASK --------------
+def instrumentar(app, umbral_perfil_ms=None, carpeta_perfiles="perfiles"):
+    """Mide cada request de app; con umbral_perfil_ms guarda un .prof de los que lo superen.
+
+    Con el perfil activo los requests corren bajo cProfile (más lento), así
+    que conviene usarlo solo mientras se investiga. Se perfila un request a
+    la vez: los que llegan mientras otro está bajo cProfile se miden sin
+    perfil (desde Python 3.12 no puede haber dos perfiles activos).
+    """
+    from flask import g, request
+
+    lock_perfil = threading.Lock()
+
+    @app.before_request
+    def _inicio_request():
+        g.inicio_metricas = time.perf_counter()
+        if umbral_perfil_ms is not None and lock_perfil.acquire(blocking=False):
+            perfil = cProfile.Profile()
+            try:
+                perfil.enable()
+            except ValueError:
+                # Otra herramienta de perfilado (depurador, otro cProfile) ya está activa
+                lock_perfil.release()
+            else:
+                g.perfil = perfil
+
+    @app.after_request
+    def _estado_request(respuesta):
+        g.estado_metricas = respuesta.status_code
+        return respuesta
+
+    @app.teardown_request
+    def _fin_request(_error=None):
+        inicio = g.pop("inicio_metricas", None)
+        if inicio is None:
+            return
+        segundos = time.perf_counter() - inicio
+        perfil = g.pop("perfil", None)
+        if perfil is not None:
+            perfil.disable()
+            lock_perfil.release()
+        ruta = request.endpoint or "desconocida"
+        observar("gustitos_request_segundos", segundos, ruta=ruta, metodo=request.method,
+                 estado=g.pop("estado_metricas", 500))
+        if perfil is not None and segundos * 1000 >= umbral_perfil_ms:
+            os.makedirs(carpeta_perfiles, exist_ok=True)
+            marca = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            nombre = f"{marca}_{re.sub(r'[^A-Za-z0-9_]', '_', ruta)}_{segundos * 1000:.0f}ms.prof"
+            perfil.dump_stats(os.path.join(carpeta_perfiles, nombre))
+            contar("gustitos_perfiles_total", ruta=ruta)
+            app.logger.warning("🐢 %s %s tardó %.0f ms; perfil en %s/%s", request.method, request.path,
+                               segundos * 1000, carpeta_perfiles, nombre)
@@ -0,0 +1,70 @@
+"""Reimporta los archivos de cierre al índice en paralelo.
+
+Recorre la carpeta de cierres, lee cada XLSX (read_only, values_only) en un
+ProcessPoolExecutor y deja todas las planillas normalizadas en el índice
+SQLite que usa la app (/api/cierres/resumen). Con --csv además exporta cada
+tabla a un CSV con el nombre del archivo de origen en la primera columna.
+Con --compactar antes pasa los XLSX sueltos de la carpeta a fotos comprimidas
+(el XLSX original queda en .originales y es el que se sigue descargando).
+
+    python reimportar_cierres.py --procesos 8
+    python reimportar_cierres.py --incremental --csv dataset/
+    python reimportar_cierres.py --compactar --incremental
+"""
+import argparse
+import csv
+import os
+import time
+
+from archivo_cierres import ArchivoCierres
+from indice_cierres import IndiceCierres, HOJAS_DETALLE
+from libro_sqlite import TABLAS
+
+# Igual que CIERRES_DIR / INDICE_CIERRES_FILE en cajas.py, para la caja
+# principal (las demás: --carpeta cajas/<id>/cierres)
+CIERRES_DIR = "cierres"
+INDICE_CIERRES = ".indice_cierres.sqlite"
+
+
+def exportar_csv(indice, carpeta):
+    os.makedirs(carpeta, exist_ok=True)
+    for hoja in HOJAS_DETALLE:
+        tabla, columnas = TABLAS[hoja]
+        with open(os.path.join(carpeta, f"{tabla}.csv"), "w", newline="", encoding="utf-8") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(["Archivo", "Fecha Cierre"] + [e for _, e in columnas])
+            escritor.writerows(indice.filas_detalle(hoja))
+    print(f"💾 CSV en {carpeta}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--carpeta", default=CIERRES_DIR)
+    parser.add_argument("--indice", help=f"por defecto <carpeta>/{INDICE_CIERRES}")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--incremental", action="store_true",
+                        help="solo los archivos nuevos o cambiados (por defecto se relee todo)")
+    parser.add_argument("--csv", metavar="CARPETA", help="exporta las tablas normalizadas a CSV")
+    parser.add_argument("--compactar", action="store_true",
+                        help="pasa antes los XLSX de la carpeta a fotos comprimidas")
+    args = parser.parse_args()
+
+    if args.compactar:
+        ArchivoCierres(args.carpeta).compactar()
+
+    indice = IndiceCierres(args.indice or os.path.join(args.carpeta, INDICE_CIERRES), args.carpeta)
+    t0 = time.perf_counter()
+    indexados = indice.actualizar(procesos=args.procesos, forzar=not args.incremental)
+    segundos = time.perf_counter() - t0
+
+    filas = sum(n for _, n in indexados)
+    print(f"{len(indexados)} archivos, {filas} filas en {segundos:.2f} s con {args.procesos} procesos")
+    if segundos > 0:
+        print(f"{len(indexados) / segundos:.1f} archivos/s, {filas / segundos:.0f} filas/s")
+
+    if args.csv:
+        exportar_csv(indice, args.csv)
+
+
+if __name__ == "__main__":
+    main()
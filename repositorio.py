@@ -0,0 +1,233 @@
+import json
+import os
+from contextlib import contextmanager
+
+from agregados import AgregadosCaja, clave_repartidor
+from archivos import guardar_json_atomico
+from indices import IndiceBoletas
+
+# Envíos del formulario rápido (id_envio) que se recuerdan para no registrar
+# dos veces un reintento; se conservan entre turnos y se descartan los más viejos
+ENVIOS_RECORDADOS = 500
+
+
+class RepositorioCaja:
+    """Interfaz de almacenamiento de las planillas del turno.
+
+    Las hojas se nombran igual que en plantilla_base.xlsx ("planilla
+    transacciones", "parametros", ...) y las filas se devuelven como listas
+    en el orden de columnas del Excel. Cada fila tiene un id entero estable
+    durante el turno, que es lo que usan las rutas:
+    borrar una fila no cambia el id de las demás, así que un id que mostró
+    la planilla sigue apuntando a la misma fila o a ninguna (por eso
+    eliminar y actualizar no necesitan la versión de la hoja que vio el
+    usuario: una fila ya borrada simplemente no se encuentra).
+    """
+
+    # -------------- LECTURA --------------
+    def filas(self, hoja, desde=0):
+        """Filas de datos (sin encabezado), a partir de la posición desde (0 = fila 2 del Excel)."""
+        raise NotImplementedError
+
+    def filas_ids(self, hoja, despues_de=0):
+        """[(id, fila)] de las filas de datos con id mayor que despues_de, en orden."""
+        raise NotImplementedError
+
+    def fila(self, hoja, id_fila):
+        """Fila con ese id (None si no existe o se borró)."""
+        raise NotImplementedError
+
+    def encabezado(self, hoja):
+        raise NotImplementedError
+
+    def parametro(self, nombre):
+        raise NotImplementedError
+
+    def version(self, hoja):
+        """Cambia cada vez que se borra o edita una fila de la hoja."""
+        raise NotImplementedError
+
+    def marca(self):
+        """Cambia con cada escritura confirmada (también las de otros workers); sirve para invalidar cachés."""
+        raise NotImplementedError
+
+    def agregados(self):
+        """Copia de los totales del turno (AgregadosCaja), sin recorrer las planillas."""
+        raise NotImplementedError
+
+    def repartidor(self, nombre):
+        """Totales de un repartidor ({"nombre", "total", "filas", "piso"}) o None si no tiene repartos."""
+        return self.agregados().repartidores.get(clave_repartidor(nombre))
+
+    def boleta(self, nro):
+        """Filas de pago de la boleta con ese Nº Interno, en orden ([] si no está registrada)."""
+        return IndiceBoletas.desde_filas(self.filas("planilla transacciones")).boleta(nro)
+
+    def boletas(self):
+        """{Nº Interno: filas de pago}, en el orden en que se registró cada boleta."""
+        return IndiceBoletas.desde_filas(self.filas("planilla transacciones")).copia()
+
+    def verificar_agregados(self):
+        """Compara los totales incrementales con un recálculo completo.
+
+        Devuelve (recalculado, diferencias); si hay diferencias el repositorio
+        pasa a usar el recálculo.
+        """
+        with self.lote():
+            recalculado = AgregadosCaja.desde_filas({h: self.filas(h) for h in AgregadosCaja.HOJAS})
+            diferencias = self.agregados().diferencias(recalculado)
+            if diferencias:
+                self._corregir_agregados(recalculado)
+        return recalculado, diferencias
+
+    def _corregir_agregados(self, agregados):
+        raise NotImplementedError
+
+    # -------------- ESCRITURA --------------
+    @contextmanager
+    def lote(self):
+        """Agrupa varias escrituras en una sola unidad atómica."""
+        yield
+
+    def asegurar_hoja(self, hoja, encabezado, reemplazar=False):
+        raise NotImplementedError
+
+    def agregar(self, hoja, *filas):
+        raise NotImplementedError
+
+    def eliminar(self, hoja, id_fila):
+        raise NotImplementedError
+
+    def actualizar(self, hoja, id_fila, valores):
+        raise NotImplementedError
+
+    def fijar_parametros(self, valores):
+        raise NotImplementedError
+
+    def reiniciar_turno(self):
+        raise NotImplementedError
+
+    def rotar_turno(self, destino):
+        """Pasa el turno a destino (para armar su cierre después) y deja uno vacío.
+
+        Devuelve la ruta del turno cerrado, que se lee con foto_turno_cerrado.
+        Por defecto guarda la foto del turno en JSON y vacía las planillas;
+        LibroCaja cambia de archivo sin recorrer las filas.
+        """
+        ruta = destino + ".json"
+        with self.lote():
+            _verificar_totales(self)
+            guardar_json_atomico(self.foto().a_dict(), ruta)
+            self.reiniciar_turno()
+        return ruta
+
+    # -------------- ENVÍOS --------------
+    def envio(self, id_envio):
+        """Resultado guardado del envío id_envio (None si no se registró)."""
+        raise NotImplementedError
+
+    def registrar_envio(self, id_envio, resultado):
+        """Recuerda el resultado del envío; se escribe junto con el lote en curso."""
+        raise NotImplementedError
+
+    # -------------- EXPORTACIÓN / PERSISTENCIA --------------
+    def hojas(self):
+        """{hoja: filas con encabezado}, en el orden de plantilla_base.xlsx (copia)."""
+        raise NotImplementedError
+
+    def a_workbook(self):
+        """Workbook de openpyxl con el contenido actual, con el layout de plantilla_base.xlsx."""
+        from openpyxl import Workbook
+
+        wb = Workbook()
+        wb.remove(wb.active)
+        for nombre, filas in self.hojas().items():
+            ws = wb.create_sheet(nombre)
+            for f in filas:
+                ws.append(f)
+        return wb
+
+    def foto(self):
+        """Copia del turno (FotoTurno) para exportarla sin tener tomado el bloqueo."""
+        with self.lote():
+            return FotoTurno(self.hojas(), self.agregados(), self.boletas())
+
+    def cargar(self):
+        pass
+
+    def precargar(self):
+        """Carga el repositorio si todavía no se cargó (arranque en segundo plano)."""
+        self.cargar()
+
+    def guardar(self):
+        pass
+
+
+class FotoTurno:
+    """Planillas, parámetros y totales de un turno congelados en un momento dado.
+
+    Responde hojas/parametro/agregados/boletas como un repositorio (lo que
+    usa exportar.libro_turno) y se puede pasar a JSON para guardarla en disco.
+    """
+
+    def __init__(self, hojas, agregados, boletas):
+        self._hojas = hojas
+        self._agregados = agregados
+        self._boletas = boletas
+
+    def hojas(self):
+        return {nombre: [list(f) for f in filas] for nombre, filas in self._hojas.items()}
+
+    def parametro(self, nombre):
+        for row in self._hojas.get("parametros", [])[1:]:
+            if row and row[0] == nombre:
+                return row[1] if len(row) > 1 else None
+        return None
+
+    def agregados(self):
+        return self._agregados.copia()
+
+    def boletas(self):
+        return {nro: [list(f) for f in pagos] for nro, pagos in self._boletas.items()}
+
+    def a_dict(self):
+        return {"hojas": self._hojas, "agregados": self._agregados.a_dict(), "boletas": self._boletas}
+
+    @classmethod
+    def desde_dict(cls, datos):
+        boletas = datos.get("boletas")
+        if boletas is None:
+            # Foto guardada antes del índice de boletas
+            boletas = IndiceBoletas.desde_filas(datos["hojas"].get("planilla transacciones", [])[1:]).copia()
+        return cls(datos["hojas"], AgregadosCaja.desde_dict(datos["agregados"]), boletas)
+
+
+def _verificar_totales(repositorio):
+    # Los totales incrementales se comparan con un recálculo completo; si no
+    # coinciden, el cierre usa el recálculo
+    _, diferencias = repositorio.verificar_agregados()
+    for campo, incremental, recalculado in diferencias:
+        print(f"⚠️ Totales del turno descuadrados en {campo}: {incremental} (incremental) vs {recalculado} (recálculo)")
+
+
+def foto_turno_cerrado(ruta):
+    """FotoTurno del turno que rotar_turno dejó en ruta (con los totales ya verificados)."""
+    if ruta.endswith(".json"):
+        with open(ruta, encoding="utf-8") as f:
+            return FotoTurno.desde_dict(json.load(f))
+    from libro_caja import LibroCaja
+
+    cerrado = LibroCaja(ruta, ruta_diario=os.path.splitext(ruta)[0] + ".diario.jsonl", retardo_guardado=None)
+    _verificar_totales(cerrado)
+    return cerrado.foto()
+
+
+def crear_repositorio(tipo, ruta_excel, ruta_diario=None, ruta_sqlite=None, inicializar=None):
+    """Crea el repositorio según ALMACENAMIENTO ("xlsx" o "sqlite")."""
+    if tipo == "xlsx":
+        from libro_caja import LibroCaja
+        return LibroCaja(ruta_excel, ruta_diario=ruta_diario, inicializar=inicializar)
+    if tipo == "sqlite":
+        from libro_sqlite import LibroSqlite
+        return LibroSqlite(ruta_sqlite)
+    raise ValueError(f"Almacenamiento desconocido: {tipo}")
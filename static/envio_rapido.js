@@ -0,0 +1,157 @@
+// Altas sin recargar la página.
+//
+// Cada <form data-api="..."> se envía con fetch a /api/agregar/<tipo>: el
+// formulario queda limpio al tiro para la siguiente boleta y el resultado y
+// los totales del turno se muestran en la misma página (_envio_rapido.html).
+// Los envíos salen de a uno y en orden desde una cola en sessionStorage; si el
+// servidor no responde o está ocupado (429/502/503/504) se reintentan más
+// tarde, también después de recargar la pestaña. Cada envío lleva un id_envio
+// propio: si el servidor ya lo había registrado (la respuesta se perdió), el
+// reintento devuelve el resultado original sin escribir la boleta otra vez.
+// Sin JavaScript el formulario se envía como siempre.
+(() => {
+  const CLAVE_COLA = "gustitos_altas_pendientes";
+  const REINTENTOS_MS = [500, 1000, 2000, 5000, 10000];
+  const OCUPADO = new Set([429, 502, 503, 504]);
+  const dinero = v => "$" + Math.round(v || 0).toLocaleString("es-CL");
+
+  let enviando = false;
+  let intentos = 0;
+
+  function leerCola() {
+    try {
+      return JSON.parse(sessionStorage.getItem(CLAVE_COLA)) || [];
+    } catch (e) {
+      return [];
+    }
+  }
+
+  function guardarCola(cola) {
+    sessionStorage.setItem(CLAVE_COLA, JSON.stringify(cola));
+    const aviso = document.getElementById("envio-cola");
+    if (!aviso) return;
+    aviso.textContent = cola.length === 1 ? "1 envío en cola" : `${cola.length} envíos en cola`;
+    aviso.classList.toggle("d-none", cola.length === 0);
+  }
+
+  function poner(id, texto) {
+    const elemento = document.getElementById(id);
+    if (elemento) elemento.textContent = texto;
+  }
+
+  function mostrarTotales(resumen) {
+    poner("envio-total-ventas", dinero(resumen.total_ventas));
+    poner("envio-total-propinas", dinero(resumen.total_propinas));
+    poner("envio-total-caja", dinero(resumen.total_caja_final));
+  }
+
+  function mostrarMensaje(texto, categoria) {
+    const contenedor = document.getElementById("envio-mensaje");
+    if (!contenedor) return;
+    const alerta = document.createElement("div");
+    alerta.className = `alert alert-${categoria} alert-dismissible fade show py-2`;
+    alerta.setAttribute("role", "alert");
+    alerta.textContent = texto;
+    const cerrar = document.createElement("button");
+    cerrar.type = "button";
+    cerrar.className = "btn-close";
+    cerrar.dataset.bsDismiss = "alert";
+    cerrar.setAttribute("aria-label", "Cerrar");
+    alerta.appendChild(cerrar);
+    // Los errores se quedan hasta cerrarlos; de los registros exitosos solo el último
+    contenedor.querySelectorAll(".alert-success").forEach(a => a.remove());
+    contenedor.prepend(alerta);
+  }
+
+  function nuevoId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    // Sin randomUUID (página servida por http a otra máquina de la red)
+    return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2) + Math.random().toString(36).slice(2);
+  }
+
+  async function enviar(envio) {
+    try {
+      return await fetch(envio.url, {
+        method: "POST",
+        body: envio.datos,
+        headers: {"Content-Type": "application/x-www-form-urlencoded", "Accept": "application/json"},
+        credentials: "same-origin",
+      });
+    } catch (e) {
+      return null;  // Sin conexión
+    }
+  }
+
+  async function procesarCola() {
+    if (enviando) return;
+    enviando = true;
+    try {
+      let cola = leerCola();
+      while (cola.length) {
+        const r = await enviar(cola[0]);
+        if (r === null || OCUPADO.has(r.status)) {
+          // Servidor ocupado o sin conexión: se reintenta el mismo envío (el orden se mantiene)
+          const espera = REINTENTOS_MS[Math.min(intentos++, REINTENTOS_MS.length - 1)];
+          setTimeout(procesarCola, espera);
+          return;
+        }
+        intentos = 0;
+        let datos = {};
+        try {
+          datos = await r.json();
+        } catch (e) {
+          datos = {error: `Error ${r.status} al registrar`};
+        }
+        if (r.ok) {
+          mostrarMensaje(datos.mensaje, "success");
+          if (datos.resumen) mostrarTotales(datos.resumen);
+        } else {
+          mostrarMensaje(datos.error || `Error ${r.status} al registrar`, "danger");
+        }
+        cola = leerCola();
+        cola.shift();
+        guardarCola(cola);
+      }
+    } finally {
+      enviando = false;
+    }
+  }
+
+  async function cargarTotales(url) {
+    try {
+      const r = await fetch(url, {cache: "no-store"});
+      if (r.ok) mostrarTotales(await r.json());
+    } catch (e) {
+      // Sin conexión: se muestran con el próximo registro
+    }
+  }
+
+  document.addEventListener("DOMContentLoaded", () => {
+    const panel = document.getElementById("envio-rapido");
+    if (panel && panel.dataset.resumen) cargarTotales(panel.dataset.resumen);
+
+    document.querySelectorAll("form[data-api]").forEach(form => {
+      form.addEventListener("submit", evento => {
+        evento.preventDefault();
+        const cola = leerCola();
+        const datos = new URLSearchParams(new FormData(form));
+        datos.set("id_envio", nuevoId());
+        cola.push({url: form.dataset.api, datos: datos.toString()});
+        guardarCola(cola);
+        form.reset();
+        form.dispatchEvent(new Event("alta-enviada"));
+        const primero = form.querySelector("input:not([type=hidden]), select, textarea");
+        if (primero) primero.focus();
+        procesarCola();
+      });
+    });
+
+    // Lo que quedó en cola antes de recargar la pestaña (los encolados sin id_envio reciben uno)
+    guardarCola(leerCola().map(envio => {
+      const datos = new URLSearchParams(envio.datos);
+      if (!datos.has("id_envio")) datos.set("id_envio", nuevoId());
+      return {url: envio.url, datos: datos.toString()};
+    }));
+    procesarCola();
+  });
+})();
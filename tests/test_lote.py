@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from esquema import EsquemaArchivo
+from repositorio import crear_repositorio
+
+
+def _libro(tipo, carpeta):
+    ruta_excel = os.path.join(carpeta, "caja.xlsx")
+    libro = crear_repositorio(tipo, ruta_excel, ruta_diario=os.path.join(carpeta, "caja.diario.jsonl"),
+                              ruta_sqlite=os.path.join(carpeta, "caja.sqlite3"),
+                              inicializar=EsquemaArchivo(ruta_excel).asegurar)
+    libro.cargar()
+    return libro
+
+
+def _diario(libro):
+    ruta = getattr(getattr(libro, "diario", None), "ruta", None)
+    if ruta is None or not os.path.exists(ruta):
+        return None
+    with open(ruta, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("tipo", ["xlsx", "sqlite"])
+def test_lote_con_error_no_deja_nada(tipo, tmp_path):
+    libro = _libro(tipo, str(tmp_path))
+    libro.agregar("planilla egresos", ["gas", 500])
+    filas, diario, agregados = libro.filas("planilla egresos"), _diario(libro), libro.agregados().a_dict()
+
+    with pytest.raises(RuntimeError):
+        with libro.lote():
+            libro.agregar("planilla egresos", ["luz", 700])
+            libro.eliminar("planilla egresos", 2)
+            libro.fijar_parametros({"cajero": "Ana"})
+            raise RuntimeError("falla a mitad del lote")
+
+    assert libro.filas("planilla egresos") == filas
+    assert libro.parametro("cajero") is None
+    assert libro.agregados().a_dict() == agregados
+    assert _diario(libro) == diario
+    # Un proceso que carga desde disco ve lo mismo
+    assert _libro(tipo, str(tmp_path)).filas("planilla egresos") == filas
+
+    libro.agregar("planilla egresos", ["agua", 300])
+    assert len(libro.filas("planilla egresos")) == 2